@@ -1,16 +1,32 @@
 import io
+import math
+import os
 import socket
 import ssl
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
 from datetime import datetime
+from urllib.parse import urlsplit
 
 import pycurl
 import requests
 import tldextract
-from bs4 import BeautifulSoup
 from fpdf import FPDF
 
+from batch import url_host
+from curl_engine import curl_engine
+from deadline import Deadline
+from dns_cache import cached_session, dns_cache
+from geo_cache import GEO_OFFLINE, geo_cache
+from html_resources import extract_resources
+from http_pool import get_session, pooled_curl
+from metrics import StageTimer
+from politeness import HostBusy, scheduler
+from resource_cache import resource_cache
+from stats import difference_ci, mean_ci, summarize
+from tls_cache import cert_fingerprint, not_after, pem_fingerprint, tls_cache
+
 # Try to import optional libraries
 try:
     import pycurl
@@ -34,6 +50,8 @@ except ImportError:
 def detect_http_version(response):
     """Detect HTTP protocol version"""
     try:
+        if getattr(response, "http_version", None):
+            return response.http_version
         version_map = {10: "HTTP/1.0", 11: "HTTP/1.1", 20: "HTTP/2.0"}
         if hasattr(response, "raw") and hasattr(response.raw, "version"):
             return version_map.get(response.raw.version, "Unknown")
@@ -76,41 +94,94 @@ def detect_cdn(headers, hostname):
     return "None detected"
 
 
-def check_compression(url):
-    """Check compression type and effectiveness"""
-    try:
-        headers = {"Accept-Encoding": "gzip, deflate, br"}
-        resp = requests.get(url, headers=headers, timeout=10, stream=True)
-        encoding = resp.headers.get("Content-Encoding", "none")
-        return encoding if encoding != "none" else "None"
-    except Exception as e:
-        return "Unknown"
-
-
-def advanced_dns_lookup(hostname):
-    """Perform DNS lookup with multiple resolvers"""
+def check_compression(headers):
+    """Report the Content-Encoding the server chose for the main response"""
+    encoding = headers.get("Content-Encoding", "none")
+    return encoding if encoding != "none" else "None"
+
+
+def parse_resolvers(spec):
+    """Parse "addr[:port]=Name,..." into [(name, addr, port)]"""
+    resolvers = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        address, _, name = entry.partition("=")
+        address = address.strip()
+        port = 53
+        if address.startswith("["):
+            host, _, rest = address[1:].partition("]")
+            if rest.startswith(":"):
+                port = int(rest[1:])
+            address = host
+        elif address.count(":") == 1:
+            address, port = address.split(":")
+            port = int(port)
+        resolvers.append((name.strip() or address, address, port))
+    return resolvers
+
+
+# Resolvers benchmarked by advanced_dns_lookup; point at a stub server with "127.0.0.1:5353=Stub"
+DNS_RESOLVERS = parse_resolvers(
+    os.environ.get(
+        "ANALYZER_DNS_RESOLVERS",
+        "8.8.8.8=Google DNS,1.1.1.1=Cloudflare DNS,208.67.222.222=OpenDNS",
+    )
+)
+DNS_BENCH_SAMPLES = int(os.environ.get("ANALYZER_DNS_BENCH_SAMPLES", "3"))
+# Wall-clock budget for the whole benchmark, however many resolvers are slow
+DNS_BENCH_DEADLINE = float(os.environ.get("ANALYZER_DNS_BENCH_DEADLINE", "5"))
+
+
+def advanced_dns_lookup(hostname, resolvers=None, samples=None, deadline=None):
+    """Benchmark DNS resolvers concurrently, several queries each.
+
+    Returns {name: {"min", "median", "p95", "max", "samples", "errors"}}, or
+    None for a resolver that never answered before the deadline.
+    """
     if not has_dnspython:
         return None
 
-    resolvers = {
-        "8.8.8.8": "Google DNS",
-        "1.1.1.1": "Cloudflare DNS",
-        "208.67.222.222": "OpenDNS",
-    }
-    results = {}
+    resolvers = DNS_RESOLVERS if resolvers is None else resolvers
+    samples = samples or DNS_BENCH_SAMPLES
+    deadline = deadline or DNS_BENCH_DEADLINE
+    if not resolvers:
+        return {}
+    stop_at = time.monotonic() + deadline
+    timings = {name: [] for name, _, _ in resolvers}
+    errors = {name: 0 for name, _, _ in resolvers}
+
+    def probe(name, address, port):
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = [address]
+        resolver.port = port
+        for _ in range(samples):
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                return
+            resolver.timeout = resolver.lifetime = remaining
+            start = time.perf_counter()
+            try:
+                resolver.resolve(hostname, "A")
+                timings[name].append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors[name] += 1
 
-    for dns_server, name in resolvers.items():
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [dns_server]
-        resolver.timeout = 5
-        resolver.lifetime = 5
-        start = time.time()
-        try:
-            resolver.resolve(hostname, "A")
-            results[name] = round((time.time() - start) * 1000, 2)
-        except:
-            results[name] = None
+    ex = ThreadPoolExecutor(max_workers=len(resolvers))
+    try:
+        futures = [ex.submit(probe, *resolver) for resolver in resolvers]
+        wait(futures, timeout=deadline)
+    finally:
+        ex.shutdown(wait=False)
 
+    results = {}
+    for name in timings:
+        summary = summarize(list(timings[name]))
+        if summary:
+            summary["samples"] = len(timings[name])
+            summary["errors"] = errors[name]
+        results[name] = summary
     return results
 
 
@@ -142,33 +213,154 @@ def security_headers_score(headers):
     return {"score": score, "present": present, "missing": missing}
 
 
-def check_connection_reuse(url):
-    """Check if connection reuse is working (Keep-Alive)"""
-    try:
-        session = requests.Session()
-        times = []
-        for i in range(3):
-            start = time.time()
-            session.get(url, timeout=10)
-            times.append((time.time() - start) * 1000)
+# Connection reuse benchmark: cold and warm requests per run (each), and how
+# they avoid body transfer ("head", or "range" for a one-byte GET)
+REUSE_SAMPLES = int(os.environ.get("ANALYZER_REUSE_SAMPLES", "5"))
+REUSE_METHOD = os.environ.get("ANALYZER_REUSE_METHOD", "head")
 
-        benefit = round(times[0] - sum(times[1:]) / 2, 2)
-        return {
-            "first_request": round(times[0], 2),
-            "subsequent_avg": round(sum(times[1:]) / 2, 2),
-            "benefit": benefit if benefit > 0 else 0,
-        }
-    except:
+
+def reuse_report(method, cold, warm):
+    """Connection reuse result from (connect_ms, ttfb_ms, reused) samples.
+
+    benefit is the mean cold TTFB minus the mean warm one; it is only
+    reported when warm requests really reused their connection.
+    """
+    if not cold or not warm:
         return None
 
+    def distribution(values):
+        values = [v for v in values if v is not None]
+        summary = summarize(values)
+        if summary:
+            summary.update(mean_ci(values))
+            summary["samples"] = len(values)
+        return summary
+
+    cold_ttfb = [sample[1] for sample in cold]
+    warm_ttfb = [sample[1] for sample in warm]
+    reused = sum(1 for sample in warm if sample[2])
+    first = sum(cold_ttfb) / len(cold_ttfb)
+    subsequent = sum(warm_ttfb) / len(warm_ttfb)
+    benefit_ci = difference_ci(cold_ttfb, warm_ttfb)
+    return {
+        "method": method,
+        "reused": reused,
+        "cold": {"connect": distribution([s[0] for s in cold]), "ttfb": distribution(cold_ttfb)},
+        "warm": {"connect": distribution([s[0] for s in warm]), "ttfb": distribution(warm_ttfb)},
+        "first_request": round(first, 2),
+        "subsequent_avg": round(subsequent, 2),
+        "benefit": round(max(0, first - subsequent), 2) if reused else 0,
+        "benefit_ci95": benefit_ci,
+        "significant": bool(reused and benefit_ci and benefit_ci[0] > 0),
+    }
+
+
+def _reuse_sample(c, url, method, timeout):
+    """One benchmark request on curl handle c: (connect_ms, ttfb_ms, reused), status"""
+    parts = urlsplit(url)
+    ip = dns_cache.resolve(parts.hostname)
+    c.setopt(pycurl.URL, url)
+    if ip and ip != parts.hostname:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        c.setopt(pycurl.RESOLVE, [f"{parts.hostname}:{port}:{ip}"])
+    if method == "head":
+        c.setopt(pycurl.NOBODY, True)
+    else:
+        c.setopt(pycurl.NOBODY, False)
+        c.setopt(pycurl.HTTPGET, True)
+        c.setopt(pycurl.RANGE, "0-0")
+    c.setopt(pycurl.WRITEFUNCTION, lambda data: None)
+    c.setopt(pycurl.NOPROGRESS, True)
+    c.setopt(pycurl.CONNECTTIMEOUT_MS, max(1, int(timeout * 1000)))
+    c.setopt(pycurl.TIMEOUT_MS, max(1, int(timeout * 1000)))
+    c.perform()
+    # Microsecond timers from the start of the request; both are 0 on a reused connection
+    connect = c.getinfo(pycurl.APPCONNECT_TIME_T) or c.getinfo(pycurl.CONNECT_TIME_T)
+    ttfb = c.getinfo(pycurl.STARTTRANSFER_TIME_T)
+    reused = c.getinfo(pycurl.NUM_CONNECTS) == 0
+    return (connect / 1000, ttfb / 1000, reused), c.getinfo(pycurl.RESPONSE_CODE)
+
+
+def _reuse_sample_requests(session, url, method, timeout):
+    """_reuse_sample without pycurl: TTFB only, from perf_counter_ns"""
+    start = time.perf_counter_ns()
+    if method == "head":
+        resp = session.head(url, timeout=timeout, allow_redirects=False)
+    else:
+        resp = session.get(url, timeout=timeout, headers={"Range": "bytes=0-0"}, allow_redirects=False)
+    ttfb = (time.perf_counter_ns() - start) / 1e6
+    return (None, ttfb, None), resp.status_code
+
 
-def get_server_location(ip):
-    """Get geographic location of server"""
+def check_connection_reuse(url, timeout=10, samples=REUSE_SAMPLES, deadline=None):
+    """Benchmark Keep-Alive: cold (new connection) vs warm (reused) requests.
+
+    Cold and warm requests alternate so drift hits both sides alike; HEAD
+    (or a one-byte range) keeps bodies off the wire. Returns reuse_report().
+    """
+    deadline = deadline or Deadline(None)
+    method = "range" if REUSE_METHOD == "range" else "head"
+    host = url_host(url)
+    cold, warm = [], []
     try:
-        resp = requests.get(f"http://ip-api.com/json/{ip}", timeout=5)
+        with scheduler.slot(host, timeout=timeout):
+            if has_pycurl:
+                # A private handle keeps its own connection: its first request is cold
+                keep_alive = pycurl.Curl()
+
+                def cold_sample():
+                    with pooled_curl() as c:
+                        return _reuse_sample(c, url, method, deadline.timeout(timeout))
+
+                def warm_sample():
+                    return _reuse_sample(keep_alive, url, method, deadline.timeout(timeout))
+            else:
+                keep_alive = cached_session()
+
+                def cold_sample():
+                    with cached_session() as session:
+                        return _reuse_sample_requests(session, url, method, deadline.timeout(timeout))
+
+                def warm_sample():
+                    return _reuse_sample_requests(keep_alive, url, method, deadline.timeout(timeout))
+
+            try:
+                sample, status = warm_sample()
+                if method == "head" and status in (405, 501):
+                    # The refused HEAD already opened the keep-alive connection
+                    method = "range"
+                    sample, status = cold_sample()
+                scheduler.report(host, status, None)
+                cold.append(sample)
+                for i in range(samples):
+                    if deadline.expired:
+                        break
+                    warm.append(warm_sample()[0])
+                    if i < samples - 1 and not deadline.expired:
+                        cold.append(cold_sample()[0])
+            finally:
+                keep_alive.close()
+    except Exception:
+        pass
+    return reuse_report(method.upper() if method == "head" else "GET range", cold, warm)
+
+
+def get_server_location(ip, timeout=5):
+    """Get geographic location of server (cache and local GeoIP database first)"""
+    location = geo_cache.lookup(ip)
+    if location is not None:
+        return location
+    if GEO_OFFLINE:
+        return "Unknown"
+    try:
+        with scheduler.slot("ip-api.com", timeout=timeout):
+            resp = get_session().get(f"http://ip-api.com/json/{ip}", timeout=timeout)
+        scheduler.report("ip-api.com", resp.status_code, resp.headers)
         data = resp.json()
         if data.get("status") == "success":
-            return f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+            location = f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+            geo_cache.store(ip, location)
+            return location
     except:
         pass
     return "Unknown"
@@ -179,8 +371,8 @@ def get_server_location(ip):
 # -----------------------
 
 
-def check_ssl_security(hostname, port=443, timeout=10):
-    """Check SSL/TLS certificate details and calculate a security score"""
+def score_ssl(cert, cipher, version):
+    """Build SSL result fields and security score from handshake details"""
     result = {
         "ssl_valid": 0,
         "ssl_days_remaining": None,
@@ -191,97 +383,182 @@ def check_ssl_security(hostname, port=443, timeout=10):
         "ssl_score_breakdown": {},
     }
 
+    if cert:
+        not_after = cert.get("notAfter")
+        if not_after:
+            expiry_date = datetime.strptime(not_after, "%b %d %H:%M:%S %Y %Z")
+            days_remaining = (expiry_date - datetime.now()).days
+            result["ssl_days_remaining"] = days_remaining
+            result["ssl_valid"] = 1 if days_remaining > 0 else 0
+
+        issuer = cert.get("issuer")
+        if issuer:
+            issuer_cn = dict(x[0] for x in issuer).get("commonName", "Unknown")
+            result["ssl_issuer"] = issuer_cn[:50]
+
+    result["ssl_version"] = version
+    if cipher:
+        result["ssl_cipher"] = cipher[0][:50]
+
+    score = 0
+    breakdown = {}
+
+    if result["ssl_valid"] == 1:
+        score += 40
+        breakdown["Valid Certificate"] = 40
+    else:
+        breakdown["Valid Certificate"] = 0
+
+    if result["ssl_days_remaining"]:
+        if result["ssl_days_remaining"] > 90:
+            score += 30
+            breakdown["Certificate Expiry (>90 days)"] = 30
+        elif result["ssl_days_remaining"] > 30:
+            score += 20
+            breakdown["Certificate Expiry (30-90 days)"] = 20
+        elif result["ssl_days_remaining"] > 0:
+            score += 10
+            breakdown["Certificate Expiry (<30 days)"] = 10
+        else:
+            breakdown["Certificate Expiry (Expired)"] = 0
+    else:
+        breakdown["Certificate Expiry"] = 0
+
+    if version:
+        if version in ["TLSv1.3"]:
+            score += 20
+            breakdown["TLS Version (1.3)"] = 20
+        elif version in ["TLSv1.2"]:
+            score += 15
+            breakdown["TLS Version (1.2)"] = 15
+        elif version in ["TLSv1.1"]:
+            score += 5
+            breakdown["TLS Version (1.1)"] = 5
+        else:
+            breakdown[f"TLS Version ({version})"] = 0
+    else:
+        breakdown["TLS Version"] = 0
+
+    if cipher and cipher[0]:
+        cipher_name = cipher[0].upper()
+        if (
+            "AES_256" in cipher_name
+            or "AES256" in cipher_name
+            or "CHACHA20" in cipher_name
+        ):
+            score += 10
+            breakdown["Cipher Strength (Strong)"] = 10
+        elif "AES_128" in cipher_name or "AES128" in cipher_name:
+            score += 7
+            breakdown["Cipher Strength (Good)"] = 7
+        elif "AES" in cipher_name:
+            score += 5
+            breakdown["Cipher Strength (Moderate)"] = 5
+        else:
+            breakdown["Cipher Strength (Weak)"] = 0
+    else:
+        breakdown["Cipher Strength"] = 0
+
+    result["ssl_score"] = min(score, 100)
+    result["ssl_score_breakdown"] = breakdown
+
+    return result
+
+
+def tls_handshake(hostname, address, port, context, timeout, session=None, collect_session=False):
+    """Connect and complete one TLS handshake, returning (handshake_ms, peer details).
+
+    With collect_session, one request/response round trip follows the
+    handshake: TLS 1.3 servers only send session tickets after it.
+    """
+    with socket.create_connection((address, port), timeout=timeout) as sock:
+        start = time.perf_counter()
+        with context.wrap_socket(sock, server_hostname=hostname, session=session) as ssock:
+            handshake_ms = (time.perf_counter() - start) * 1000
+            peer = {
+                "cert": ssock.getpeercert(),
+                "fingerprint": cert_fingerprint(ssock.getpeercert(binary_form=True)),
+                "cipher": ssock.cipher(),
+                "version": ssock.version(),
+                "reused": ssock.session_reused,
+                "session": None,
+            }
+            if collect_session:
+                try:
+                    ssock.sendall(f"HEAD / HTTP/1.1\r\nHost: {hostname}\r\nConnection: close\r\n\r\n".encode())
+                    ssock.recv(1)
+                except OSError:
+                    pass
+                peer["session"] = ssock.session
+    return handshake_ms, peer
+
+
+def measure_tls_resumption(hostname, address, port, context, full_ms, session, timeout=10):
+    """Time a handshake resuming session against a full one that took full_ms"""
+    if session is None:
+        return {"full_handshake_ms": round(full_ms, 2), "resumed_handshake_ms": None, "resumed": False,
+                "benefit_ms": 0}
     try:
-        context = ssl.create_default_context()
-        with socket.create_connection((hostname, port), timeout=timeout) as sock:
-            with context.wrap_socket(sock, server_hostname=hostname) as ssock:
-                cert = ssock.getpeercert()
-                cipher = ssock.cipher()
-                version = ssock.version()
-
-                if cert:
-                    not_after = cert.get("notAfter")
-                    if not_after:
-                        expiry_date = datetime.strptime(
-                            not_after, "%b %d %H:%M:%S %Y %Z"
-                        )
-                        days_remaining = (expiry_date - datetime.now()).days
-                        result["ssl_days_remaining"] = days_remaining
-                        result["ssl_valid"] = 1 if days_remaining > 0 else 0
-
-                    issuer = cert.get("issuer")
-                    if issuer:
-                        issuer_cn = dict(x[0] for x in issuer).get(
-                            "commonName", "Unknown"
-                        )
-                        result["ssl_issuer"] = issuer_cn[:50]
-
-                result["ssl_version"] = version
-                if cipher:
-                    result["ssl_cipher"] = cipher[0][:50]
-
-                score = 0
-                breakdown = {}
-
-                if result["ssl_valid"] == 1:
-                    score += 40
-                    breakdown["Valid Certificate"] = 40
-                else:
-                    breakdown["Valid Certificate"] = 0
-
-                if result["ssl_days_remaining"]:
-                    if result["ssl_days_remaining"] > 90:
-                        score += 30
-                        breakdown["Certificate Expiry (>90 days)"] = 30
-                    elif result["ssl_days_remaining"] > 30:
-                        score += 20
-                        breakdown["Certificate Expiry (30-90 days)"] = 20
-                    elif result["ssl_days_remaining"] > 0:
-                        score += 10
-                        breakdown["Certificate Expiry (<30 days)"] = 10
-                    else:
-                        breakdown["Certificate Expiry (Expired)"] = 0
-                else:
-                    breakdown["Certificate Expiry"] = 0
-
-                if version:
-                    if version in ["TLSv1.3"]:
-                        score += 20
-                        breakdown["TLS Version (1.3)"] = 20
-                    elif version in ["TLSv1.2"]:
-                        score += 15
-                        breakdown["TLS Version (1.2)"] = 15
-                    elif version in ["TLSv1.1"]:
-                        score += 5
-                        breakdown["TLS Version (1.1)"] = 5
-                    else:
-                        breakdown[f"TLS Version ({version})"] = 0
-                else:
-                    breakdown["TLS Version"] = 0
-
-                if cipher and cipher[0]:
-                    cipher_name = cipher[0].upper()
-                    if (
-                        "AES_256" in cipher_name
-                        or "AES256" in cipher_name
-                        or "CHACHA20" in cipher_name
-                    ):
-                        score += 10
-                        breakdown["Cipher Strength (Strong)"] = 10
-                    elif "AES_128" in cipher_name or "AES128" in cipher_name:
-                        score += 7
-                        breakdown["Cipher Strength (Good)"] = 7
-                    elif "AES" in cipher_name:
-                        score += 5
-                        breakdown["Cipher Strength (Moderate)"] = 5
-                    else:
-                        breakdown["Cipher Strength (Weak)"] = 0
-                else:
-                    breakdown["Cipher Strength"] = 0
-
-                result["ssl_score"] = min(score, 100)
-                result["ssl_score_breakdown"] = breakdown
+        resumed_ms, peer = tls_handshake(hostname, address, port, context, timeout, session=session)
+    except Exception:
+        return None
+    return {
+        "full_handshake_ms": round(full_ms, 2),
+        "resumed_handshake_ms": round(resumed_ms, 2),
+        "resumed": peer["reused"],
+        "benefit_ms": round(max(0, full_ms - resumed_ms), 2) if peer["reused"] else 0,
+    }
+
+
+def probe_tls_resumption(hostname, address, port=443, timeout=10):
+    """Full handshake followed by a resumed one on the same context"""
+    context = ssl.create_default_context()
+    with scheduler.slot(hostname, timeout=timeout):
+        full_ms, peer = tls_handshake(hostname, address, port, context, timeout, collect_session=True)
+        return measure_tls_resumption(hostname, address, port, context, full_ms, peer["session"], timeout)
+
+
+def check_ssl_security(hostname, port=443, timeout=10, fingerprint=None, measure_resumption=False):
+    """Check SSL/TLS certificate details and calculate a security score.
 
+    Results are cached per certificate: pass the fingerprint the main fetch
+    saw to reuse them without another handshake. measure_resumption adds
+    tls_resumption, the full vs resumed handshake times; these are measured
+    on every call, cached or not.
+    """
+    cached = tls_cache.get(hostname, port, fingerprint)
+    if cached is not None:
+        if measure_resumption:
+            try:
+                address = dns_cache.resolve(hostname) or hostname
+                cached["tls_resumption"] = probe_tls_resumption(hostname, address, port, timeout)
+            except Exception:
+                cached["tls_resumption"] = None
+        return cached
+
+    result = {
+        "ssl_valid": 0,
+        "ssl_days_remaining": None,
+        "ssl_issuer": None,
+        "ssl_version": None,
+        "ssl_cipher": None,
+        "ssl_score": 0,
+        "ssl_score_breakdown": {},
+    }
+
+    try:
+        context = ssl.create_default_context()
+        address = dns_cache.resolve(hostname) or hostname
+        with scheduler.slot(hostname, timeout=timeout):
+            full_ms, peer = tls_handshake(
+                hostname, address, port, context, timeout, collect_session=measure_resumption
+            )
+            if measure_resumption:
+                result["tls_resumption"] = measure_tls_resumption(
+                    hostname, address, port, context, full_ms, peer["session"], timeout
+                )
+        result.update(score_ssl(peer["cert"], peer["cipher"], peer["version"]))
+        tls_cache.store(hostname, port, peer["fingerprint"], result, not_after(peer["cert"]))
     except Exception as e:
         result["ssl_score"] = 0
         result["ssl_valid"] = 0
@@ -290,61 +567,219 @@ def check_ssl_security(hostname, port=443, timeout=10):
     return result
 
 
+# getaddrinfo has no timeout of its own; lookups run on these workers so the
+# caller can stop waiting. A lookup given up on still holds its worker until
+# the system resolver returns.
+DNS_WORKERS = int(os.environ.get("ANALYZER_DNS_WORKERS", "16"))
+dns_executor = ThreadPoolExecutor(max_workers=DNS_WORKERS, thread_name_prefix="dns")
+
+
 def measure_dns(hostname, timeout=5.0):
+    """Time a cold system lookup; the answer then seeds the shared DNS cache"""
     start = time.time()
     try:
-        socket.setdefaulttimeout(timeout)
-        socket.getaddrinfo(hostname, None)
+        infos = dns_executor.submit(socket.getaddrinfo, hostname, None).result(timeout=timeout)
         dns_ms = (time.time() - start) * 1000
-        try:
-            ip = socket.gethostbyname(hostname)
-        except Exception:
-            ip = None
+        ip = next((info[4][0] for info in infos if info[0] == socket.AF_INET), None)
     except Exception:
         dns_ms = None
         ip = None
+    dns_cache.seed(hostname, ip)
     return dns_ms, ip
 
 
-def measure_with_pycurl(url, timeout=30):
-    buffer = io.BytesIO()
-    c = pycurl.Curl()
-    c.setopt(pycurl.URL, url)
-    c.setopt(pycurl.WRITEDATA, buffer)
-    c.setopt(pycurl.NOPROGRESS, True)
-    c.setopt(pycurl.FOLLOWLOCATION, True)
-    c.setopt(pycurl.CONNECTTIMEOUT, int(timeout))
-    c.setopt(pycurl.TIMEOUT, int(timeout))
+class FetchedResponse:
+    """Main page response captured during the timed fetch.
+
+    Exposes the parts of requests.Response the detectors use (status_code,
+    headers, content, text, url) so one transfer feeds every stage.
+    """
+
+    def __init__(self, url, status_code, headers, content, http_version=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.http_version = http_version
+
+    def __bool__(self):
+        # Same truthiness as requests.Response: only successful responses
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        encoding = requests.utils.get_encoding_from_headers(self.headers) or "utf-8"
+        try:
+            return self.content.decode(encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+
+CURL_HTTP_VERSIONS = {
+    pycurl.CURL_HTTP_VERSION_1_0: "HTTP/1.0",
+    pycurl.CURL_HTTP_VERSION_1_1: "HTTP/1.1",
+    pycurl.CURL_HTTP_VERSION_2_0: "HTTP/2.0",
+    pycurl.CURL_HTTP_VERSION_3: "HTTP/3",
+}
+
+# "multi" runs timed fetches on the shared CurlMulti engine, "easy" blocks a
+# thread per transfer
+CURL_ENGINE = os.environ.get("ANALYZER_CURL_ENGINE", "multi")
+# Seconds past a transfer's own timeout before its caller stops waiting on the engine
+CURL_WAIT_MARGIN = 5.0
+
+
+def leaf_fingerprint(c):
+    """Fingerprint of the server certificate from a transfer made with OPT_CERTINFO"""
     try:
-        c.perform()
+        chain = c.getinfo(pycurl.INFO_CERTINFO)
     except pycurl.error:
-        c.close()
         return None
-    connect_time = c.getinfo(pycurl.CONNECT_TIME) * 1000
-    appconnect_time = c.getinfo(pycurl.APPCONNECT_TIME) * 1000
-    starttransfer_time = c.getinfo(pycurl.STARTTRANSFER_TIME) * 1000
-    total_time = c.getinfo(pycurl.TOTAL_TIME) * 1000
-    http_code = c.getinfo(pycurl.RESPONSE_CODE)
-    size_download = c.getinfo(pycurl.SIZE_DOWNLOAD) / 1024
-    c.close()
-    return {
-        "tcp": round(connect_time, 2),
-        "ssl": round(appconnect_time, 2),
-        "ttfb": round(starttransfer_time, 2),
-        "total": round(total_time, 2),
-        "status_code": http_code,
-        "size_kb": round(size_download, 2),
-    }
+    if not chain:
+        return None
+    return pem_fingerprint(dict(chain[0]).get("Cert"))
+
+
+def _timed_transfer(url, timeout, deadline=None):
+    """Return (setup, collect) for one timed curl transfer of url.
+
+    The host is resolved here, on the caller's thread, so setup never blocks.
+    A cancelled deadline aborts the transfer from libcurl's progress callback.
+    """
+    buffer = io.BytesIO()
+    headers = requests.structures.CaseInsensitiveDict()
+    parts = urlsplit(url)
+    ip = dns_cache.resolve(parts.hostname)
+
+    def header_line(line):
+        line = line.decode("iso-8859-1").strip()
+        if line.startswith("HTTP/"):
+            # New response (redirect hop); keep only the final one's headers
+            headers.clear()
+        elif ":" in line:
+            name, value = line.split(":", 1)
+            name, value = name.strip(), value.strip()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+    def setup(c):
+        c.setopt(pycurl.URL, url)
+        # Pin the host to the cached address so libcurl skips its own lookup
+        if ip and ip != parts.hostname:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            c.setopt(pycurl.RESOLVE, [f"{parts.hostname}:{port}:{ip}"])
+        c.setopt(pycurl.WRITEDATA, buffer)
+        c.setopt(pycurl.HEADERFUNCTION, header_line)
+        if deadline is None:
+            c.setopt(pycurl.NOPROGRESS, True)
+        else:
+            c.setopt(pycurl.NOPROGRESS, False)
+            c.setopt(pycurl.XFERINFOFUNCTION, lambda *progress: 1 if deadline.cancelled else 0)
+        c.setopt(pycurl.FOLLOWLOCATION, True)
+        if parts.scheme == "https":
+            # Keep the peer certificate so the SSL check can reuse this handshake
+            c.setopt(pycurl.OPT_CERTINFO, True)
+        # Advertise every encoding libcurl can decode; SIZE_DOWNLOAD stays the wire size
+        c.setopt(pycurl.ACCEPT_ENCODING, "")
+        # Millisecond timeouts, at least 1 (0 would mean no timeout at all)
+        c.setopt(pycurl.CONNECTTIMEOUT_MS, max(1, int(timeout * 1000)))
+        c.setopt(pycurl.TIMEOUT_MS, max(1, int(timeout * 1000)))
+
+    def collect(c):
+        # Phase times from the end of name resolution; the caller adds its own DNS measurement
+        lookup_time = c.getinfo(pycurl.NAMELOOKUP_TIME) * 1000
+        connect_time = c.getinfo(pycurl.CONNECT_TIME) * 1000 - lookup_time
+        appconnect_time = c.getinfo(pycurl.APPCONNECT_TIME) * 1000
+        appconnect_time = appconnect_time - lookup_time if appconnect_time else 0.0
+        starttransfer_time = c.getinfo(pycurl.STARTTRANSFER_TIME) * 1000 - lookup_time
+        total_time = c.getinfo(pycurl.TOTAL_TIME) * 1000 - lookup_time
+        http_code = c.getinfo(pycurl.RESPONSE_CODE)
+        size_download = c.getinfo(pycurl.SIZE_DOWNLOAD) / 1024
+        http_version = CURL_HTTP_VERSIONS.get(c.getinfo(pycurl.INFO_HTTP_VERSION), "Unknown")
+        effective_url = c.getinfo(pycurl.EFFECTIVE_URL)
+        return {
+            "cert_fingerprint": leaf_fingerprint(c) if parts.scheme == "https" else None,
+            "tcp": round(connect_time, 2),
+            "ssl": round(appconnect_time, 2),
+            "ttfb": round(starttransfer_time, 2),
+            "total": round(total_time, 2),
+            "status_code": http_code,
+            "size_kb": round(size_download, 2),
+            "response": FetchedResponse(
+                effective_url, http_code, headers, buffer.getvalue(), http_version
+            ),
+        }
+
+    return setup, collect
+
+
+def measure_with_pycurl(url, timeout=30, deadline=None):
+    """Timed fetch of url; None if the transfer fails"""
+    if CURL_ENGINE == "multi":
+        return measure_many_with_pycurl([url], timeout, deadline)[0]
+
+    setup, collect = _timed_transfer(url, timeout, deadline)
+    host = url_host(url)
+    try:
+        with scheduler.slot(host, timeout=timeout), pooled_curl() as c:
+            setup(c)
+            c.perform()
+            result = collect(c)
+    except (pycurl.error, HostBusy):
+        return None
+    scheduler.report(host, result["status_code"], result["response"].headers)
+    return result
+
+
+def measure_many_with_pycurl(urls, timeout=30, deadline=None):
+    """Timed fetches of many URLs at once on the shared CurlMulti engine.
+
+    Returns one measure_with_pycurl-style result (or None) per URL, in order.
+    """
+    def submit(url):
+        host = url_host(url)
+        try:
+            scheduler.acquire(host, timeout)
+        except HostBusy:
+            return None
+        future = curl_engine.submit(url, *_timed_transfer(url, timeout, deadline))
+        future.add_done_callback(lambda f: done(host, f))
+        return future
+
+    def done(host, future):
+        scheduler.release(host)
+        if not future.cancelled() and future.exception() is None:
+            result = future.result()
+            scheduler.report(host, result["status_code"], result["response"].headers)
+
+    futures = [submit(url) for url in urls]
+    results = []
+    for future in futures:
+        if future is None:
+            results.append(None)
+            continue
+        # libcurl enforces the timeout itself; the margin only covers a wedged engine
+        wait_for = (deadline.timeout(timeout) if deadline is not None else timeout) + CURL_WAIT_MARGIN
+        try:
+            results.append(future.result(timeout=wait_for))
+        except FuturesTimeout:
+            curl_engine.cancel(future)
+            results.append(None)
+        except pycurl.error:
+            results.append(None)
+    return results
 
 
 def measure_with_requests(url, timeout=30):
     try:
-        session = requests.Session()
-        start = time.time()
-        resp = session.get(url, timeout=timeout, stream=True)
-        ttfb = (time.time() - start) * 1000
-        content = resp.content
-        total_time = (time.time() - start) * 1000
+        # Timed fetch: a fresh session so the connection setup is included
+        host = url_host(url)
+        with cached_session() as session, scheduler.slot(host, timeout=timeout):
+            start = time.time()
+            resp = session.get(url, timeout=timeout, stream=True)
+            ttfb = (time.time() - start) * 1000
+            content = resp.content
+            total_time = (time.time() - start) * 1000
+        scheduler.report(host, resp.status_code, resp.headers)
         size_kb = len(content) / 1024
         return {
             "tcp": None,
@@ -353,82 +788,152 @@ def measure_with_requests(url, timeout=30):
             "total": round(total_time, 2),
             "status_code": resp.status_code,
             "size_kb": round(size_kb, 2),
+            "response": resp,
         }
     except Exception as e:
         return None
 
 
-def resource_breakdown(base_url, html_text, timeout=5, max_resources=30):
-    """Parse HTML, find images/scripts/css and try HEAD to get sizes"""
-    soup = BeautifulSoup(html_text, "html.parser")
+# Resource size probes from every page being analyzed share these workers
+RESOURCE_WORKERS = int(os.environ.get("ANALYZER_RESOURCE_WORKERS", "32"))
+resource_executor = ThreadPoolExecutor(max_workers=RESOURCE_WORKERS, thread_name_prefix="resources")
 
-    imgs = [img.get("src") for img in soup.find_all("img") if img.get("src")]
-    scripts = [s.get("src") for s in soup.find_all("script") if s.get("src")]
-    links = [
-        l.get("href")
-        for l in soup.find_all("link", rel=lambda x: x and "stylesheet" in x)
-    ]
+
+def find_resources(html, max_resources=None, encoding=None):
+    """Return image, script and stylesheet URLs as they appear, up to max_resources each"""
+    return extract_resources(html, max_resources, encoding)
+
+
+def resource_breakdown(base_url, html, timeout=5, max_resources=30, encoding=None, deadline=None):
+    """Scan HTML (str or bytes) for images/scripts/css and try HEAD to get sizes.
+
+    html is the body the timed fetch already read in full, for its size and
+    total time; stopping once max_resources of each kind are found only
+    saves parsing the rest. With a deadline, probes still queued when it
+    expires are dropped and the totals cover what finished in time.
+    Resources whose host had no free politeness slot have no known size:
+    they are left out of the totals and counted in resources_unsized.
+    """
+    imgs, scripts, links = find_resources(html, max_resources, encoding)
+    deadline = deadline or Deadline(None)
 
     totals = {"images_kb": 0.0, "scripts_kb": 0.0, "css_kb": 0.0}
+    unsized = 0
+    session = get_session()
 
     def get_size(rurl):
+        size = resource_cache.fresh_size(rurl)
+        if size is not None:
+            return size / 1024
+        if deadline.expired:
+            return 0.0
+        conditional = resource_cache.conditional_headers(rurl)
+        host = url_host(rurl)
         try:
-            head = requests.head(rurl, timeout=timeout, allow_redirects=True)
-            if head.status_code >= 400:
-                get = requests.get(rurl, timeout=timeout, stream=True)
-                data = get.content
-                return len(data) / 1024
-            cl = head.headers.get("Content-Length")
-            if cl:
-                return int(cl) / 1024
+            request_timeout = deadline.timeout(timeout)
+            with scheduler.slot(host, timeout=request_timeout):
+                resp = session.head(rurl, timeout=request_timeout, allow_redirects=True, headers=conditional)
+                size = resp.headers.get("Content-Length")
+                if resp.status_code >= 400 or (resp.status_code != 304 and not size):
+                    resp = session.get(rurl, timeout=deadline.timeout(timeout), stream=True, headers=conditional)
+                    size = len(resp.content)
+            scheduler.report(host, resp.status_code, resp.headers)
+            if resp.status_code == 304:
+                size = resource_cache.not_modified(rurl, resp.headers) or 0
             else:
-                g = requests.get(rurl, timeout=timeout, stream=True)
-                return len(g.content) / 1024
+                size = int(size)
+                if resp.status_code < 400:
+                    resource_cache.store(rurl, size, resp.headers)
+            return size / 1024
+        except HostBusy:
+            # Not measured; None keeps it out of the totals
+            return None
         except Exception:
             return 0.0
 
-    img_urls = imgs[:max_resources]
-    script_urls = scripts[:max_resources]
-    css_urls = links[:max_resources]
-
     def make_absolute(u):
         try:
             return requests.compat.urljoin(base_url, u)
         except:
             return u
 
-    with ThreadPoolExecutor(max_workers=8) as ex:
-        futures = {}
-        for u in img_urls:
-            futures[ex.submit(get_size, make_absolute(u))] = ("img", u)
-        for u in script_urls:
-            futures[ex.submit(get_size, make_absolute(u))] = ("script", u)
-        for u in css_urls:
-            futures[ex.submit(get_size, make_absolute(u))] = ("css", u)
-
-        for fut in as_completed(futures):
-            kind, url = futures[fut]
+    # Shared workers; the scheduler, not the pool size, limits load per host
+    futures = {}
+    for u in imgs:
+        futures[resource_executor.submit(get_size, make_absolute(u))] = ("img", u)
+    for u in scripts:
+        futures[resource_executor.submit(get_size, make_absolute(u))] = ("script", u)
+    for u in links:
+        futures[resource_executor.submit(get_size, make_absolute(u))] = ("css", u)
+
+    def add(fut):
+        nonlocal unsized
+        kind, url = futures[fut]
+        size = 0.0
+        try:
+            size = fut.result()
+        except Exception:
             size = 0.0
-            try:
-                size = fut.result()
-            except Exception:
-                size = 0.0
-            if kind == "img":
-                totals["images_kb"] += size
-            elif kind == "script":
-                totals["scripts_kb"] += size
-            elif kind == "css":
-                totals["css_kb"] += size
+        if size is None:
+            unsized += 1
+        elif kind == "img":
+            totals["images_kb"] += size
+        elif kind == "script":
+            totals["scripts_kb"] += size
+        elif kind == "css":
+            totals["css_kb"] += size
+
+    remaining = deadline.remaining()
+    try:
+        for fut in as_completed(futures, timeout=None if remaining == math.inf else remaining):
+            add(fut)
+    except FuturesTimeout:
+        for fut in futures:
+            fut.cancel()
 
     for k in totals:
         totals[k] = round(totals[k], 2)
+    totals["resources_unsized"] = unsized
     return totals
 
 
 # -----------------------
 # High-level analyze function (Enhanced)
 # -----------------------
-def analyze_site(url, fetch_resources=True, resource_limit=20, check_advanced=True):
+def analyze_site(
+    url, fetch_resources=True, resource_limit=20, check_advanced=True, on_stage=None, deadline=None
+):
+    """Run every probe against url; on_stage(name) is called as each stage finishes.
+
+    All stages share one Deadline (ANALYZER_URL_BUDGET by default): each
+    gets at most what is left of it, and stages are skipped once it has run
+    out or its task was cancelled. The result carries per-stage wall times
+    (stage_timings, in ms), failed stages (stage_errors) and skipped ones
+    (stage_skipped).
+    """
+    timer = StageTimer("threads")
+    out = None
+    try:
+        out = _analyze_site(
+            url, fetch_resources, resource_limit, check_advanced, on_stage, deadline or Deadline(), timer
+        )
+        return out
+    finally:
+        timer.finish(out)
+
+
+def _analyze_site(url, fetch_resources, resource_limit, check_advanced, on_stage, deadline, timer):
+    def stage_done(name, error=False):
+        timer.mark(name, error)
+        if on_stage is not None:
+            on_stage(name)
+
+    def stage_allowed(name):
+        if deadline.expired:
+            timer.skip(name)
+            return False
+        return True
+
     out = {
         "url": url,
         "ip": None,
@@ -442,6 +947,7 @@ def analyze_site(url, fetch_resources=True, resource_limit=20, check_advanced=Tr
         "images_kb": None,
         "scripts_kb": None,
         "css_kb": None,
+        "resources_unsized": None,
         "ssl_score": None,
         "ssl_valid": None,
         "ssl_days_remaining": None,
@@ -464,86 +970,107 @@ def analyze_site(url, fetch_resources=True, resource_limit=20, check_advanced=Tr
         url = "http://" + url
     out["url"] = url
 
+    request_host = urlsplit(url).hostname
     hostname = tldextract.extract(url)
     hostname = ".".join(part for part in [hostname.domain, hostname.suffix] if part)
 
     # DNS
-    dns_ms, ip = measure_dns(hostname)
+    dns_ms, ip = measure_dns(hostname, timeout=deadline.timeout(5.0))
     out["dns"] = round(dns_ms, 2) if dns_ms else None
     out["ip"] = ip
+    stage_done("dns", error=ip is None)
 
     # Advanced DNS lookup
-    if check_advanced and has_dnspython:
-        out["dns_breakdown"] = advanced_dns_lookup(hostname)
+    if check_advanced and has_dnspython and stage_allowed("dns_breakdown"):
+        out["dns_breakdown"] = advanced_dns_lookup(hostname, deadline=deadline.timeout(DNS_BENCH_DEADLINE))
+        stage_done("dns_breakdown", error=not any(out["dns_breakdown"].values()))
 
-    # SSL Security Check
-    if url.startswith("https://"):
+    # Main request: one timed transfer also captures headers, protocol and body
+    fetch = None
+    response = None
+    if stage_allowed("fetch"):
+        if has_pycurl:
+            try:
+                fetch = measure_with_pycurl(url, timeout=deadline.timeout(30), deadline=deadline)
+            except Exception:
+                fetch = None
+        if not fetch and not deadline.expired:
+            fetch = measure_with_requests(url, timeout=deadline.timeout(30))
+
+        if fetch:
+            # Both fetchers resolve through dns_cache, so their times start after the
+            # lookup. Add the measured DNS time so tcp/ssl/ttfb/total are cumulative
+            # from the start of the request, as in the async engine and older history.
+            for key in ("tcp", "ssl", "ttfb", "total"):
+                if fetch.get(key):
+                    out[key] = round(fetch[key] + (dns_ms or 0), 2)
+            for key in ("status_code", "size_kb"):
+                if fetch.get(key) is not None:
+                    out[key] = fetch[key]
+            response = fetch["response"]
+        stage_done("fetch", error=not fetch)
+
+    # SSL Security Check of the host requested: cached per certificate, so a
+    # fetch that ended on that host and saw the same certificate needs no
+    # extra handshake
+    if url.startswith("https://") and stage_allowed("ssl"):
+        fingerprint = None
+        if fetch and fetch.get("cert_fingerprint"):
+            final = urlsplit(response.url)
+            if final.hostname == request_host and (final.port or 443) == 443:
+                fingerprint = fetch["cert_fingerprint"]
+        ssl_failed = True
         try:
-            ssl_info = check_ssl_security(hostname)
+            ssl_info = check_ssl_security(
+                request_host, timeout=deadline.timeout(10), fingerprint=fingerprint, measure_resumption=check_advanced
+            )
             out.update(ssl_info)
+            ssl_failed = "Error" in ssl_info["ssl_score_breakdown"]
         except Exception:
             pass
-
-    # Main request with enhanced detection
-    response = None
-    pyinfo = None
-    if has_pycurl:
-        try:
-            pyinfo = measure_with_pycurl(url)
-        except Exception:
-            pyinfo = None
-
-    if pyinfo:
-        out["tcp"] = pyinfo.get("tcp")
-        out["ssl"] = pyinfo.get("ssl")
-        out["ttfb"] = pyinfo.get("ttfb")
-        out["total"] = pyinfo.get("total")
-        out["status_code"] = pyinfo.get("status_code")
-        out["size_kb"] = pyinfo.get("size_kb")
-        try:
-            response = requests.get(url, timeout=20)
-        except Exception:
-            response = None
-    else:
-        rinfo = measure_with_requests(url)
-        if rinfo:
-            out["ttfb"] = rinfo.get("ttfb")
-            out["total"] = rinfo.get("total")
-            out["status_code"] = rinfo.get("status_code")
-            out["size_kb"] = rinfo.get("size_kb")
-            try:
-                response = requests.get(url, timeout=20)
-            except Exception:
-                response = None
+        stage_done("ssl", error=ssl_failed)
 
     # Enhanced features
     if response:
         if check_advanced:
             out["http_version"] = detect_http_version(response)
             out["cdn_provider"] = detect_cdn(response.headers, hostname)
-            out["compression_type"] = check_compression(url)
+            out["compression_type"] = check_compression(response.headers)
 
             sec_headers = security_headers_score(response.headers)
             out["security_headers_score"] = sec_headers["score"]
             out["security_headers_present"] = sec_headers["present"]
             out["security_headers_missing"] = sec_headers["missing"]
+            stage_done("headers")
 
-            if ip:
-                out["server_location"] = get_server_location(ip)
+            if ip and stage_allowed("location"):
+                out["server_location"] = get_server_location(ip, timeout=deadline.timeout(5))
+                stage_done("location", error=out["server_location"] == "Unknown")
 
-            conn_reuse = check_connection_reuse(url)
-            if conn_reuse:
-                out["connection_reuse_benefit"] = conn_reuse["benefit"]
+            if stage_allowed("connection_reuse"):
+                # Sampling stops early, with what it has, if the budget runs out
+                conn_reuse = check_connection_reuse(url, timeout=deadline.timeout(10), deadline=deadline)
+                if conn_reuse:
+                    out["connection_reuse_benefit"] = conn_reuse["benefit"]
+                    out["connection_reuse"] = conn_reuse
+                stage_done("connection_reuse", error=not conn_reuse)
 
         # Resource breakdown
-        if fetch_resources:
+        if fetch_resources and stage_allowed("resources"):
             try:
                 breakdown = resource_breakdown(
-                    url, response.text, max_resources=resource_limit
+                    response.url or url,
+                    response.content,
+                    max_resources=resource_limit,
+                    encoding=requests.utils.get_encoding_from_headers(response.headers),
+                    deadline=deadline,
                 )
                 out.update(breakdown)
+                # Totals that leave out unmeasured resources are incomplete
+                resources_failed = breakdown["resources_unsized"] > 0
             except Exception:
-                pass
+                resources_failed = True
+            stage_done("resources", error=resources_failed)
 
     # Ensure SSL score is set
     if out.get("ssl_score") is None:
@@ -1,10 +1,34 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterable, Iterable, List, Literal, Optional, Union
+from concurrent.futures import Future
+import asyncio
+import json
+import os
+import threading
 import uvicorn
 from analyzer import analyze_site
-from database import init_db, save_result, get_all_results, clear_history
+from async_analyzer import analyze_site_async, make_client
+from batch import run_batch, run_batch_async
+from curl_engine import curl_engine
+from deadline import Deadline, MAX_URL_BUDGET_SECONDS, URL_BUDGET_SECONDS
+from dns_cache import dns_cache
+from politeness import scheduler
+from resource_cache import resource_cache
+from geo_cache import geo_cache
+from ingest import BulkIngest, UrlSpool
+from tls_cache import tls_cache
+from result_cache import result_cache, result_key
+from events import task_events
+import metrics
+from tasks import SQLiteTaskStore, make_task_store
+from jobs import JOB_RUNNER_ENABLED, MIN_SCHEDULE_INTERVAL, JobQueue, JobRunner, job_options
+from database import (
+    init_db, query_runs, aggregate_runs, clear_history, column_types, history_columns, iter_runs, to_db_timestamp
+)
+import export
 import uuid
 
 app = FastAPI(title="Website Performance Analyzer API")
@@ -16,10 +40,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Initialize database
 init_db()
+# Load the persistent caches before serving, not on a first lookup from the event loop
+resource_cache.warm()
+geo_cache.warm()
+
+
+# "threads" runs analyze_site on a thread pool, "async" runs analyze_site_async on the event loop,
+# "queue" hands the URLs to worker processes (worker.py) through the job queue
+DEFAULT_ENGINE = os.environ.get("ANALYZER_ENGINE", "threads")
 
 
 # Request/Response Models
@@ -28,6 +61,20 @@ class AnalysisRequest(BaseModel):
     fetch_resources: bool = True
     resource_limit: int = 10
     check_advanced: bool = True
+    max_concurrency: Optional[int] = None  # clamped to ANALYZER_MAX_CONCURRENCY
+    per_host_limit: Optional[int] = None  # clamped to ANALYZER_PER_HOST_CONCURRENCY
+    engine: Literal["threads", "async", "queue"] = DEFAULT_ENGINE
+    url_budget: Optional[float] = None  # seconds per URL, defaults to ANALYZER_URL_BUDGET
+    max_age: Optional[float] = None  # oldest shared result accepted, in seconds; 0 measures afresh
+
+
+class ScheduleRequest(BaseModel):
+    urls: List[str]
+    interval_seconds: int = 60
+    fetch_resources: bool = True
+    resource_limit: int = 10
+    check_advanced: bool = True
+    url_budget: Optional[float] = None
 
 
 class AnalysisResponse(BaseModel):
@@ -35,28 +82,81 @@ class AnalysisResponse(BaseModel):
     message: str
 
 
-# In-memory storage for analysis tasks
-analysis_tasks = {}
+class BulkAnalysisResponse(AnalysisResponse):
+    accepted: int
+    # Upper bound: a distinct URL is taken for a duplicate with about this probability
+    duplicates: int
+    false_positive_rate: float
+    invalid: int
+    dropped: int
+
+
+# Analysis task registry (in-process, or shared through SQLite with ANALYZER_TASK_STORE=sqlite)
+task_store = make_task_store()
+
+# Tasks running in this process: task_id -> {"cancel": Event, "runner": asyncio.Task or None}
+active_runs = {}
+
+# Runs started by bulk uploads, referenced until they finish
+bulk_runs = set()
+
+# Recurring monitoring: schedules feed a durable job queue served by job runners
+job_queue = JobQueue()
+job_runner = JobRunner(job_queue)
+if JOB_RUNNER_ENABLED:
+    job_runner.start()
+
+
+async def committed(future: Optional[Future]):
+    """Wait for a task store write without blocking the event loop (memory stores return None)"""
+    if future is not None:
+        await asyncio.wrap_future(future)
+
+
+def check_budget(url_budget: Optional[float]) -> float:
+    budget = URL_BUDGET_SECONDS if url_budget is None else url_budget
+    if not 0 < budget <= MAX_URL_BUDGET_SECONDS:
+        raise HTTPException(status_code=400, detail=f"url_budget must be in (0, {MAX_URL_BUDGET_SECONDS}]")
+    return budget
+
+
+def check_max_age(max_age: Optional[float]) -> Optional[float]:
+    if max_age is not None and max_age < 0:
+        raise HTTPException(status_code=400, detail="max_age must not be negative")
+    return max_age
 
 
 @app.post("/api/analyze", response_model=AnalysisResponse)
 async def analyze_websites(request: AnalysisRequest, background_tasks: BackgroundTasks):
     """Start website analysis"""
+    budget = check_budget(request.url_budget)
+    max_age = check_max_age(request.max_age)
+
+    if request.engine == "queue" and not isinstance(task_store, SQLiteTaskStore):
+        raise HTTPException(status_code=400, detail="The queue engine needs ANALYZER_TASK_STORE=sqlite")
+
     task_id = str(uuid.uuid4())
-    analysis_tasks[task_id] = {
-        "status": "running",
-        "progress": 0,
-        "total": len(request.urls),
-        "results": []
-    }
+    await committed(task_store.create(task_id, len(request.urls)))
+
+    if request.engine == "queue":
+        # Workers record results on the task and finish it with the last URL
+        options = job_options(request.fetch_resources, request.resource_limit, request.check_advanced, budget)
+        await asyncio.to_thread(job_queue.enqueue, request.urls, options, task_id)
+        return AnalysisResponse(task_id=task_id, message=f"Analysis queued for {len(request.urls)} URLs")
+
+    active_runs[task_id] = {"cancel": threading.Event(), "runner": None}
 
     background_tasks.add_task(
-        run_analysis,
+        run_analysis_async if request.engine == "async" else run_analysis,
         task_id,
         request.urls,
         request.fetch_resources,
         request.resource_limit,
-        request.check_advanced
+        request.check_advanced,
+        request.max_concurrency,
+        request.per_host_limit,
+        budget,
+        max_age,
     )
 
     return AnalysisResponse(
@@ -65,46 +165,487 @@ async def analyze_websites(request: AnalysisRequest, background_tasks: Backgroun
     )
 
 
-def run_analysis(task_id: str, urls: List[str], fetch_resources: bool, resource_limit: int, check_advanced: bool):
-    """Background task to run analysis"""
-    results = []
-    for idx, url in enumerate(urls):
-        try:
-            result = analyze_site(url, fetch_resources, resource_limit, check_advanced)
-            results.append(result)
-            save_result(result)
+@app.post("/api/analyze/bulk", response_model=BulkAnalysisResponse)
+async def analyze_bulk(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    fetch_resources: bool = True,
+    resource_limit: int = 10,
+    check_advanced: bool = True,
+    max_concurrency: Optional[int] = None,
+    per_host_limit: Optional[int] = None,
+    engine: Literal["threads", "async", "queue"] = DEFAULT_ENGINE,
+    url_budget: Optional[float] = None,
+    max_age: Optional[float] = None,
+):
+    """Start analysis of an uploaded URL list, streamed as the request body.
+
+    The body is newline-delimited (bare URLs, JSON strings or {"url": ...}
+    objects) or CSV, picked by format or the Content-Type. URLs are
+    normalized, deduplicated and grouped by host while the upload is read,
+    and analysis starts with the first batch; the task's total grows until
+    the upload ends. The response arrives once the whole body is consumed.
+    """
+    budget = check_budget(url_budget)
+    check_max_age(max_age)
+    if engine == "queue" and not isinstance(task_store, SQLiteTaskStore):
+        raise HTTPException(status_code=400, detail="The queue engine needs ANALYZER_TASK_STORE=sqlite")
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    ingest = BulkIngest(format)
+    task_id = str(uuid.uuid4())
+    cancel = threading.Event()
+
+    if engine == "queue":
+        # The upload itself counts as one URL until it ends, so workers
+        # catching up with it cannot finish the task early
+        await committed(task_store.create(task_id, 1))
+        options = job_options(fetch_resources, resource_limit, check_advanced, budget)
+
+        async def submit(urls):
+            task_store.add_total(task_id, len(urls))
+            await asyncio.to_thread(job_queue.enqueue, urls, options, task_id)
+    else:
+        await committed(task_store.create(task_id, 0))
+        active_runs[task_id] = {"cancel": cancel, "runner": None}
+        spool = UrlSpool()
+        args = (task_id, spool, fetch_resources, resource_limit, check_advanced, max_concurrency, per_host_limit,
+                budget, max_age)
+        if engine == "async":
+            runner = asyncio.create_task(run_analysis_async(*args))
+            bulk_runs.add(runner)
+            runner.add_done_callback(bulk_runs.discard)
+        else:
+            threading.Thread(target=run_analysis, args=args, name=f"bulk-{task_id}", daemon=True).start()
+
+        async def submit(urls):
+            # Counted before the engine can see them, so progress never passes total
+            task_store.add_total(task_id, len(urls))
+            spool.extend(urls)
+
+    try:
+        async for chunk in request.stream():
+            if cancel.is_set():
+                break
+            urls = await asyncio.to_thread(ingest.feed, chunk)
+            if urls:
+                await submit(urls)
+        urls = ingest.finish()
+        if urls and not cancel.is_set():
+            await submit(urls)
+    finally:
+        if engine == "queue":
+            task_store.add_total(task_id, -1, settle=True)
+        else:
+            spool.close()
+
+    return BulkAnalysisResponse(
+        task_id=task_id,
+        message=f"Analysis {'queued' if engine == 'queue' else 'started'} for {ingest.accepted} URLs",
+        **ingest.summary(),
+    )
+
+
+def record_result(task_id: str, url: str, result: Optional[dict], error: Optional[BaseException]):
+    """Store one finished URL on its task and in the database"""
+    future = task_store.record(task_id, url, result, error)
+    task_events.publish(task_id)
+    if future is not None:
+        # Stores that only expose committed rows need another wake-up
+        future.add_done_callback(lambda f: task_events.publish(task_id))
+
+
+def finish_task(task_id: str) -> Optional[Future]:
+    """Mark a task finished; streams are woken once the store has it"""
+    run = active_runs.pop(task_id, None)
+    cancelled = run is not None and run["cancel"].is_set()
+    future = task_store.finish(task_id, "cancelled" if cancelled else "completed")
+    if future is None:
+        task_events.publish(task_id)
+    else:
+        future.add_done_callback(lambda f: task_events.publish(task_id))
+    return future
 
-            # Update progress
-            analysis_tasks[task_id]["progress"] = idx + 1
-            analysis_tasks[task_id]["results"] = results
-        except Exception as e:
-            results.append({"url": url, "error": str(e)})
 
-    analysis_tasks[task_id]["status"] = "completed"
-    analysis_tasks[task_id]["results"] = results
+def stage_reporter(task_id: str, url: str):
+    """on_stage callback that forwards finished stages to event streams"""
+    return lambda stage: task_events.publish(task_id, {"url": url, "stage": stage})
+
+
+def run_analysis(task_id: str, urls: Iterable[str], fetch_resources: bool, resource_limit: int, check_advanced: bool,
+                 max_concurrency: Optional[int] = None, per_host_limit: Optional[int] = None,
+                 url_budget: float = URL_BUDGET_SECONDS, max_age: Optional[float] = None):
+    """Background task to run analysis, several URLs at a time"""
+    cancel = active_runs[task_id]["cancel"]
+
+    def worker(url):
+        deadline = Deadline(url_budget, cancel)
+        return result_cache.run(
+            result_key(url, fetch_resources, resource_limit, check_advanced),
+            lambda: analyze_site(url, fetch_resources, resource_limit, check_advanced, stage_reporter(task_id, url),
+                                 deadline),
+            max_age,
+            deadline,
+        )
+
+    # run_batch reports results on this thread, so no locking is needed
+    run_batch(urls, worker, lambda idx, url, result, error: record_result(task_id, url, result, error),
+              max_concurrency, per_host_limit, cancel.is_set)
+    finish_task(task_id)
+
+
+async def run_analysis_async(task_id: str, urls: Union[Iterable[str], AsyncIterable[str]], fetch_resources: bool, resource_limit: int,
+                             check_advanced: bool, max_concurrency: Optional[int] = None,
+                             per_host_limit: Optional[int] = None, url_budget: float = URL_BUDGET_SECONDS,
+                             max_age: Optional[float] = None):
+    """Background task to run analysis on the event loop"""
+    run = active_runs[task_id]
+
+    async def analyze_all():
+        async with make_client() as client:
+            async def worker(url):
+                deadline = Deadline(url_budget, run["cancel"])
+                return await result_cache.run_async(
+                    result_key(url, fetch_resources, resource_limit, check_advanced),
+                    lambda: analyze_site_async(url, fetch_resources, resource_limit, check_advanced, client,
+                                               stage_reporter(task_id, url), deadline),
+                    max_age,
+                    deadline,
+                )
+
+            await run_batch_async(urls, worker,
+                                  lambda idx, url, result, error: record_result(task_id, url, result, error),
+                                  max_concurrency, per_host_limit, run["cancel"].is_set)
+
+    # Run in a task of its own so cancellation stops in-flight probes at once
+    run["runner"] = asyncio.create_task(analyze_all())
+    try:
+        await run["runner"]
+    except asyncio.CancelledError:
+        if not run["cancel"].is_set():
+            raise
+    finally:
+        await committed(finish_task(task_id))
 
 
 @app.get("/api/analysis/{task_id}")
-async def get_analysis_status(task_id: str):
-    """Get analysis status and results"""
-    if task_id not in analysis_tasks:
+async def get_analysis_status(task_id: str, offset: int = 0):
+    """Get analysis status and results; offset skips results already seen"""
+    status = await asyncio.to_thread(task_store.status, task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    results = await asyncio.to_thread(task_store.results, task_id, offset)
+    if not offset:
+        return {**status, "results": results}
+    return {**status, "offset": offset, "results": results}
+
+
+def sse_event(event: str, data, event_id: Optional[int] = None) -> str:
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+# Idle streams send a comment this often so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@app.delete("/api/analysis/{task_id}")
+async def cancel_analysis(task_id: str):
+    """Cancel a running task: no new URLs start and in-flight ones stop at once"""
+    status = await asyncio.to_thread(task_store.status, task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    run = active_runs.get(task_id)
+    if status["status"] != "running":
+        raise HTTPException(status_code=409, detail=f"Task already {status['status']}")
+    if run is None:
+        raise HTTPException(status_code=409, detail="Task is running in another worker")
+    run["cancel"].set()
+    if run["runner"] is not None:
+        run["runner"].cancel()
+    return {"message": "Cancellation requested", "task_id": task_id}
+
+
+@app.get("/api/analysis/{task_id}/events")
+async def stream_analysis(task_id: str, request: Request, offset: int = 0, stages: bool = False):
+    """Server-Sent Events stream of a task's results.
+
+    Each completed URL is sent once as a "result" event whose id is its
+    position in the results list; reconnecting with Last-Event-ID (or
+    offset) resumes after it. With stages=true, live "stage" events are sent
+    as each URL finishes a stage. A final "done" event closes the stream.
+    """
+    if await asyncio.to_thread(task_store.status, task_id) is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return analysis_tasks[task_id]
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id) + 1
+
+    async def events():
+        sub = task_events.subscribe(task_id)
+        sent = max(offset, 0)
+        try:
+            while True:
+                sub.wake.clear()
+                task = await asyncio.to_thread(task_store.status, task_id)
+                if task is None:
+                    break
+                finished = task["status"] != "running"
+                for result in await asyncio.to_thread(task_store.results, task_id, sent):
+                    yield sse_event("result", result, sent)
+                    sent += 1
+                while stages and sub.stages:
+                    yield sse_event("stage", sub.stages.popleft())
+                sub.stages.clear()
+                if finished:
+                    yield sse_event("done", {"status": task["status"], "progress": task["progress"],
+                                             "total": task["total"]})
+                    break
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), task_store.poll_interval or SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+        finally:
+            task_events.unsubscribe(task_id, sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/schedules")
+async def create_schedules(request: ScheduleRequest):
+    """Analyze each URL every interval_seconds, results saved to history"""
+    if not request.urls:
+        raise HTTPException(status_code=400, detail="No URLs given")
+    if request.interval_seconds < MIN_SCHEDULE_INTERVAL:
+        raise HTTPException(status_code=400, detail=f"interval_seconds must be at least {MIN_SCHEDULE_INTERVAL}")
+    budget = check_budget(request.url_budget)
+    options = job_options(request.fetch_resources, request.resource_limit, request.check_advanced, budget)
+    ids = await asyncio.to_thread(job_queue.add_schedules, request.urls, request.interval_seconds, options)
+    return {"schedule_ids": ids, "message": f"Scheduled {len(ids)} URLs every {request.interval_seconds}s"}
+
+
+@app.get("/api/schedules")
+async def list_schedules(limit: int = 1000):
+    """Schedules with their next run and the outcome of the last one"""
+    return {"schedules": await asyncio.to_thread(job_queue.schedules, max(1, min(limit, 10000)))}
+
+
+@app.delete("/api/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: int):
+    """Stop a schedule and drop its queued jobs"""
+    if not await asyncio.to_thread(job_queue.delete_schedule, schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"message": "Schedule deleted"}
+
+
+@app.get("/api/jobs")
+async def job_stats():
+    """Job queue counts and this process's runner counters"""
+    return {"queue": await asyncio.to_thread(job_queue.counts), "runner": job_runner.stats()}
 
 
 @app.get("/api/history")
-async def get_history(limit: int = 100):
-    """Get historical analysis data"""
-    return get_all_results(limit)
+def get_history(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    url: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status_code: Optional[int] = None,
+    cdn: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get historical analysis data, newest first.
+
+    The cursor for the next page is returned in the X-Next-Cursor header;
+    fields is a comma separated column list (id and timestamp always included).
+    """
+    try:
+        rows, next_cursor = query_runs(
+            limit, cursor, url, host, since, until, status_code, cdn,
+            [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+@app.get("/api/export")
+def export_history(
+    format: Literal["csv", "parquet", "pdf"] = "csv",
+    fields: Optional[str] = None,
+    url: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status_code: Optional[int] = None,
+    cdn: Optional[str] = None,
+    limit: Optional[int] = None,
+):
+    """Download run history as CSV, Parquet or PDF, oldest first.
+
+    Rows are read in batches and each batch is written to the (chunked)
+    response as soon as it is encoded, so exports of any size use about
+    the same memory. fields is a comma separated column list; since/until
+    and the other filters work as in /api/history.
+    """
+    if format == "parquet" and not export.has_pyarrow:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed")
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        columns = history_columns(requested or (list(export.PDF_DEFAULT_FIELDS) if format == "pdf" else None))
+        for value in (since, until):
+            if value:
+                to_db_timestamp(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    batches = iter_runs(columns, url, host, since, until, status_code, cdn, limit)
+    if format == "csv":
+        body = export.stream_csv(columns, batches)
+    elif format == "parquet":
+        body = export.stream_parquet(column_types(columns), batches)
+    else:
+        body = export.stream_pdf("Website Performance Analyzer - run history", column_types(columns), batches)
+    media_type, extension = export.EXPORT_FORMATS[format]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="runs.{extension}"'},
+    )
+
+
+@app.get("/api/trends")
+def get_trends(
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    metrics: Optional[str] = None,
+    url: Optional[str] = None,
+    urls: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """Bucketed min/avg/p50/p95/max of timing and size metrics.
+
+    urls is a comma separated list; together with url and host it selects
+    the group of runs merged into one series.
+    """
+    try:
+        return aggregate_runs(
+            granularity,
+            [m.strip() for m in metrics.split(",") if m.strip()] if metrics else None,
+            url,
+            [u.strip() for u in urls.split(",") if u.strip()] if urls else None,
+            host,
+            since,
+            until,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.delete("/api/history")
 async def delete_history():
     """Clear all historical data"""
-    clear_history()
+    await asyncio.to_thread(clear_history)
     return {"message": "History cleared successfully"}
 
 
+@app.get("/api/dns-cache")
+async def dns_cache_stats():
+    """Shared DNS cache size and hit/miss counters"""
+    return dns_cache.stats()
+
+
+@app.delete("/api/dns-cache")
+async def flush_dns_cache():
+    """Drop all cached DNS answers and reset counters"""
+    dns_cache.clear()
+    return {"message": "DNS cache cleared"}
+
+
+@app.get("/api/resource-cache")
+async def resource_cache_stats():
+    """Cross-run resource size cache size and hit/revalidation counters"""
+    return resource_cache.stats()
+
+
+@app.delete("/api/resource-cache")
+async def flush_resource_cache():
+    """Forget all cached resource sizes and reset counters"""
+    await asyncio.to_thread(resource_cache.clear)
+    return {"message": "Resource cache cleared"}
+
+
+@app.get("/api/geo-cache")
+async def geo_cache_stats():
+    """Server location cache size, GeoIP database and hit counters"""
+    return geo_cache.stats()
+
+
+@app.delete("/api/geo-cache")
+async def flush_geo_cache():
+    """Forget all cached server locations and reset counters"""
+    await asyncio.to_thread(geo_cache.clear)
+    return {"message": "Geo cache cleared"}
+
+
+@app.get("/api/tls-cache")
+async def tls_cache_stats():
+    """Per-certificate SSL check cache size and hit counters"""
+    return tls_cache.stats()
+
+
+@app.delete("/api/tls-cache")
+async def flush_tls_cache():
+    """Forget all cached SSL check results"""
+    tls_cache.clear()
+    return {"message": "TLS cache cleared"}
+
+
+@app.get("/api/result-cache")
+async def result_cache_stats():
+    """Recent analysis result cache size, in-flight analyses and hit/coalesce counters"""
+    return result_cache.stats()
+
+
+@app.delete("/api/result-cache")
+async def flush_result_cache():
+    """Forget cached results so the next requests measure afresh"""
+    result_cache.clear()
+    return {"message": "Result cache cleared"}
+
+
+@app.get("/api/politeness")
+async def politeness_stats():
+    """Per-host request scheduler state and throttling counters"""
+    return scheduler.stats()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition: stage histograms, error counters and capacity gauges"""
+    if not metrics.has_prometheus:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    counts = await asyncio.to_thread(task_store.counts)
+    body, content_type = metrics.render(counts, curl_engine.stats(), scheduler.stats())
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
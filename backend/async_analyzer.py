@@ -0,0 +1,540 @@
+import asyncio
+import math
+import socket
+import ssl
+import time
+
+import httpx
+import tldextract
+
+from analyzer import (
+    DNS_BENCH_DEADLINE,
+    DNS_BENCH_SAMPLES,
+    DNS_RESOLVERS,
+    REUSE_METHOD,
+    REUSE_SAMPLES,
+    check_compression,
+    detect_cdn,
+    find_resources,
+    has_dnspython,
+    probe_tls_resumption,
+    reuse_report,
+    score_ssl,
+    security_headers_score,
+)
+from batch import url_host
+from deadline import Deadline
+from dns_cache import dns_cache
+from geo_cache import GEO_OFFLINE, geo_cache
+from metrics import StageTimer
+from politeness import HostBusy, scheduler
+from resource_cache import resource_cache
+from stats import summarize
+from tls_cache import cert_fingerprint, not_after, tls_cache
+
+if has_dnspython:
+    import dns.asyncresolver
+
+# -----------------------
+# asyncio-native variant of analyzer.analyze_site
+# -----------------------
+# Every probe here awaits instead of blocking, so one event loop can keep
+# thousands of URLs in flight. Result dicts match analyze_site field for field.
+
+HTTP_VERSION_MAP = {"HTTP/1.0": "HTTP/1.0", "HTTP/1.1": "HTTP/1.1", "HTTP/2": "HTTP/2.0"}
+
+
+def make_client(timeout=30, max_connections=100):
+    """Create a shared AsyncClient for a batch of async analyses"""
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections),
+    )
+
+
+def cold_client(timeout=30):
+    """Single-use AsyncClient for the timed fetch: a new connection, never kept alive"""
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=timeout,
+        limits=httpx.Limits(max_keepalive_connections=0),
+    )
+
+
+async def measure_dns_async(hostname, timeout=5.0):
+    """Resolve hostname without blocking, returning (dns_ms, ip)"""
+    start = time.perf_counter()
+    ip = None
+    if has_dnspython:
+        try:
+            answer = await dns.asyncresolver.resolve(hostname, "A", lifetime=timeout)
+            ip = answer[0].to_text()
+        except Exception:
+            ip = None
+    if ip is None:
+        # Fall back to the system resolver (hosts file, mDNS, no dnspython)
+        try:
+            loop = asyncio.get_running_loop()
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(hostname, None, family=socket.AF_INET), timeout
+            )
+            ip = infos[0][4][0]
+        except Exception:
+            return None, None
+    dns_ms = (time.perf_counter() - start) * 1000
+    dns_cache.seed(hostname, ip)
+    return dns_ms, ip
+
+
+async def advanced_dns_lookup_async(hostname, resolvers=None, samples=None, deadline=None):
+    """Benchmark DNS resolvers concurrently; same output as advanced_dns_lookup"""
+    if not has_dnspython:
+        return None
+
+    resolvers = DNS_RESOLVERS if resolvers is None else resolvers
+    samples = samples or DNS_BENCH_SAMPLES
+    deadline = deadline or DNS_BENCH_DEADLINE
+    if not resolvers:
+        return {}
+    timings = {name: [] for name, _, _ in resolvers}
+    errors = {name: 0 for name, _, _ in resolvers}
+
+    async def probe(name, address, port):
+        resolver = dns.asyncresolver.Resolver(configure=False)
+        resolver.nameservers = [address]
+        resolver.port = port
+        resolver.timeout = resolver.lifetime = deadline
+        for _ in range(samples):
+            start = time.perf_counter()
+            try:
+                await resolver.resolve(hostname, "A")
+                timings[name].append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors[name] += 1
+
+    tasks = [asyncio.create_task(probe(*resolver)) for resolver in resolvers]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for name in timings:
+        summary = summarize(timings[name])
+        if summary:
+            summary["samples"] = len(timings[name])
+            summary["errors"] = errors[name]
+        results[name] = summary
+    return results
+
+
+async def probe_connection_async(hostname, ip, port, use_tls, timeout=10, measure_resumption=False):
+    """Open a TCP (and optionally TLS) connection and time each phase.
+
+    Returns (connect_ms, handshake_ms, ssl_info); handshake_ms and ssl_info
+    are None for plain connections or when the handshake fails. ssl_info
+    comes from the TLS cache when the certificate was scored before.
+    """
+    async with scheduler.async_slot(hostname, timeout):
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip or hostname, port), timeout
+        )
+        connect_ms = (time.perf_counter() - start) * 1000
+        handshake_ms = None
+        ssl_info = None
+        scored = None  # (fingerprint, cert) when ssl_info was freshly scored
+        try:
+            if use_tls:
+                context = ssl.create_default_context()
+                start = time.perf_counter()
+                await asyncio.wait_for(
+                    writer.start_tls(context, server_hostname=hostname), timeout
+                )
+                handshake_ms = (time.perf_counter() - start) * 1000
+                ssock = writer.get_extra_info("ssl_object")
+                fingerprint = cert_fingerprint(ssock.getpeercert(binary_form=True))
+                ssl_info = tls_cache.get(hostname, port, fingerprint)
+                if ssl_info is None:
+                    cert = ssock.getpeercert()
+                    ssl_info = score_ssl(cert, ssock.cipher(), ssock.version())
+                    scored = (fingerprint, cert)
+        finally:
+            writer.close()
+    if scored is not None:
+        tls_cache.store(hostname, port, scored[0], ssl_info, not_after(scored[1]))
+    if ssl_info is not None and measure_resumption:
+        # Timings are not cached. asyncio cannot resume TLS sessions, so this
+        # probe runs on a thread
+        try:
+            ssl_info["tls_resumption"] = await asyncio.to_thread(
+                probe_tls_resumption, hostname, ip or hostname, port, timeout
+            )
+        except Exception:
+            ssl_info["tls_resumption"] = None
+    return connect_ms, handshake_ms, ssl_info
+
+
+async def fetch_async(client, url, timeout=30):
+    """GET url once, returning (response, body, ttfb_ms, total_ms)"""
+    host = url_host(url)
+    async with scheduler.async_slot(host, timeout):
+        start = time.perf_counter()
+        async with client.stream("GET", url, timeout=timeout) as resp:
+            ttfb = (time.perf_counter() - start) * 1000
+            body = await resp.aread()
+        total = (time.perf_counter() - start) * 1000
+    scheduler.report(host, resp.status_code, resp.headers)
+    return resp, body, ttfb, total
+
+
+async def _reuse_sample_async(client, url, method, timeout):
+    """One benchmark request: (connect_ms, ttfb_ms, reused), status.
+
+    Connection phases come from httpx trace events; DNS time is left out so
+    cold and warm TTFB differ only by connection setup.
+    """
+    marks = {}
+
+    async def trace(event, info):
+        marks[event] = time.perf_counter_ns()
+
+    start = time.perf_counter_ns()
+    if method == "head":
+        resp = await client.head(url, timeout=timeout, extensions={"trace": trace})
+    else:
+        resp = await client.get(url, timeout=timeout, headers={"Range": "bytes=0-0"}, extensions={"trace": trace})
+    end = time.perf_counter_ns()
+    origin = marks.get("connection.connect_tcp.started", start)
+    connected = marks.get("connection.start_tls.complete") or marks.get("connection.connect_tcp.complete")
+    headers = (
+        marks.get("http11.receive_response_headers.complete")
+        or marks.get("http2.receive_response_headers.complete")
+        or end
+    )
+    connect = (connected - origin) / 1e6 if connected else 0.0
+    reused = "connection.connect_tcp.started" not in marks
+    return (connect, (headers - origin) / 1e6, reused), resp.status_code
+
+
+async def check_connection_reuse_async(url, timeout=10, samples=REUSE_SAMPLES, deadline=None):
+    """Benchmark Keep-Alive like check_connection_reuse, on the event loop"""
+    deadline = deadline or Deadline(None)
+    method = "range" if REUSE_METHOD == "range" else "head"
+    host = url_host(url)
+    cold, warm = [], []
+    # One context for every client: loading CA certificates dominates client setup,
+    # and sessions are never resumed unless passed explicitly, so handshakes stay full
+    context = ssl.create_default_context() if url.startswith("https://") else False
+    try:
+        async with httpx.AsyncClient(verify=context) as keep_alive, scheduler.async_slot(host, timeout):
+            async def cold_sample():
+                async with httpx.AsyncClient(verify=context) as client:
+                    return await _reuse_sample_async(client, url, method, deadline.timeout(timeout))
+
+            async def warm_sample():
+                return await _reuse_sample_async(keep_alive, url, method, deadline.timeout(timeout))
+
+            sample, status = await warm_sample()
+            if method == "head" and status in (405, 501):
+                method = "range"
+                sample, status = await cold_sample()
+            scheduler.report(host, status, None)
+            cold.append(sample)
+            for i in range(samples):
+                if deadline.expired:
+                    break
+                warm.append((await warm_sample())[0])
+                if i < samples - 1 and not deadline.expired:
+                    cold.append((await cold_sample())[0])
+    except Exception:
+        pass
+    return reuse_report(method.upper() if method == "head" else "GET range", cold, warm)
+
+
+async def get_server_location_async(client, ip, timeout=5):
+    """Get geographic location of server (cache and local GeoIP database first)"""
+    location = geo_cache.lookup(ip)
+    if location is not None:
+        return location
+    if GEO_OFFLINE:
+        return "Unknown"
+    try:
+        async with scheduler.async_slot("ip-api.com", timeout):
+            resp = await client.get(f"http://ip-api.com/json/{ip}", timeout=timeout)
+        scheduler.report("ip-api.com", resp.status_code, resp.headers)
+        data = resp.json()
+        if data.get("status") == "success":
+            location = f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+            geo_cache.store(ip, location)
+            return location
+    except Exception:
+        pass
+    return "Unknown"
+
+
+async def resource_breakdown_async(client, base_url, html, timeout=5, max_resources=30, encoding=None,
+                                   deadline=None):
+    """Scan HTML for images/scripts/css and HEAD them concurrently for sizes.
+
+    As in resource_breakdown, html is the fetched body, already buffered.
+    With a deadline, probes still running when it expires are cancelled and
+    the totals cover what finished in time. Resources of hosts without a
+    free politeness slot are counted in resources_unsized, not the totals.
+    """
+    deadline = deadline or Deadline(None)
+    # Parsing is CPU bound, keep it off the event loop
+    imgs, scripts, links = await asyncio.to_thread(find_resources, html, max_resources, encoding)
+    async def get_size(rurl):
+        size = resource_cache.fresh_size(rurl)
+        if size is not None:
+            return size / 1024
+        conditional = resource_cache.conditional_headers(rurl)
+        host = url_host(rurl)
+        try:
+            async with scheduler.async_slot(host, deadline.timeout(timeout)):
+                resp = await client.head(rurl, timeout=deadline.timeout(timeout), headers=conditional)
+                size = resp.headers.get("Content-Length")
+                if resp.status_code >= 400 or (resp.status_code != 304 and not size):
+                    resp = await client.get(rurl, timeout=deadline.timeout(timeout), headers=conditional)
+                    size = len(resp.content)
+            scheduler.report(host, resp.status_code, resp.headers)
+            if resp.status_code == 304:
+                size = resource_cache.not_modified(rurl, resp.headers) or 0
+            else:
+                size = int(size)
+                if resp.status_code < 400:
+                    resource_cache.store(rurl, size, resp.headers)
+            return size / 1024
+        except HostBusy:
+            return None
+        except Exception:
+            return 0.0
+
+    groups = {
+        "images_kb": imgs,
+        "scripts_kb": scripts,
+        "css_kb": links,
+    }
+    base = httpx.URL(base_url)
+    jobs = [(key, str(base.join(u))) for key, urls in groups.items() for u in urls]
+    tasks = {asyncio.create_task(get_size(rurl)): key for key, rurl in jobs}
+    totals = {key: 0.0 for key in groups}
+    unsized = 0
+    if tasks:
+        remaining = deadline.remaining()
+        done, pending = await asyncio.wait(tasks, timeout=None if remaining == math.inf else remaining)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            size = task.result()
+            if size is None:
+                unsized += 1
+            else:
+                totals[tasks[task]] += size
+    for k in totals:
+        totals[k] = round(totals[k], 2)
+    totals["resources_unsized"] = unsized
+    return totals
+
+
+async def analyze_site_async(
+    url,
+    fetch_resources=True,
+    resource_limit=20,
+    check_advanced=True,
+    client=None,
+    on_stage=None,
+    deadline=None,
+):
+    """Async counterpart of analyzer.analyze_site.
+
+    Pass a shared client to pool connections across a batch; otherwise a
+    private one is created and closed for this URL. on_stage(name) is called
+    as each stage finishes, and stages share the deadline as in analyze_site.
+    """
+    if client is None:
+        async with make_client() as own_client:
+            return await analyze_site_async(
+                url, fetch_resources, resource_limit, check_advanced, own_client, on_stage, deadline
+            )
+
+    timer = StageTimer("async")
+    out = None
+    try:
+        out = await _analyze_site_async(
+            url, fetch_resources, resource_limit, check_advanced, client, on_stage, deadline or Deadline(), timer
+        )
+        return out
+    finally:
+        timer.finish(out)
+
+
+async def _analyze_site_async(url, fetch_resources, resource_limit, check_advanced, client, on_stage, deadline, timer):
+    def stage_done(name, error=False):
+        timer.mark(name, error)
+        if on_stage is not None:
+            on_stage(name)
+
+    def stage_allowed(name):
+        if deadline.expired:
+            timer.skip(name)
+            return False
+        return True
+
+    out = {
+        "url": url,
+        "ip": None,
+        "dns": None,
+        "tcp": None,
+        "ssl": None,
+        "ttfb": None,
+        "total": None,
+        "size_kb": None,
+        "status_code": None,
+        "images_kb": None,
+        "scripts_kb": None,
+        "css_kb": None,
+        "resources_unsized": None,
+        "ssl_score": None,
+        "ssl_valid": None,
+        "ssl_days_remaining": None,
+        "ssl_issuer": None,
+        "ssl_version": None,
+        "ssl_cipher": None,
+        "ssl_score_breakdown": None,
+        "http_version": None,
+        "cdn_provider": None,
+        "compression_type": None,
+        "security_headers_score": None,
+        "security_headers_present": None,
+        "security_headers_missing": None,
+        "server_location": None,
+        "connection_reuse_benefit": None,
+        "dns_breakdown": None,
+    }
+
+    if not url.startswith("http"):
+        url = "http://" + url
+    out["url"] = url
+
+    hostname = tldextract.extract(url)
+    hostname = ".".join(part for part in [hostname.domain, hostname.suffix] if part)
+    use_tls = url.startswith("https://")
+    request_host = httpx.URL(url).host
+    port = httpx.URL(url).port or (443 if use_tls else 80)
+
+    # DNS, alongside the resolver benchmark which does not depend on it
+    dns_task = measure_dns_async(hostname, timeout=deadline.timeout(5.0))
+    if check_advanced and has_dnspython:
+        (dns_ms, ip), out["dns_breakdown"] = await asyncio.gather(
+            dns_task, advanced_dns_lookup_async(hostname, deadline=deadline.timeout(DNS_BENCH_DEADLINE))
+        )
+    else:
+        dns_ms, ip = await dns_task
+    out["dns"] = round(dns_ms, 2) if dns_ms else None
+    out["ip"] = ip
+    stage_done("dns", error=ip is None)
+    if out["dns_breakdown"] is not None:
+        stage_done("dns_breakdown", error=not any(out["dns_breakdown"].values()))
+
+    # Connection probe of the host requested, as in the thread engine: TCP
+    # connect, TLS handshake and certificate scoring. Phase times are
+    # cumulative from the start of the request, DNS lookup included,
+    # matching the thread engine's tcp/ssl/ttfb/total.
+    probe_stage = "ssl" if use_tls else "connect"
+    if stage_allowed(probe_stage):
+        probe_failed = False
+        try:
+            # Resolved before the clock starts, like the thread engine's pinned fetch
+            probe_ip = ip if request_host == hostname else await asyncio.to_thread(dns_cache.resolve, request_host)
+            connect_ms, handshake_ms, ssl_info = await probe_connection_async(
+                request_host, probe_ip, port, use_tls, timeout=deadline.timeout(10), measure_resumption=check_advanced
+            )
+            out["tcp"] = round((dns_ms or 0) + connect_ms, 2)
+            if handshake_ms is not None:
+                out["ssl"] = round(out["tcp"] + handshake_ms, 2)
+            if ssl_info:
+                out.update(ssl_info)
+        except Exception:
+            probe_failed = True
+            if use_tls:
+                out.update(
+                    {"ssl_score": 0, "ssl_valid": 0, "ssl_score_breakdown": {"Error": "SSL check failed"}}
+                )
+        stage_done(probe_stage, error=probe_failed)
+
+    # Main request: one fetch feeds timings, headers, compression and HTML.
+    # It runs on a cold connection of its own, not the shared pool, and the
+    # DNS time is added so ttfb/total span what the thread engine's do
+    response = None
+    if stage_allowed("fetch"):
+        try:
+            async with cold_client(deadline.timeout(30)) as cold:
+                # httpx timeouts are per operation; wait_for bounds the whole transfer
+                response, body, ttfb, total = await asyncio.wait_for(
+                    fetch_async(cold, url, timeout=deadline.timeout(30)), deadline.timeout(30)
+                )
+            out["ttfb"] = round((dns_ms or 0) + ttfb, 2)
+            out["total"] = round((dns_ms or 0) + total, 2)
+            out["status_code"] = response.status_code
+            out["size_kb"] = round(response.num_bytes_downloaded / 1024, 2)
+        except Exception:
+            response = None
+        stage_done("fetch", error=response is None)
+
+    if response is not None:
+        if check_advanced:
+            out["http_version"] = HTTP_VERSION_MAP.get(response.http_version, "Unknown")
+            out["cdn_provider"] = detect_cdn(response.headers, hostname)
+            out["compression_type"] = check_compression(response.headers)
+
+            sec_headers = security_headers_score(response.headers)
+            out["security_headers_score"] = sec_headers["score"]
+            out["security_headers_present"] = sec_headers["present"]
+            out["security_headers_missing"] = sec_headers["missing"]
+            stage_done("headers")
+
+            run_location = bool(ip) and stage_allowed("location")
+            run_reuse = stage_allowed("connection_reuse")
+            location_task = (
+                get_server_location_async(client, ip, timeout=deadline.timeout(5))
+                if run_location else asyncio.sleep(0)
+            )
+            reuse_task = (
+                check_connection_reuse_async(url, timeout=deadline.timeout(10), deadline=deadline)
+                if run_reuse else asyncio.sleep(0)
+            )
+            location, conn_reuse = await asyncio.gather(location_task, reuse_task)
+            if run_location:
+                out["server_location"] = location
+                stage_done("location", error=location == "Unknown")
+            if run_reuse:
+                if conn_reuse:
+                    out["connection_reuse_benefit"] = conn_reuse["benefit"]
+                    out["connection_reuse"] = conn_reuse
+                stage_done("connection_reuse", error=not conn_reuse)
+
+        # Resource breakdown
+        if fetch_resources and stage_allowed("resources"):
+            try:
+                breakdown = await resource_breakdown_async(
+                    client,
+                    # Resolve relative resources against where redirects ended, as the thread engine does
+                    str(response.url) or url,
+                    response.content,
+                    max_resources=resource_limit,
+                    encoding=response.charset_encoding,
+                    deadline=deadline,
+                )
+                out.update(breakdown)
+                resources_failed = breakdown["resources_unsized"] > 0
+            except Exception:
+                resources_failed = True
+            stage_done("resources", error=resources_failed)
+
+    # Ensure SSL score is set
+    if out.get("ssl_score") is None:
+        out["ssl_score"] = 0
+
+    return out
@@ -0,0 +1,196 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+from urllib.parse import urlsplit
+
+# Global cap on URLs analyzed at once, and cap on URLs sharing one host
+MAX_CONCURRENCY = int(os.environ.get("ANALYZER_MAX_CONCURRENCY", "16"))
+PER_HOST_CONCURRENCY = int(os.environ.get("ANALYZER_PER_HOST_CONCURRENCY", "2"))
+
+# The async engine keeps probes on one event loop, so it can afford far more
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ANALYZER_ASYNC_MAX_CONCURRENCY", "256"))
+
+# How many not-yet-runnable URLs may be held back per free worker slot
+DEFER_FACTOR = 64
+
+
+def url_host(url: str) -> str:
+    """Return the lowercase host of a URL, tolerating missing schemes"""
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        return (urlsplit(url).hostname or url).lower()
+    except ValueError:
+        return url.lower()
+
+
+def clamp_concurrency(requested: Optional[int], ceiling: int) -> int:
+    """Clamp a caller supplied concurrency value to [1, ceiling]"""
+    if not requested:
+        return ceiling
+    return max(1, min(int(requested), ceiling))
+
+
+def run_batch(
+    urls: Iterable[str],
+    worker: Callable[[str], dict],
+    on_result: Callable[[int, str, Optional[dict], Optional[BaseException]], None],
+    max_concurrency: Optional[int] = None,
+    per_host: Optional[int] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> int:
+    """Run worker(url) concurrently for every URL and report each outcome.
+
+    URLs are pulled lazily from the iterable, so generators of any size are
+    fine. At most max_concurrency workers run at once and at most per_host of
+    them target the same host; URLs whose host is saturated are held back
+    until a slot frees up. on_result(index, url, result, error) is always
+    invoked from the calling thread, so callers can update shared state and
+    write to the database without extra locking. Once should_stop() returns
+    True no further URLs are started; running ones are still reported.
+    Returns the number of URLs processed.
+    """
+    max_concurrency = clamp_concurrency(max_concurrency, MAX_CONCURRENCY)
+    per_host = clamp_concurrency(per_host, PER_HOST_CONCURRENCY)
+    max_deferred = max_concurrency * DEFER_FACTOR
+
+    source = enumerate(urls)
+    exhausted = False
+    deferred = {}  # host -> deque[(index, url)]
+    deferred_count = 0
+    active_by_host = {}
+    running = {}  # future -> (index, url, host)
+    processed = 0
+
+    def can_start(host):
+        return len(running) < max_concurrency and active_by_host.get(host, 0) < per_host
+
+    def start(ex, index, url, host):
+        active_by_host[host] = active_by_host.get(host, 0) + 1
+        running[ex.submit(worker, url)] = (index, url, host)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as ex:
+        while True:
+            if should_stop is not None and not exhausted and should_stop():
+                exhausted = True
+                deferred.clear()
+                deferred_count = 0
+
+            # Held-back URLs first, so hosts are served in arrival order
+            for host in list(deferred):
+                queue = deferred[host]
+                while queue and can_start(host):
+                    index, url = queue.popleft()
+                    deferred_count -= 1
+                    start(ex, index, url, host)
+                if not queue:
+                    del deferred[host]
+
+            while not exhausted and len(running) < max_concurrency and deferred_count < max_deferred:
+                try:
+                    index, url = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                host = url_host(url)
+                if host not in deferred and can_start(host):
+                    start(ex, index, url, host)
+                else:
+                    deferred.setdefault(host, deque()).append((index, url))
+                    deferred_count += 1
+
+            if not running:
+                if exhausted and not deferred_count:
+                    break
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                index, url, host = running.pop(fut)
+                active_by_host[host] -= 1
+                if not active_by_host[host]:
+                    del active_by_host[host]
+                error = fut.exception()
+                on_result(index, url, None if error else fut.result(), error)
+                processed += 1
+
+    return processed
+
+
+async def _aenumerate(urls: Union[Iterable[str], AsyncIterable[str]]):
+    if hasattr(urls, "__aiter__"):
+        index = 0
+        async for url in urls:
+            yield index, url
+            index += 1
+    else:
+        for item in enumerate(urls):
+            yield item
+
+
+async def run_batch_async(
+    urls: Union[Iterable[str], AsyncIterable[str]],
+    worker: Callable[[str], Awaitable[dict]],
+    on_result: Callable[[int, str, Optional[dict], Optional[BaseException]], None],
+    max_concurrency: Optional[int] = None,
+    per_host: Optional[int] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> int:
+    """Event-loop counterpart of run_batch for coroutine workers.
+
+    Same contract as run_batch: URLs are consumed lazily (an async iterable
+    is awaited between URLs, so it may wait for more to arrive), at most
+    max_concurrency workers await at once and at most per_host per host.
+    on_result runs on the event loop and must not block. Cancelling the
+    caller cancels every worker still running.
+    """
+    max_concurrency = clamp_concurrency(max_concurrency, ASYNC_MAX_CONCURRENCY)
+    per_host = clamp_concurrency(per_host, PER_HOST_CONCURRENCY)
+
+    global_limit = asyncio.Semaphore(max_concurrency)
+    # Bounds how many tasks (running or waiting on their host) exist at once
+    pending_limit = asyncio.Semaphore(max_concurrency * DEFER_FACTOR)
+    host_limits = {}
+    tasks = set()
+    processed = 0
+
+    async def run_one(index, url, host):
+        nonlocal processed
+        host_limit = host_limits.setdefault(host, [asyncio.Semaphore(per_host), 0])
+        host_limit[1] += 1
+        try:
+            # Host slot first, so a saturated host never holds a global slot
+            async with host_limit[0], global_limit:
+                if should_stop is not None and should_stop():
+                    return
+                try:
+                    result, error = await worker(url), None
+                except Exception as e:
+                    result, error = None, e
+            on_result(index, url, result, error)
+            processed += 1
+        finally:
+            host_limit[1] -= 1
+            if not host_limit[1]:
+                del host_limits[host]
+            pending_limit.release()
+
+    source = _aenumerate(urls)
+    try:
+        async for index, url in source:
+            await pending_limit.acquire()
+            if should_stop is not None and should_stop():
+                break
+            task = asyncio.create_task(run_one(index, url, url_host(url)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        await source.aclose()
+    return processed
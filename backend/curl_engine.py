@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import pycurl
+
+from batch import url_host
+from http_pool import acquire_curl, release_curl
+
+# Transfers in flight on the multi handle, overall and per host
+CURL_MULTI_MAX_TRANSFERS = int(os.environ.get("ANALYZER_CURL_MULTI_MAX_TRANSFERS", "256"))
+CURL_MULTI_PER_HOST = int(os.environ.get("ANALYZER_CURL_MULTI_PER_HOST", "4"))
+# How long the engine waits on sockets before picking up newly submitted work
+SELECT_TIMEOUT = 0.02
+
+
+class CurlMultiEngine:
+    """Drives many timed curl transfers concurrently from one thread.
+
+    submit() queues a transfer and returns a Future. Transfers join a
+    CurlMulti as slots free up, at most max_transfers overall and per_host
+    per host. Each uses its own cold handle, so libcurl's CONNECT/APPCONNECT/
+    STARTTRANSFER/TOTAL times mean the same as for a standalone perform().
+    A caller that stops waiting hands the Future to cancel(), which drops
+    the transfer or takes it off the multi handle.
+    """
+
+    def __init__(self, max_transfers: int = CURL_MULTI_MAX_TRANSFERS, per_host: int = CURL_MULTI_PER_HOST):
+        self.max_transfers = max_transfers
+        self.per_host = per_host
+        self._multi = pycurl.CurlMulti()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._incoming = deque()  # (host, setup, collect, future) from any thread
+        self._waiting = {}  # host -> deque[(setup, collect, future)], engine thread only
+        self._active = {}  # handle -> (host, collect, future)
+        self._active_by_host = {}
+        self._abandoned = deque()  # futures given up by their callers, from any thread
+        self._thread = None
+
+    def submit(self, url: str, setup: Callable[[pycurl.Curl], None], collect: Callable[[pycurl.Curl], Any]) -> Future:
+        """Queue a transfer; setup(c) sets its options, collect(c) builds the result.
+
+        Both run on the engine thread, so they must not block. A failed
+        transfer resolves the Future with the pycurl.error.
+        """
+        future = Future()
+        with self._lock:
+            self._incoming.append((url_host(url), setup, collect, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="curl-multi", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return future
+
+    def cancel(self, future: Future):
+        """Give up on a submitted transfer.
+
+        A queued transfer is dropped; a running one is removed from the multi
+        handle and its Future fails with a timeout error.
+        """
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            self._abandoned.append(future)
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            incoming = len(self._incoming)
+        return {
+            "active": len(self._active),
+            "waiting": incoming + sum(len(q) for q in list(self._waiting.values())),
+        }
+
+    def _admit(self):
+        with self._lock:
+            incoming, self._incoming = self._incoming, deque()
+        for host, setup, collect, future in incoming:
+            self._waiting.setdefault(host, deque()).append((setup, collect, future))
+
+        for host in list(self._waiting):
+            queue = self._waiting[host]
+            while (
+                queue
+                and len(self._active) < self.max_transfers
+                and self._active_by_host.get(host, 0) < self.per_host
+            ):
+                setup, collect, future = queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                c = acquire_curl()
+                try:
+                    setup(c)
+                    self._multi.add_handle(c)
+                except Exception as e:
+                    c.close()
+                    future.set_exception(e)
+                    continue
+                self._active[c] = (host, collect, future)
+                self._active_by_host[host] = self._active_by_host.get(host, 0) + 1
+            if not queue:
+                del self._waiting[host]
+
+    def _reap(self):
+        with self._lock:
+            abandoned, self._abandoned = self._abandoned, deque()
+        if not abandoned:
+            return
+        handles = {future: c for c, (_, _, future) in self._active.items()}
+        for future in abandoned:
+            c = handles.get(future)
+            if c is not None:
+                self._finish(c, pycurl.error(pycurl.E_OPERATION_TIMEDOUT, "Transfer abandoned by its caller"))
+
+    def _finish(self, c, error):
+        host, collect, future = self._active.pop(c)
+        self._multi.remove_handle(c)
+        self._active_by_host[host] -= 1
+        if not self._active_by_host[host]:
+            del self._active_by_host[host]
+
+        result = None
+        if error is None:
+            try:
+                result = collect(c)
+            except Exception as e:
+                error = e
+        release_curl(c)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _run(self):
+        multi = self._multi
+        while True:
+            self._wakeup.clear()
+            self._admit()
+            self._reap()
+            if not self._active:
+                self._wakeup.wait()
+                continue
+
+            while True:
+                ret, _ = multi.perform()
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            while True:
+                queued, ok, failed = multi.info_read()
+                for c in ok:
+                    self._finish(c, None)
+                for c, errno, message in failed:
+                    self._finish(c, pycurl.error(errno, message))
+                if not queued:
+                    break
+            if self._active:
+                multi.select(SELECT_TIMEOUT)
+
+
+curl_engine = CurlMultiEngine()
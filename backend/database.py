@@ -1,10 +1,320 @@
+import atexit
+import base64
+import json
+import os
+import queue
 import sqlite3
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from stats import histogram_bin, histogram_percentile, percentile
+
+DB_PATH = os.environ.get("ANALYZER_DB_PATH", "results.db")
+
+# Buffered writer: a batch is committed once it holds WRITE_BATCH_SIZE rows
+# or WRITE_FLUSH_INTERVAL seconds after its first row arrived
+WRITE_BATCH_SIZE = int(os.environ.get("ANALYZER_DB_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.environ.get("ANALYZER_DB_FLUSH_INTERVAL", "0.5"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last batch, never corrupt
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=30000",
+)
+
+# runs column -> key in the analyze_site result dict
+RUN_COLUMNS = (
+    ("url", "url"),
+    ("ip", "ip"),
+    ("dns_ms", "dns"),
+    ("tcp_ms", "tcp"),
+    ("ssl_ms", "ssl"),
+    ("ttfb_ms", "ttfb"),
+    ("total_ms", "total"),
+    ("size_kb", "size_kb"),
+    ("status_code", "status_code"),
+    ("images_kb", "images_kb"),
+    ("scripts_kb", "scripts_kb"),
+    ("css_kb", "css_kb"),
+    ("ssl_score", "ssl_score"),
+    ("ssl_valid", "ssl_valid"),
+    ("ssl_days_remaining", "ssl_days_remaining"),
+    ("ssl_issuer", "ssl_issuer"),
+    ("ssl_version", "ssl_version"),
+    ("ssl_cipher", "ssl_cipher"),
+    ("http_version", "http_version"),
+    ("cdn_provider", "cdn_provider"),
+    ("compression_type", "compression_type"),
+    ("security_headers_score", "security_headers_score"),
+    ("server_location", "server_location"),
+    ("connection_reuse_benefit", "connection_reuse_benefit"),
+)
+
+# Columns filled in by save_result rather than copied from the record
+DERIVED_COLUMNS = ("host", "details")
+
+INSERT_RUN_SQL = "INSERT INTO runs ({}) VALUES ({})".format(
+    ", ".join([column for column, _ in RUN_COLUMNS] + list(DERIVED_COLUMNS)),
+    ", ".join("?" for _ in range(len(RUN_COLUMNS) + len(DERIVED_COLUMNS))),
+)
+
+# Everything a history query may project
+HISTORY_FIELDS = ("id", "timestamp") + tuple(column for column, _ in RUN_COLUMNS) + DERIVED_COLUMNS
+# details (the JSON of non-column result fields) is only returned when asked for
+DEFAULT_HISTORY_FIELDS = tuple(f for f in HISTORY_FIELDS if f != "details")
+MAX_HISTORY_LIMIT = 1000
+# Rows fetched per query (and per CSV chunk / Parquet row group) when exporting
+EXPORT_BATCH_SIZE = int(os.environ.get("ANALYZER_EXPORT_BATCH", "5000"))
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_runs_timestamp ON runs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_url_timestamp ON runs (url, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_host_timestamp ON runs (host, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_bucket ON runs_rollup (granularity, bucket)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_host ON runs_rollup (granularity, host, bucket)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_hist_bucket ON runs_rollup_hist (granularity, bucket)",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_hist_host ON runs_rollup_hist (granularity, host, bucket)",
+)
+
+# Trend aggregation. Hour and day buckets are served from rollup tables kept
+# up to date on every insert; minute buckets are computed from raw rows.
+TREND_METRICS = ("dns_ms", "tcp_ms", "ssl_ms", "ttfb_ms", "total_ms", "size_kb")
+BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+}
+ROLLUP_GRANULARITIES = ("hour", "day")
+# Raw minute aggregation is only meant for short windows
+MINUTE_DEFAULT_WINDOW_HOURS = 24
+
+ROLLUP_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS runs_rollup
+    (
+        granularity TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        url TEXT NOT NULL,
+        host TEXT,
+        metric TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum_value REAL NOT NULL,
+        min_value REAL NOT NULL,
+        max_value REAL NOT NULL,
+        PRIMARY KEY (granularity, url, metric, bucket)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS runs_rollup_hist
+    (
+        granularity TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        url TEXT NOT NULL,
+        host TEXT,
+        metric TEXT NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (granularity, url, metric, bucket, bin)
+    ) WITHOUT ROWID
+    """,
+)
+
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO runs_rollup (granularity, bucket, url, host, metric, count, sum_value, min_value, max_value)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, url, metric, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        sum_value = sum_value + excluded.sum_value,
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value)
+"""
+
+UPSERT_HIST_SQL = """
+    INSERT INTO runs_rollup_hist (granularity, bucket, url, host, metric, bin, count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, url, metric, bucket, bin) DO UPDATE SET count = count + excluded.count
+"""
+
+
+def connect() -> sqlite3.Connection:
+    """Open a connection with the shared pragmas applied"""
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+_local = threading.local()
+# Rollup deltas of the write transaction the writer thread is building
+_writer_state = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Long-lived per-thread read connection"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
+
+
+def url_host(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+RECORD_KEYS = {key for _, key in RUN_COLUMNS}
+
+
+def run_values(record: Dict) -> tuple:
+    details = {k: v for k, v in record.items() if k not in RECORD_KEYS}
+    return tuple(record.get(key) for _, key in RUN_COLUMNS) + (
+        url_host(record.get("url")),
+        json.dumps(details, default=str) if details else None,
+    )
+
+
+def row_to_result(row) -> Dict:
+    """Rebuild the analyze_site result dict stored in a runs row"""
+    row = dict(row)
+    result = {key: row.get(column) for column, key in RUN_COLUMNS}
+    if row.get("details"):
+        result.update(json.loads(row["details"]))
+    result["id"] = row.get("id")
+    return result
+
+
+def get_results_by_ids(ids: List[int]) -> Dict[int, Dict]:
+    """Full result dicts for the given runs ids; missing ids are left out"""
+    conn = get_connection()
+    found = {}
+    ids = list(ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT * FROM runs WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+        ).fetchall()
+        for row in rows:
+            found[row["id"]] = row_to_result(row)
+    return found
+
+
+class BufferedWriter:
+    """Single writer thread that groups queued writes into transactions.
+
+    Operations run in submission order, so a clear queued after some inserts
+    only ever sees rows that were saved before it.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Queue fn(cursor, *args) to run inside the next write transaction"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((fn, args, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything queued so far is committed"""
+        self.submit(lambda cursor: None).result(timeout)
+
+    def _run(self):
+        conn = connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if batch[-1][0] is None:
+                    break
+            self._commit(conn, batch)
+            if batch[-1][0] is None:
+                conn.close()
+                return
+
+    def _commit(self, conn, batch):
+        cursor = conn.cursor()
+        outcomes = []
+        rollups = _writer_state.rollups = RollupBatch()
+        try:
+            # Take the write lock up front: with other processes writing, a
+            # transaction that reads before it writes could not be upgraded
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                if fn is None:
+                    outcomes.append((future, None, None))
+                    continue
+                # A failing operation is rolled back alone, not with its batch
+                cursor.execute("SAVEPOINT op")
+                mark = len(rollups)
+                try:
+                    outcomes.append((future, fn(cursor, *args), None))
+                    cursor.execute("RELEASE op")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO op")
+                    cursor.execute("RELEASE op")
+                    rollups.truncate(mark)
+                    outcomes.append((future, None, e))
+            # Rollups of every run in the batch, one upsert per bucket
+            rollups.apply(cursor)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            outcomes = [(future, None, e) for _, _, future in batch]
+        finally:
+            _writer_state.rollups = None
+        for future, value, error in outcomes:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+    def close(self, timeout: Optional[float] = 10):
+        """Commit pending writes and stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put((None, (), Future()))
+            self._thread.join(timeout)
+
+
+writer = BufferedWriter()
+atexit.register(writer.close)
 
-DB_PATH = "results.db"
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
               CREATE TABLE IF NOT EXISTS runs
@@ -68,59 +378,438 @@ def init_db():
                   REAL
               )
               """)
+    new_rollups = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'runs_rollup'"
+    ).fetchone()
+    for table in ROLLUP_TABLES:
+        c.execute(table)
+    migrate(conn)
+    for index in INDEXES:
+        c.execute(index)
+    if new_rollups:
+        rebuild_rollups(conn)
     conn.commit()
     conn.close()
 
-def save_result(record: Dict):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-              INSERT INTO runs (url, ip, dns_ms, tcp_ms, ssl_ms, ttfb_ms, total_ms, size_kb, status_code,
-                                images_kb, scripts_kb, css_kb, ssl_score, ssl_valid, ssl_days_remaining,
-                                ssl_issuer, ssl_version, ssl_cipher, http_version, cdn_provider,
-                                compression_type, security_headers_score, server_location, connection_reuse_benefit)
-              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-              """, (
-                  record.get("url"),
-                  record.get("ip"),
-                  record.get("dns"),
-                  record.get("tcp"),
-                  record.get("ssl"),
-                  record.get("ttfb"),
-                  record.get("total"),
-                  record.get("size_kb"),
-                  record.get("status_code"),
-                  record.get("images_kb"),
-                  record.get("scripts_kb"),
-                  record.get("css_kb"),
-                  record.get("ssl_score"),
-                  record.get("ssl_valid"),
-                  record.get("ssl_days_remaining"),
-                  record.get("ssl_issuer"),
-                  record.get("ssl_version"),
-                  record.get("ssl_cipher"),
-                  record.get("http_version"),
-                  record.get("cdn_provider"),
-                  record.get("compression_type"),
-                  record.get("security_headers_score"),
-                  record.get("server_location"),
-                  record.get("connection_reuse_benefit"),
-              ))
-    conn.commit()
-    conn.close()
+
+def migrate(conn: sqlite3.Connection):
+    """Add columns introduced after the original schema and backfill them"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    if "host" not in existing:
+        conn.execute("ALTER TABLE runs ADD COLUMN host TEXT")
+        while True:
+            rows = conn.execute("SELECT id, url FROM runs WHERE host IS NULL AND url IS NOT NULL LIMIT 10000").fetchall()
+            if not rows:
+                break
+            # Unparseable URLs get "" so the loop doesn't revisit them
+            conn.executemany("UPDATE runs SET host = ? WHERE id = ?", [(url_host(url) or "", id) for id, url in rows])
+            conn.commit()
+    if "details" not in existing:
+        conn.execute("ALTER TABLE runs ADD COLUMN details TEXT")
+
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """Recompute rollup tables from raw runs (used once when they are created)"""
+    conn.execute("DELETE FROM runs_rollup")
+    conn.execute("DELETE FROM runs_rollup_hist")
+    columns = ", ".join(TREND_METRICS)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, timestamp, url, host, {columns} FROM runs WHERE id > ? ORDER BY id LIMIT 10000",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        rollups = RollupBatch()
+        for row in rows:
+            rollups.add(row[1], row[2], row[3], dict(zip(TREND_METRICS, row[4:])))
+        rollups.apply(conn.cursor())
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def bucket_start(timestamp: str, granularity: str) -> str:
+    """Start of the bucket containing a "YYYY-MM-DD HH:MM:SS" timestamp"""
+    if granularity == "minute":
+        return timestamp[:16] + ":00"
+    if granularity == "hour":
+        return timestamp[:13] + ":00:00"
+    return timestamp[:10] + " 00:00:00"
+
+
+class RollupBatch:
+    """Runs waiting to be folded into the rollup tables.
+
+    Runs are summed per bucket in memory, so a batch of inserts costs one
+    upsert per (granularity, bucket, url, metric) and histogram bin, sent
+    with executemany, instead of 24 statements per run.
+    """
+
+    def __init__(self):
+        self._runs = []
+
+    def __len__(self):
+        return len(self._runs)
+
+    def add(self, timestamp: str, url: Optional[str], host: Optional[str], metrics: Dict):
+        if url and timestamp:
+            self._runs.append((timestamp, url, host, metrics))
+
+    def truncate(self, size: int):
+        """Forget runs added after the first size (their insert was rolled back)"""
+        del self._runs[size:]
+
+    def apply(self, cursor):
+        stats = {}  # (granularity, bucket, url, metric) -> [host, count, sum, min, max]
+        bins = {}  # (granularity, bucket, url, metric, bin) -> [host, count]
+        for timestamp, url, host, metrics in self._runs:
+            for granularity in ROLLUP_GRANULARITIES:
+                bucket = bucket_start(timestamp, granularity)
+                for metric in TREND_METRICS:
+                    value = metrics.get(metric)
+                    if value is None:
+                        continue
+                    key = (granularity, bucket, url, metric)
+                    entry = stats.get(key)
+                    if entry is None:
+                        stats[key] = [host, 1, value, value, value]
+                    else:
+                        entry[1] += 1
+                        entry[2] += value
+                        entry[3] = min(entry[3], value)
+                        entry[4] = max(entry[4], value)
+                    counted = bins.setdefault(key + (histogram_bin(value),), [host, 0])
+                    counted[1] += 1
+        self._runs = []
+        if stats:
+            cursor.executemany(
+                UPSERT_ROLLUP_SQL,
+                [(g, b, u, entry[0], m, *entry[1:]) for (g, b, u, m), entry in stats.items()],
+            )
+            cursor.executemany(
+                UPSERT_HIST_SQL,
+                [(g, b, u, entry[0], m, bin_, entry[1]) for (g, b, u, m, bin_), entry in bins.items()],
+            )
+
+
+INSERT_COLUMN_NAMES = [column for column, _ in RUN_COLUMNS] + list(DERIVED_COLUMNS)
+
+
+def insert_run(cursor, values: tuple) -> int:
+    """Insert a run_values() tuple; its rollups are applied when the writer commits the batch"""
+    row_id, timestamp = cursor.execute(INSERT_RUN_SQL + " RETURNING id, timestamp", values).fetchone()
+    row = dict(zip(INSERT_COLUMN_NAMES, values))
+    rollups = getattr(_writer_state, "rollups", None)
+    if rollups is None:
+        # Called outside the writer: nothing else will apply them
+        rollups = RollupBatch()
+        rollups.add(timestamp, row["url"], row["host"], row)
+        rollups.apply(cursor)
+    else:
+        rollups.add(timestamp, row["url"], row["host"], row)
+    return row_id
+
+
+def save_result(record: Dict) -> Future:
+    """Queue a result for the next batched insert; the future yields its row id"""
+    return writer.submit(insert_run, run_values(record))
+
+
+def save_results(records: List[Dict]) -> List[Future]:
+    return [save_result(record) for record in records]
+
+
+def flush(timeout: Optional[float] = None):
+    """Wait until all queued results are committed"""
+    writer.flush(timeout)
+
 
 def get_all_results(limit: int = 100) -> List[Dict]:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM runs ORDER BY timestamp DESC LIMIT ?", (limit,))
-    results = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return results
+    return query_runs(limit)[0]
 
-def clear_history():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+
+def to_db_timestamp(value: str) -> str:
+    """Normalize an ISO-8601 time to the UTC "YYYY-MM-DD HH:MM:SS" form SQLite stores"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def encode_cursor(timestamp: str, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return timestamp, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _run_filters(url, host, since, until, status_code, cdn):
+    """WHERE clauses shared by history pages and exports"""
+    where = []
+    params = []
+    if url:
+        where.append("url = ?")
+        params.append(url)
+    if host:
+        where.append("host = ?")
+        params.append(host.lower())
+    if since:
+        where.append("timestamp >= ?")
+        params.append(to_db_timestamp(since))
+    if until:
+        where.append("timestamp < ?")
+        params.append(to_db_timestamp(until))
+    if status_code is not None:
+        where.append("status_code = ?")
+        params.append(status_code)
+    if cdn:
+        where.append("cdn_provider = ?")
+        params.append(cdn)
+    return where, params
+
+
+def query_runs(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    url: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status_code: Optional[int] = None,
+    cdn: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Newest-first page of runs using keyset pagination.
+
+    Returns (rows, next_cursor); pass next_cursor back to get the following
+    page, it is None on the last one. Raises ValueError on bad arguments.
+    """
+    if fields:
+        unknown = [f for f in fields if f not in HISTORY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # id and timestamp are needed to build the next cursor
+        columns = ["id", "timestamp"] + [f for f in fields if f not in ("id", "timestamp")]
+        select = ", ".join(columns)
+    else:
+        select = ", ".join(DEFAULT_HISTORY_FIELDS)
+    limit = max(1, min(int(limit), MAX_HISTORY_LIMIT))
+
+    where, params = _run_filters(url, host, since, until, status_code, cdn)
+    if cursor:
+        where.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    sql = f"SELECT {select} FROM runs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    # One extra row tells us whether another page exists
+    params.append(limit + 1)
+
+    rows = [dict(row) for row in get_connection().execute(sql, params).fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+def history_columns(fields: Optional[List[str]] = None) -> List[str]:
+    """Validated runs columns to project; DEFAULT_HISTORY_FIELDS when none are given"""
+    if not fields:
+        return list(DEFAULT_HISTORY_FIELDS)
+    unknown = [f for f in fields if f not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+
+def column_types(columns: List[str]) -> Dict[str, str]:
+    """Declared SQLite type of each runs column ("INTEGER", "REAL", "TEXT", "DATETIME")"""
+    declared = {row["name"]: row["type"].upper() for row in get_connection().execute("PRAGMA table_info(runs)")}
+    return {column: declared.get(column, "TEXT") for column in columns}
+
+
+def iter_runs(
+    columns: List[str],
+    url: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status_code: Optional[int] = None,
+    cdn: Optional[str] = None,
+    limit: Optional[int] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[List[tuple]]:
+    """Oldest-first runs rows (tuples of columns), in batches of batch_size.
+
+    Batches are fetched with the same keyset as history pages, each in its
+    own short read, so an export of any size holds one batch in memory and
+    never pins a WAL snapshot while the client downloads. Rows written
+    during the export are included if they sort after the last batch.
+    Call history_columns() and to_db_timestamp() first to validate input.
+    """
+    where, params = _run_filters(url, host, since, until, status_code, cdn)
+    sql = f"SELECT id, timestamp, {', '.join(columns)} FROM runs"
+    remaining = limit
+    last = None
+    while remaining is None or remaining > 0:
+        clauses = where + (["(timestamp, id) > (?, ?)"] if last else [])
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        query = sql + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY timestamp, id LIMIT ?"
+        rows = get_connection().execute(query, params + list(last or ()) + [size]).fetchall()
+        if not rows:
+            return
+        last = (rows[-1][1], rows[-1][0])
+        if remaining is not None:
+            remaining -= len(rows)
+        yield [tuple(row)[2:] for row in rows]
+        if len(rows) < size:
+            return
+
+
+def _aggregate_filters(url, urls, host, since, until, granularity):
+    """WHERE clauses shared by raw and rollup trend queries"""
+    where = []
+    params = []
+    if url:
+        urls = [url] + list(urls or [])
+    if urls:
+        where.append(f"url IN ({', '.join('?' for _ in urls)})")
+        params.extend(urls)
+    if host:
+        where.append("host = ?")
+        params.append(host.lower())
+    if since:
+        where.append("{time} >= ?")
+        params.append(bucket_start(to_db_timestamp(since), granularity))
+    if until:
+        where.append("{time} < ?")
+        params.append(to_db_timestamp(until))
+    return where, params
+
+
+def aggregate_runs(
+    granularity: str = "hour",
+    metrics: Optional[List[str]] = None,
+    url: Optional[str] = None,
+    urls: Optional[List[str]] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict]:
+    """Bucketed min/avg/p50/p95/max per metric for one URL or a group of them.
+
+    Rows matching any of url/urls (and host, if given) are merged into one
+    series. Hour and day percentiles come from log-scale histograms and are
+    accurate to about 5%; minute buckets are exact. Raises ValueError on bad
+    arguments.
+    """
+    if granularity not in BUCKET_FORMATS:
+        raise ValueError(f"granularity must be one of {', '.join(BUCKET_FORMATS)}")
+    metrics = list(metrics or TREND_METRICS)
+    unknown = [m for m in metrics if m not in TREND_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}")
+
+    if granularity == "minute":
+        if not since:
+            since = (datetime.now(timezone.utc) - timedelta(hours=MINUTE_DEFAULT_WINDOW_HOURS)).isoformat()
+        return _aggregate_raw(metrics, url, urls, host, since, until)
+    return _aggregate_rollups(granularity, metrics, url, urls, host, since, until)
+
+
+def _aggregate_raw(metrics, url, urls, host, since, until) -> List[Dict]:
+    where, params = _aggregate_filters(url, urls, host, since, until, "minute")
+    sql = f"SELECT timestamp, {', '.join(metrics)} FROM runs"
+    if where:
+        sql += " WHERE " + " AND ".join(where).format(time="timestamp")
+    sql += " ORDER BY timestamp"
+
+    buckets = {}
+    for row in get_connection().execute(sql, params):
+        values = buckets.setdefault(bucket_start(row[0], "minute"), {m: [] for m in metrics})
+        for metric, value in zip(metrics, row[1:]):
+            if value is not None:
+                values[metric].append(value)
+
+    series = []
+    for bucket, values in buckets.items():
+        series.append({
+            "bucket": bucket,
+            "metrics": {
+                metric: _summary(
+                    len(v), sum(v), min(v) if v else None, max(v) if v else None,
+                    percentile(v, 50), percentile(v, 95),
+                )
+                for metric, v in values.items()
+            },
+        })
+    return series
+
+
+def _aggregate_rollups(granularity, metrics, url, urls, host, since, until) -> List[Dict]:
+    where, params = _aggregate_filters(url, urls, host, since, until, granularity)
+    where = ["granularity = ?", f"metric IN ({', '.join('?' for _ in metrics)})"] + where
+    params = [granularity] + metrics + params
+    clause = " AND ".join(where).format(time="bucket")
+    conn = get_connection()
+
+    stats = conn.execute(
+        f"""SELECT bucket, metric, SUM(count), SUM(sum_value), MIN(min_value), MAX(max_value)
+            FROM runs_rollup WHERE {clause} GROUP BY bucket, metric""",
+        params,
+    ).fetchall()
+    hists = {}
+    for bucket, metric, bin_index, count in conn.execute(
+        f"""SELECT bucket, metric, bin, SUM(count) FROM runs_rollup_hist
+            WHERE {clause} GROUP BY bucket, metric, bin""",
+        params,
+    ):
+        hists.setdefault((bucket, metric), {})[bin_index] = count
+
+    buckets = {}
+    for bucket, metric, count, total, low, high in stats:
+        counts = hists.get((bucket, metric), {})
+        buckets.setdefault(bucket, {m: _summary(0, 0, None, None, None, None) for m in metrics})[metric] = _summary(
+            count, total, low, high,
+            histogram_percentile(counts, 50, low, high),
+            histogram_percentile(counts, 95, low, high),
+        )
+    return [{"bucket": bucket, "metrics": buckets[bucket]} for bucket in sorted(buckets)]
+
+
+def _summary(count, total, low, high, p50, p95) -> Dict:
+    def r(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        "count": count,
+        "min": r(low),
+        "avg": r(total / count) if count else None,
+        "p50": r(p50),
+        "p95": r(p95),
+        "max": r(high),
+    }
+
+
+def _delete_runs(cursor):
+    rollups = getattr(_writer_state, "rollups", None)
+    if rollups is not None:
+        # Runs inserted earlier in this batch are deleted below with the rest
+        rollups.truncate(0)
     cursor.execute("DELETE FROM runs")
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    cursor.execute("DELETE FROM runs_rollup")
+    cursor.execute("DELETE FROM runs_rollup_hist")
+
+
+def clear_history():
+    # Goes through the writer so rows still queued are cleared too
+    writer.submit(_delete_runs).result()
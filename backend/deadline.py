@@ -0,0 +1,43 @@
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+# Wall-clock budget for analyzing one URL, shared by all of its stages
+URL_BUDGET_SECONDS = float(os.environ.get("ANALYZER_URL_BUDGET", "45"))
+# Largest budget a request may ask for
+MAX_URL_BUDGET_SECONDS = 300
+
+
+class Deadline:
+    """Time budget for one URL, plus the cancel flag of the task it belongs to.
+
+    Stages check expired before starting and size their timeouts with
+    timeout(cap), so later stages only get what earlier ones left over.
+    The cancel event is shared by every URL of a task; setting it expires
+    all of their deadlines at once.
+    """
+
+    def __init__(self, budget: Optional[float] = URL_BUDGET_SECONDS, cancel_event: Optional[threading.Event] = None):
+        # None means no budget; 0 is a budget that has already run out
+        self.expires_at = math.inf if budget is None else time.monotonic() + budget
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or self.remaining() <= 0
+
+    def remaining(self) -> float:
+        """Seconds left (inf without a budget, 0 once cancelled)"""
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap: float) -> float:
+        """A stage's usual timeout, shortened to the remaining budget"""
+        return min(cap, self.remaining())
@@ -0,0 +1,189 @@
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import dns.resolver
+
+    has_dnspython = True
+except ImportError:
+    has_dnspython = False
+
+DNS_CACHE_SIZE = int(os.environ.get("ANALYZER_DNS_CACHE_SIZE", "4096"))
+# TTL used when the answer came from the system resolver, which hides it
+DNS_DEFAULT_TTL = int(os.environ.get("ANALYZER_DNS_DEFAULT_TTL", "60"))
+# Record TTLs are clamped to this range so 0s and week-long TTLs stay sane
+DNS_MIN_TTL = 5
+DNS_MAX_TTL = 3600
+# Failed lookups are remembered briefly so dead hosts aren't re-queried per stage
+DNS_NEGATIVE_TTL = 10
+
+
+class DNSCache:
+    """Process-wide hostname -> IPv4 cache with TTL expiry and LRU eviction"""
+
+    def __init__(self, max_size: int = DNS_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # hostname -> (ip, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, hostname: str):
+        """Return (found, ip) for a fresh entry without resolving"""
+        key = hostname.lower().rstrip(".")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            ip, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, ip
+
+    def put(self, hostname: str, ip: Optional[str], ttl: Optional[float] = None):
+        """Store a lookup result; ip=None records a negative answer"""
+        if ttl is None:
+            ttl = DNS_DEFAULT_TTL if ip else DNS_NEGATIVE_TTL
+        elif ip:
+            ttl = max(DNS_MIN_TTL, min(ttl, DNS_MAX_TTL))
+        key = hostname.lower().rstrip(".")
+        with self._lock:
+            self._entries[key] = (ip, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def seed(self, hostname: str, ip: Optional[str]):
+        """Record an IP learned elsewhere unless a fresher entry exists"""
+        if ip and ip != hostname and not self.get(hostname)[0]:
+            self.put(hostname, ip)
+
+    def resolve(self, hostname: str) -> Optional[str]:
+        """Return an IPv4 address for hostname, from cache when fresh"""
+        if not hostname:
+            return None
+        try:
+            ipaddress.ip_address(hostname.strip("[]"))
+            return hostname
+        except ValueError:
+            pass
+
+        found, ip = self.get(hostname)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return ip
+
+        ip, ttl = lookup(hostname)
+        self.put(hostname, ip, ttl)
+        return ip
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def lookup(hostname: str, timeout: float = 5.0):
+    """Resolve hostname uncached, returning (ip, ttl); ttl is None if unknown"""
+    if has_dnspython:
+        try:
+            answer = dns.resolver.resolve(hostname, "A", lifetime=timeout)
+            return answer[0].to_text(), answer.rrset.ttl
+        except Exception:
+            pass
+    try:
+        infos = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+        return infos[0][4][0], None
+    except Exception:
+        return None, None
+
+
+dns_cache = DNSCache()
+
+
+def resolve(hostname: str) -> Optional[str]:
+    return dns_cache.resolve(hostname)
+
+
+# -----------------------
+# requests integration
+# -----------------------
+
+
+class _CachedDNSMixin:
+    """Connect to the cached IP while keeping the hostname for SNI and Host"""
+
+    def _new_conn(self):
+        ip = resolve(self.host)
+        if not ip:
+            return super()._new_conn()
+        dns_host = self._dns_host
+        self._dns_host = ip
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+
+
+class CachedDNSHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSHTTPConnection
+
+
+class CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections resolve hosts through dns_cache"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CachedDNSHTTPConnectionPool,
+            "https": CachedDNSHTTPSConnectionPool,
+        }
+
+
+def cached_session() -> requests.Session:
+    """Create a requests.Session that resolves hosts through dns_cache"""
+    session = requests.Session()
+    adapter = CachedDNSAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
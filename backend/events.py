@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# Stage events are live-only; a slow stream keeps just the most recent ones
+MAX_PENDING_STAGE_EVENTS = 1000
+
+
+class Subscription:
+    """One streaming client waiting on a task"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.wake = asyncio.Event()
+        self.stages = deque(maxlen=MAX_PENDING_STAGE_EVENTS)
+
+
+class TaskEventHub:
+    """Wakes streaming endpoints when a task gains results or stages finish.
+
+    publish() may be called from worker threads or the event loop; waiting
+    subscribers are woken with call_soon_threadsafe either way.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # task_id -> set[Subscription]
+
+    def subscribe(self, task_id: str) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, task_id: str, sub: Subscription):
+        with self._lock:
+            subs = self._subscribers.get(task_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[task_id]
+
+    def publish(self, task_id: str, stage: Optional[Dict] = None):
+        """Signal new results, or a finished stage when stage is given"""
+        with self._lock:
+            subs = list(self._subscribers.get(task_id, ()))
+        for sub in subs:
+            if stage is not None:
+                sub.stages.append(stage)
+            try:
+                sub.loop.call_soon_threadsafe(sub.wake.set)
+            except RuntimeError:
+                # Loop already closed; the stream is gone
+                pass
+
+
+task_events = TaskEventHub()
@@ -0,0 +1,238 @@
+import csv
+import io
+import math
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+# A PDF page only has room for a few columns; these are used unless fields are given
+PDF_DEFAULT_FIELDS = ("timestamp", "url", "status_code", "dns_ms", "tcp_ms", "ssl_ms", "ttfb_ms", "total_ms", "size_kb")
+
+Batches = Iterable[List[tuple]]
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def stream_csv(columns: List[str], batches: Batches) -> Iterator[bytes]:
+    """CSV with a header row, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands what was written back to the caller"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema(types: Dict[str, str]):
+    """Arrow schema for runs columns given their declared SQLite types"""
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "DATETIME": pa.timestamp("s")}
+    return pa.schema([(column, arrow_types.get(declared, pa.string())) for column, declared in types.items()])
+
+
+def stream_parquet(types: Dict[str, str], batches: Batches) -> Iterator[bytes]:
+    """Parquet file with one row group per batch, sent as each is encoded"""
+    schema = parquet_schema(types)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            arrays = []
+            for index, field in enumerate(schema):
+                if pa.types.is_timestamp(field.type):
+                    # SQLite keeps timestamps as "YYYY-MM-DD HH:MM:SS" text
+                    arrays.append(pa.array(values[index], pa.string()).cast(field.type))
+                else:
+                    arrays.append(pa.array(values[index], field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+class PDFTableWriter:
+    """Writes a PDF table page by page, for exports too big for FPDF.
+
+    FPDF keeps the whole document in memory until output(). Here each page
+    is serialized as soon as it is full; only the byte offset of every
+    object written so far is kept, for the cross-reference table at the
+    end. The page tree (object 2) is referenced by every page and written
+    last, which PDF allows. Text is set in Courier so column widths follow
+    from character counts, shrinking the font to fit all columns across a
+    landscape A4 page.
+    """
+
+    PAGE_WIDTH = 842
+    PAGE_HEIGHT = 595
+    MARGIN = 28
+    MAX_FONT_SIZE = 8.0
+    MIN_FONT_SIZE = 3.0
+    # Courier glyphs are 0.6 em wide
+    CHAR_WIDTH = 0.6
+
+    CATALOG, PAGES, FONT, BOLD_FONT = 1, 2, 3, 4
+
+    def __init__(self, title: str, columns: List[str], types: Dict[str, str]):
+        self.title = title
+        self.columns = columns
+        self.widths = [self._column_width(column, types.get(column, "TEXT")) for column in columns]
+        line_chars = sum(self.widths) + len(self.widths) - 1
+        usable = self.PAGE_WIDTH - 2 * self.MARGIN
+        self.font_size = max(self.MIN_FONT_SIZE, min(self.MAX_FONT_SIZE, usable / (line_chars * self.CHAR_WIDTH)))
+        self.leading = self.font_size * 1.25
+        # Title and header rows take the first lines of each page
+        self.rows_per_page = max(1, math.floor((self.PAGE_HEIGHT - 2 * self.MARGIN) / self.leading) - 3)
+        self._offsets = {}  # object number -> byte offset
+        self._position = 0
+        self._next_object = self.BOLD_FONT + 1
+        self._pages = []
+        self._rows = []
+
+    @staticmethod
+    def _column_width(column: str, declared: str) -> int:
+        if column == "url":
+            width = 48
+        elif column in ("details", "ssl_issuer"):
+            width = 32
+        elif column == "timestamp":
+            width = 19
+        elif declared in ("INTEGER", "REAL"):
+            width = 9
+        else:
+            width = 16
+        return max(width, len(column))
+
+    def _emit(self, number: int, body: bytes) -> bytes:
+        data = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        self._offsets[number] = self._position
+        self._position += len(data)
+        return data
+
+    def _raw(self, data: bytes) -> bytes:
+        self._position += len(data)
+        return data
+
+    @staticmethod
+    def _text(value: str) -> bytes:
+        data = value.encode("cp1252", "replace")
+        return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    def _line(self, cells: List[str]) -> str:
+        return " ".join(
+            (cell if len(cell) <= width else cell[:width - 1] + "~").ljust(width)
+            for cell, width in zip(cells, self.widths)
+        ).rstrip()
+
+    def begin(self) -> bytes:
+        header = self._raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        fonts = [
+            self._emit(number, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % name)
+            for number, name in ((self.FONT, b"Courier"), (self.BOLD_FONT, b"Courier-Bold"))
+        ]
+        return header + b"".join(fonts)
+
+    def add_rows(self, rows: Iterable[tuple]) -> bytes:
+        """Queue rows; returns the pages they completed"""
+        out = []
+        for row in rows:
+            self._rows.append(self._line([_cell(value) for value in row]))
+            if len(self._rows) >= self.rows_per_page:
+                out.append(self._page())
+        return b"".join(out)
+
+    def _page(self) -> bytes:
+        top = self.PAGE_HEIGHT - self.MARGIN - self.font_size
+        lines = [
+            b"BT /F2 %.2f Tf %.2f TL %d %.2f Td" % (self.font_size, self.leading, self.MARGIN, top),
+            b"(%s) Tj T* T*" % self._text(f"{self.title} - page {len(self._pages) + 1}"),
+            b"(%s) Tj T* /F1 %.2f Tf" % (self._text(self._line(self.columns)), self.font_size),
+        ]
+        lines += [b"(%s) Tj T*" % self._text(line) for line in self._rows]
+        lines.append(b"ET")
+        self._rows = []
+        stream = zlib.compress(b"\n".join(lines))
+        content_number, page_number = self._next_object, self._next_object + 1
+        self._next_object += 2
+        self._pages.append(page_number)
+        content = self._emit(
+            content_number, b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        page = self._emit(
+            page_number,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>"
+            % (self.PAGES, self.PAGE_WIDTH, self.PAGE_HEIGHT, content_number, self.FONT, self.BOLD_FONT),
+        )
+        return content + page
+
+    def end(self) -> bytes:
+        """The last page, page tree, catalog and cross-reference table"""
+        out = [self._page()] if self._rows or not self._pages else []
+        kids = b" ".join(b"%d 0 R" % number for number in self._pages)
+        out.append(self._emit(self.PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages))))
+        out.append(self._emit(self.CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES))
+        xref_at = self._position
+        objects = self._next_object
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % objects]
+        xref += [b"%010d 00000 n \n" % self._offsets[number] for number in range(1, objects)]
+        xref.append(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (objects, self.CATALOG, xref_at))
+        return b"".join(out) + b"".join(xref)
+
+
+def stream_pdf(title: str, types: Dict[str, str], batches: Batches) -> Iterator[bytes]:
+    """PDF table of the rows, sent a page at a time"""
+    writer = PDFTableWriter(title, list(types), types)
+    yield writer.begin()
+    for rows in batches:
+        pages = writer.add_rows(rows)
+        if pages:
+            yield pages
+    yield writer.end()
@@ -0,0 +1,230 @@
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import database
+
+# Try to import optional libraries
+try:
+    import maxminddb
+
+    has_maxminddb = True
+except ImportError:
+    has_maxminddb = False
+
+GEO_CACHE_SIZE = int(os.environ.get("ANALYZER_GEO_CACHE_SIZE", "100000"))
+# Server locations rarely move; entries are re-fetched after this many seconds
+GEO_CACHE_TTL = int(os.environ.get("ANALYZER_GEO_CACHE_TTL", str(7 * 86400)))
+# Local MaxMind-format database (GeoLite2-City/Country .mmdb), opened memory-mapped
+GEOIP_DB_PATH = os.environ.get("ANALYZER_GEOIP_DB", "")
+# Never call the online service; locations come from the cache and GEOIP_DB_PATH only
+GEO_OFFLINE = os.environ.get("ANALYZER_GEO_OFFLINE", "0") == "1"
+# Neighbouring addresses share a location: IPv4 /24 and IPv6 /48 prefixes
+IPV4_PREFIX = 24
+IPV6_PREFIX = 48
+# Stored rows are trimmed back to the size limit after this many writes
+PRUNE_EVERY = 1000
+
+GEO_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS geo_cache
+    (
+        key TEXT PRIMARY KEY,
+        location TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+"""
+GEO_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS idx_geo_cache_updated ON geo_cache (updated_at)"
+
+
+def prefix_key(ip: str) -> Optional[str]:
+    """The /24 (or /48) network an address belongs to, or None if it isn't an IP"""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    prefix = IPV4_PREFIX if addr.version == 4 else IPV6_PREFIX
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
+
+
+def format_location(record: Optional[Dict]) -> Optional[str]:
+    """"City, Country" from a GeoIP2/GeoLite2 record"""
+    if not record:
+        return None
+
+    def name(key):
+        return ((record.get(key) or {}).get("names") or {}).get("en")
+
+    country = name("country") or name("registered_country")
+    if not country:
+        return None
+    return f"{name('city') or 'Unknown'}, {country}"
+
+
+def _upsert(cursor, key, location, expires, now):
+    cursor.execute(
+        """
+        INSERT INTO geo_cache (key, location, expires_at, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET
+            location = excluded.location, expires_at = excluded.expires_at, updated_at = excluded.updated_at
+        """,
+        (key, location, expires, now),
+    )
+
+
+def _prune(cursor, keep):
+    cursor.execute(
+        "DELETE FROM geo_cache WHERE key NOT IN (SELECT key FROM geo_cache ORDER BY updated_at DESC LIMIT ?)",
+        (keep,),
+    )
+
+
+def _clear(cursor):
+    cursor.execute("DELETE FROM geo_cache")
+
+
+class GeoCache:
+    """IP and /24 prefix -> "City, Country", kept across runs.
+
+    lookup() answers from an in-memory LRU (loaded from the geo_cache table
+    by warm(), or else the first lookup), then from the local GeoIP database
+    if one is configured; only a miss on both needs the online service,
+    whose answers are fed back with store().
+    """
+
+    def __init__(self, max_size: int = GEO_CACHE_SIZE, ttl: int = GEO_CACHE_TTL, db_path: str = GEOIP_DB_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._reader = None
+        self._entries = OrderedDict()  # "ip" or "net/prefix" -> (location, expires_at)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._writes = 0
+        self.hits = 0
+        self.prefix_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            if self.db_path and has_maxminddb:
+                try:
+                    self._reader = maxminddb.open_database(self.db_path, maxminddb.MODE_MMAP)
+                except (OSError, ValueError):
+                    self._reader = None
+            conn = database.connect()
+            conn.execute(GEO_CACHE_TABLE)
+            conn.execute(GEO_CACHE_INDEX)
+            conn.commit()
+            rows = conn.execute(
+                "SELECT key, location, expires_at FROM geo_cache WHERE expires_at > ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (time.time(), self.max_size),
+            ).fetchall()
+            conn.close()
+            for key, location, expires in reversed(rows):
+                self._entries[key] = (location, expires)
+            self._loaded = True
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """Location without any network call, or None if only the online service can tell"""
+        if not self._loaded:
+            self._load()
+        prefix = prefix_key(ip)
+        now = time.time()
+        with self._lock:
+            location = self._fresh(ip, now)
+            if location is not None:
+                self.hits += 1
+                return location
+            location = self._fresh(prefix, now) if prefix else None
+            if location is not None:
+                self.prefix_hits += 1
+                return location
+
+        if self._reader is not None and prefix:
+            try:
+                location = format_location(self._reader.get(ip))
+            except ValueError:
+                location = None
+            if location is not None:
+                with self._lock:
+                    self.db_hits += 1
+                return location
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, ip: str, location: str):
+        """Remember a location for the address and its prefix"""
+        if not self._loaded:
+            self._load()
+        now = time.time()
+        expires = now + self.ttl
+        keys = [ip]
+        prefix = prefix_key(ip)
+        if prefix:
+            keys.append(prefix)
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (location, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        for key in keys:
+            database.writer.submit(_upsert, key, location, expires, now)
+        if prune:
+            database.writer.submit(_prune, self.max_size)
+
+    def warm(self):
+        """Load the table now instead of on the first lookup"""
+        if not self._loaded:
+            self._load()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.prefix_hits + self.db_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "offline": GEO_OFFLINE,
+                "geoip_db": self.db_path if self._reader is not None else None,
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.prefix_hits = 0
+            self.db_hits = 0
+            self.misses = 0
+        database.writer.submit(_clear).result()
+
+
+geo_cache = GeoCache()
@@ -0,0 +1,196 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional, Tuple, Union
+
+# lxml's C parser is much faster and also takes input in chunks; html.parser is the fallback
+try:
+    from lxml import etree
+
+    has_lxml = True
+except ImportError:
+    has_lxml = False
+
+# Bytes handed to the parser per feed; extraction can stop between chunks
+CHUNK_SIZE = 64 * 1024
+
+IMPORT_RE = re.compile(r"""@import\s+(?:url\(\s*)?["']?([^"')\s;]+)""", re.IGNORECASE)
+PRELOAD_KINDS = {"image": "images", "script": "scripts", "style": "stylesheets"}
+# Only these tags can reference a resource we count
+RESOURCE_TAGS = frozenset(("img", "source", "script", "link"))
+
+
+def first_candidate(srcset: str) -> Optional[str]:
+    """First URL of a srcset; only one candidate is ever downloaded"""
+    for candidate in srcset.split(","):
+        parts = candidate.split()
+        if parts:
+            return parts[0]
+    return None
+
+
+class ResourceExtractor:
+    """Collects image, script and stylesheet URLs from HTML fed in chunks.
+
+    Picks up img/source srcset, link rel=preload/modulepreload and @import
+    in inline styles besides the usual src/href attributes. Each kind keeps
+    URLs in document order without duplicates, up to max_per_kind; feed()
+    returns True once every kind is full so callers can stop reading early.
+    """
+
+    def __init__(self, max_per_kind: Optional[int] = None, encoding: Optional[str] = None):
+        self.max_per_kind = max_per_kind
+        self.images = []
+        self.scripts = []
+        self.stylesheets = []
+        self._seen = {"images": set(), "scripts": set(), "stylesheets": set()}
+        if has_lxml:
+            self._backend = _LxmlBackend(self, encoding)
+        else:
+            self._backend = _StdlibBackend(self, encoding)
+
+    @property
+    def full(self) -> bool:
+        if self.max_per_kind is None:
+            return False
+        return all(len(urls) >= self.max_per_kind for urls in (self.images, self.scripts, self.stylesheets))
+
+    def feed(self, chunk: Union[bytes, str]) -> bool:
+        if not self.full:
+            self._backend.feed(chunk)
+        return self.full
+
+    def close(self) -> Tuple[List[str], List[str], List[str]]:
+        """Flush the parser and return (images, scripts, stylesheets)"""
+        if not self.full:
+            self._backend.close()
+        return self.images, self.scripts, self.stylesheets
+
+    def add(self, kind: str, url: Optional[str]):
+        url = (url or "").strip()
+        if not url or url.startswith("data:"):
+            return
+        urls = getattr(self, kind)
+        if self.max_per_kind is not None and len(urls) >= self.max_per_kind:
+            return
+        if url not in self._seen[kind]:
+            self._seen[kind].add(url)
+            urls.append(url)
+
+    def start_tag(self, tag: str, attrs: dict):
+        if tag == "img":
+            self.add("images", attrs.get("src") or first_candidate(attrs.get("srcset") or ""))
+        elif tag == "source":
+            if attrs.get("srcset"):
+                self.add("images", first_candidate(attrs["srcset"]))
+        elif tag == "script":
+            self.add("scripts", attrs.get("src"))
+        elif tag == "link":
+            rel = (attrs.get("rel") or "").lower().split()
+            href = attrs.get("href")
+            if "stylesheet" in rel:
+                self.add("stylesheets", href)
+            elif "modulepreload" in rel:
+                self.add("scripts", href)
+            elif "preload" in rel:
+                kind = PRELOAD_KINDS.get((attrs.get("as") or "").lower())
+                if kind == "images" and not href:
+                    href = first_candidate(attrs.get("imagesrcset") or "")
+                if kind:
+                    self.add(kind, href)
+
+    def style_text(self, text: str):
+        for url in IMPORT_RE.findall(text):
+            self.add("stylesheets", url)
+
+
+class _StdlibBackend(HTMLParser):
+    def __init__(self, extractor: ResourceExtractor, encoding: Optional[str]):
+        super().__init__()
+        self.extractor = extractor
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._style = None
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        super().feed(chunk)
+
+    def close(self):
+        super().feed(self._decoder.decode(b"", final=True))
+        super().close()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "style":
+            self._style = []
+        elif tag in RESOURCE_TAGS:
+            self.extractor.start_tag(tag, {name: value or "" for name, value in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in RESOURCE_TAGS:
+            self.extractor.start_tag(tag, {name: value or "" for name, value in attrs})
+
+    def handle_data(self, data):
+        if self._style is not None:
+            self._style.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "style" and self._style is not None:
+            self.extractor.style_text("".join(self._style))
+            self._style = None
+
+
+class _LxmlBackend:
+    """lxml parser target: callbacks straight from libxml2, no tree is built"""
+
+    def __init__(self, extractor: ResourceExtractor, encoding: Optional[str]):
+        self.extractor = extractor
+        self._style = None
+        self._parser = etree.HTMLParser(target=self, encoding=encoding)
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+    def close(self):
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            pass
+
+    # Target callbacks
+    def start(self, tag, attrib):
+        if tag == "style":
+            self._style = []
+        elif tag in RESOURCE_TAGS:
+            self.extractor.start_tag(tag, dict(attrib))
+
+    def data(self, data):
+        if self._style is not None:
+            self._style.append(data)
+
+    def end(self, tag):
+        if tag == "style" and self._style is not None:
+            self.extractor.style_text("".join(self._style))
+            self._style = None
+
+
+def iter_chunks(data: Union[bytes, str], size: int = CHUNK_SIZE):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def extract_resources(
+    html: Union[bytes, str, Iterable[Union[bytes, str]]],
+    max_per_kind: Optional[int] = None,
+    encoding: Optional[str] = None,
+) -> Tuple[List[str], List[str], List[str]]:
+    """Return (images, scripts, stylesheets) URLs from a page body or chunk iterable"""
+    extractor = ResourceExtractor(max_per_kind, encoding)
+    chunks = iter_chunks(html) if isinstance(html, (bytes, str)) else html
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    return extractor.close()
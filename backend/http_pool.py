@@ -0,0 +1,85 @@
+import os
+import threading
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+
+import pycurl
+import requests
+
+from dns_cache import CachedDNSAdapter
+
+# Keep-alive connections kept per host by the shared session
+HTTP_POOL_MAXSIZE = int(os.environ.get("ANALYZER_HTTP_POOL_MAXSIZE", "32"))
+# Distinct hosts whose connection pools are kept around
+HTTP_POOL_HOSTS = int(os.environ.get("ANALYZER_HTTP_POOL_HOSTS", "256"))
+# Idle curl handles kept for reuse
+CURL_POOL_SIZE = int(os.environ.get("ANALYZER_CURL_POOL_SIZE", "64"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session for fetches that aren't timed.
+
+    Connections are pooled per host and resolved through dns_cache. Cookies
+    are never stored, so sites can't leak state into each other's requests.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = CachedDNSAdapter(
+                    pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+_idle_curls = []
+_curl_lock = threading.Lock()
+
+
+def acquire_curl() -> pycurl.Curl:
+    """Take a curl handle from the pool (or a new one), set up for a timed transfer.
+
+    Only the handle's allocation is reused: the transfer opens its own
+    connection, does a full TLS handshake and closes the connection after,
+    so CONNECT/APPCONNECT times are never flattered by reuse. Untimed
+    fetches go through get_session(), which keeps connections alive.
+    """
+    with _curl_lock:
+        c = _idle_curls.pop() if _idle_curls else None
+    if c is None:
+        c = pycurl.Curl()
+    c.setopt(pycurl.FRESH_CONNECT, True)
+    c.setopt(pycurl.FORBID_REUSE, True)
+    c.setopt(pycurl.SSL_SESSIONID_CACHE, False)
+    return c
+
+
+def release_curl(c: pycurl.Curl):
+    """Return a handle taken with acquire_curl once its transfer is over"""
+    # reset() clears options but keeps the allocation
+    c.reset()
+    with _curl_lock:
+        if len(_idle_curls) < CURL_POOL_SIZE:
+            _idle_curls.append(c)
+            return
+    c.close()
+
+
+@contextmanager
+def pooled_curl():
+    """Borrow a handle from the pool for the duration of a with block"""
+    c = acquire_curl()
+    try:
+        yield c
+    except BaseException:
+        c.close()
+        raise
+    release_curl(c)
@@ -0,0 +1,307 @@
+import asyncio
+import codecs
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Most distinct URLs one upload may add; the dedupe filter is sized for it
+BULK_MAX_URLS = int(os.environ.get("ANALYZER_BULK_MAX_URLS", "1000000"))
+# Chance that a distinct URL is mistaken for one already seen and skipped
+BULK_FALSE_POSITIVE_RATE = float(os.environ.get("ANALYZER_BULK_FP_RATE", "0.001"))
+# URLs collected before they are grouped by host and handed to the engine
+BULK_WINDOW = int(os.environ.get("ANALYZER_BULK_WINDOW", "5000"))
+# Consecutive URLs of one host in the engine's input, before moving to the next host
+BULK_HOST_RUN = int(os.environ.get("ANALYZER_BULK_HOST_RUN", "8"))
+# Longer lines are not URLs worth analyzing
+MAX_LINE_LENGTH = 8192
+
+# CSV header cells naming the URL column
+URL_COLUMNS = ("url", "urls", "website", "site", "domain", "link")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_WHITESPACE = re.compile(r"\s")
+
+
+def _normalize(raw: str):
+    url = raw.strip()
+    if not url or len(url) > MAX_LINE_LENGTH or _WHITESPACE.search(url):
+        return None, None
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None, None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not host:
+        return None, None
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, "")), host
+
+
+def normalize_url(raw: str) -> Optional[str]:
+    """Canonical form of a URL to analyze, or None if it isn't an http(s) URL.
+
+    The scheme and host are lowercased, default ports and the fragment are
+    dropped; URLs without a scheme get http://, as analyze_site does.
+    """
+    return _normalize(raw)[0]
+
+
+def dedupe_key(url: str) -> str:
+    """Key under which normalized URLs count as the same page: no scheme, no trailing slash"""
+    rest = url.split("://", 1)[1]
+    path, sep, query = rest.partition("?")
+    return path.rstrip("/") + sep + query
+
+
+class BloomFilter:
+    """Fixed-size set membership test with no false negatives.
+
+    Memory is set by capacity and error_rate up front (about 1.8 MB for a
+    million keys at 0.1%) and never grows.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """Add key; returns True if it was (probably) present already"""
+        bits = self._bits
+        present = True
+        for bit in self._positions(key):
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                present = False
+        return present
+
+
+class BulkIngest:
+    """Turns an uploaded URL list into batches for the analysis engines.
+
+    Chunks of an NDJSON or CSV body are fed as they arrive. Each URL is
+    normalized and deduplicated against a Bloom filter, so memory stays
+    constant whatever the upload size; the price is that a distinct URL is
+    now and then taken for a duplicate, so the duplicates count is an upper
+    bound, reported with the filter's error_rate. Accepted URLs are collected into a
+    window, and a full window is released grouped by host: runs of up to
+    host_run URLs of one host, taking hosts in turn, so that consecutive
+    requests reuse connections and DNS answers without one big host
+    holding every worker slot.
+
+    NDJSON lines may be a JSON string, an object with a "url" key or a bare
+    URL. CSV uses the column named by a header (see URL_COLUMNS), or the
+    first column when there is no header.
+    """
+
+    def __init__(self, fmt: str = "ndjson", max_urls: int = BULK_MAX_URLS,
+                 error_rate: float = BULK_FALSE_POSITIVE_RATE, window: int = BULK_WINDOW,
+                 host_run: int = BULK_HOST_RUN):
+        self.fmt = fmt
+        self.max_urls = max_urls
+        self.error_rate = error_rate
+        self.window = max(1, window)
+        self.host_run = max(1, host_run)
+        self._seen = BloomFilter(max_urls, error_rate)
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._partial = ""
+        self._column = None  # CSV URL column, decided by the first row
+        self._hosts = OrderedDict()  # host -> [url], current window
+        self._pending = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.dropped = 0  # distinct URLs past max_urls
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Consume part of the body; returns URLs ready for analysis (often none)"""
+        lines = (self._partial + self._decoder.decode(chunk)).split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_LINE_LENGTH:
+            # Keep memory bounded on garbage without newlines
+            self._partial = ""
+            self.invalid += 1
+        ready = []
+        for line in lines:
+            self._add(line)
+            if self._pending >= self.window:
+                ready += self._release()
+        return ready
+
+    def finish(self) -> List[str]:
+        """End of the body: the remaining URLs"""
+        self._add(self._partial + self._decoder.decode(b"", final=True))
+        self._partial = ""
+        return self._release()
+
+    def summary(self) -> Dict[str, float]:
+        """Counts for the upload; duplicates may include up to about
+        false_positive_rate of the distinct URLs, skipped by mistake"""
+        return {
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "false_positive_rate": self.error_rate,
+            "invalid": self.invalid,
+            "dropped": self.dropped,
+        }
+
+    def _extract(self, line: str) -> Optional[str]:
+        if self.fmt == "csv":
+            try:
+                row = next(csv.reader([line]))
+            except (csv.Error, StopIteration):
+                return None
+            if self._column is None:
+                header = [cell.strip().lower() for cell in row]
+                found = next((i for i, cell in enumerate(header) if cell in URL_COLUMNS), None)
+                self._column = found if found is not None else 0
+                if found is not None:
+                    return ""  # the header row itself
+            return row[self._column] if self._column < len(row) else None
+        if line[:1] in ('"', "{"):
+            try:
+                value = json.loads(line)
+            except ValueError:
+                return None
+            if isinstance(value, dict):
+                value = value.get("url")
+            return value if isinstance(value, str) else None
+        return line
+
+    def _add(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        raw = self._extract(line)
+        if raw == "":
+            return
+        url, host = _normalize(raw) if raw is not None else (None, None)
+        if url is None:
+            self.invalid += 1
+            return
+        key = dedupe_key(url)
+        if self.accepted >= self.max_urls:
+            # Past capacity the filter only answers, or its error rate would climb
+            if key in self._seen:
+                self.duplicates += 1
+            else:
+                self.dropped += 1
+            return
+        if self._seen.add(key):
+            self.duplicates += 1
+            return
+        self.accepted += 1
+        self._hosts.setdefault(host, []).append(url)
+        self._pending += 1
+
+    def _release(self) -> List[str]:
+        turns = deque((urls, 0) for urls in self._hosts.values())
+        self._hosts = OrderedDict()
+        self._pending = 0
+        out = []
+        while turns:
+            urls, start = turns.popleft()
+            out += urls[start:start + self.host_run]
+            if start + self.host_run < len(urls):
+                turns.append((urls, start + self.host_run))
+        return out
+
+
+class UrlSpool:
+    """Append-only URL queue on a temporary file, for one writer and one reader.
+
+    The upload handler appends batches while an engine iterates the spool
+    (from a thread, or with async for on the event loop). The reader waits
+    for more URLs until close() is called. Neither side holds more than a
+    batch in memory.
+    """
+
+    # URLs read from the file at a time
+    READ_BATCH = 256
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._cond = threading.Condition()
+        self._written = 0
+        self._read = 0
+        self._offset = 0
+        self._closed = False
+
+    def extend(self, urls: List[str]):
+        if not urls:
+            return
+        data = "".join(url + "\n" for url in urls).encode("utf-8", "surrogatepass")
+        with self._cond:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self._written += len(urls)
+            self._cond.notify_all()
+
+    def close(self):
+        """No more URLs will be added"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def take(self, limit: int = READ_BATCH) -> List[str]:
+        """Next URLs, waiting for the writer; [] once closed and drained"""
+        with self._cond:
+            while self._read == self._written and not self._closed:
+                self._cond.wait()
+            self._file.seek(self._offset)
+            urls = []
+            while len(urls) < limit and self._read < self._written:
+                urls.append(self._file.readline().decode("utf-8", "surrogatepass").rstrip("\n"))
+                self._read += 1
+            self._offset = self._file.tell()
+            return urls
+
+    def __iter__(self):
+        try:
+            while True:
+                urls = self.take()
+                if not urls:
+                    break
+                yield from urls
+        finally:
+            self._file.close()
+
+    async def __aiter__(self):
+        try:
+            while True:
+                urls = await asyncio.to_thread(self.take)
+                if not urls:
+                    break
+                for url in urls:
+                    yield url
+        finally:
+            self._file.close()
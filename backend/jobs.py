@@ -0,0 +1,419 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import database
+from analyzer import analyze_site
+from database import insert_run, run_values
+from deadline import Deadline, URL_BUDGET_SECONDS
+from tasks import record_task_result
+
+logger = logging.getLogger(__name__)
+
+# Run scheduled jobs inside the API process; turn off when dedicated workers serve the queue
+JOB_RUNNER_ENABLED = os.environ.get("ANALYZER_JOB_RUNNER", "1") == "1"
+# Jobs one process analyzes at once
+JOB_WORKERS = int(os.environ.get("ANALYZER_JOB_WORKERS", "32"))
+# How often a runner dispatches due schedules and claims queued jobs
+JOB_POLL_INTERVAL = float(os.environ.get("ANALYZER_JOB_POLL_INTERVAL", "1"))
+# Runs of a job (first try included) before it is marked failed; retries back off from JOB_RETRY_DELAY
+JOB_MAX_ATTEMPTS = int(os.environ.get("ANALYZER_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = 30.0
+# A leased job not finished this long after its URL budget ran out is assumed lost and re-queued
+JOB_LEASE_MARGIN = 60.0
+# Finished job rows are kept this long
+JOB_RETENTION_SECONDS = int(os.environ.get("ANALYZER_JOB_RETENTION", "86400"))
+MIN_SCHEDULE_INTERVAL = 10
+# Schedules dispatched per tick
+DISPATCH_BATCH = 5000
+PRUNE_EVERY = 300
+
+JOB_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS schedules
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT NOT NULL,
+        interval_seconds INTEGER NOT NULL,
+        options TEXT NOT NULL,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        next_run_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        last_run_at REAL,
+        last_run_id INTEGER,
+        last_error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_schedules_due ON schedules (enabled, next_run_at)",
+    """
+    CREATE TABLE IF NOT EXISTS jobs
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        schedule_id INTEGER,
+        task_id TEXT,
+        url TEXT NOT NULL,
+        options TEXT NOT NULL,
+        status TEXT NOT NULL,
+        run_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        run_id INTEGER,
+        error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_schedule ON jobs (schedule_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+)
+
+
+def job_options(fetch_resources: bool = True, resource_limit: int = 10, check_advanced: bool = True,
+                url_budget: Optional[float] = None) -> Dict:
+    return {
+        "fetch_resources": fetch_resources,
+        "resource_limit": resource_limit,
+        "check_advanced": check_advanced,
+        "url_budget": url_budget or URL_BUDGET_SECONDS,
+    }
+
+
+def _add_schedules(cursor, urls, interval, options, now):
+    ids = []
+    for url in urls:
+        # A random phase spreads schedules created together across the interval
+        cursor.execute(
+            "INSERT INTO schedules (url, interval_seconds, options, next_run_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (url, interval, options, now + random.uniform(0, interval), now),
+        )
+        ids.append(cursor.lastrowid)
+    return ids
+
+
+def _delete_schedule(cursor, schedule_id):
+    cursor.execute("DELETE FROM jobs WHERE schedule_id = ? AND status = 'queued'", (schedule_id,))
+    cursor.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+    return cursor.rowcount
+
+
+def _enqueue(cursor, urls, options, task_id, now):
+    cursor.executemany(
+        "INSERT INTO jobs (task_id, url, options, status, run_at, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+        [(task_id, url, options, now, now) for url in urls],
+    )
+
+
+def _dispatch(cursor, now, limit):
+    """Queue a job for every due schedule and move it to its next slot"""
+    due = cursor.execute(
+        "SELECT id, url, interval_seconds, options, next_run_at FROM schedules "
+        "WHERE enabled = 1 AND next_run_at <= ? ORDER BY next_run_at LIMIT ?",
+        (now, limit),
+    ).fetchall()
+    queued = skipped = 0
+    for schedule_id, url, interval, options, next_run in due:
+        if now - next_run > interval:
+            # Whole intervals were missed (nothing was dispatching): re-spread
+            # the catch-up runs instead of starting them all at once
+            run_at = now + random.uniform(0, interval)
+        else:
+            run_at = next_run
+        cursor.execute(
+            "UPDATE schedules SET next_run_at = ? WHERE id = ? AND next_run_at = ?",
+            (run_at + interval, schedule_id, next_run),
+        )
+        if cursor.rowcount != 1:
+            continue
+        # A run still queued or in progress covers this slot too
+        if cursor.execute(
+            "SELECT 1 FROM jobs WHERE schedule_id = ? AND status IN ('queued', 'leased') LIMIT 1", (schedule_id,)
+        ).fetchone():
+            skipped += 1
+            continue
+        cursor.execute(
+            "INSERT INTO jobs (schedule_id, url, options, status, run_at, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (schedule_id, url, options, run_at, now),
+        )
+        queued += 1
+    return queued, skipped
+
+
+def _claim(cursor, owner, limit, now, max_attempts):
+    """Lease up to limit runnable jobs, including ones whose lease ran out"""
+    abandoned = cursor.execute(
+        "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_owner = NULL, finished_at = ? "
+        "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ? RETURNING task_id, url",
+        (now, now, max_attempts),
+    ).fetchall()
+    for task_id, url in abandoned:
+        if task_id is not None:
+            record_task_result(cursor, task_id, url, None, "lease expired", now)
+    rows = cursor.execute(
+        """
+        UPDATE jobs SET status = 'leased', lease_owner = ?, attempts = attempts + 1,
+            lease_expires = ? + ? + COALESCE(json_extract(options, '$.url_budget'), ?)
+        WHERE id IN (
+            SELECT id FROM jobs
+            WHERE (status = 'queued' AND run_at <= ?) OR (status = 'leased' AND lease_expires < ?)
+            ORDER BY run_at LIMIT ?
+        )
+        RETURNING id, schedule_id, task_id, url, options, attempts
+        """,
+        (owner, now, JOB_LEASE_MARGIN, URL_BUDGET_SECONDS, now, now, limit),
+    ).fetchall()
+    return [
+        {
+            "id": row[0],
+            "schedule_id": row[1],
+            "task_id": row[2],
+            "url": row[3],
+            "options": json.loads(row[4]),
+            "attempts": row[5],
+        }
+        for row in rows
+    ]
+
+
+def _poll(cursor, owner, limit, now, max_attempts, dispatch_limit):
+    queued, skipped = _dispatch(cursor, now, dispatch_limit)
+    jobs = _claim(cursor, owner, limit, now, max_attempts) if limit > 0 else []
+    return queued, skipped, jobs
+
+
+def _complete(cursor, job_id, owner, task_id, url, values, now):
+    cursor.execute(
+        "UPDATE jobs SET status = 'done', lease_owner = NULL, error = NULL, finished_at = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+        (now, job_id, owner),
+    )
+    if cursor.rowcount != 1:
+        # The lease ran out and the job went to another worker; its result wins
+        return None
+    if task_id is not None:
+        run_id = record_task_result(cursor, task_id, url, values, None, now)
+    else:
+        run_id = insert_run(cursor, values)
+    cursor.execute("UPDATE jobs SET run_id = ? WHERE id = ?", (run_id, job_id))
+    cursor.execute(
+        "UPDATE schedules SET last_run_at = ?, last_run_id = ?, last_error = NULL "
+        "WHERE id = (SELECT schedule_id FROM jobs WHERE id = ?)",
+        (now, run_id, job_id),
+    )
+    return run_id
+
+
+def _fail(cursor, job_id, owner, task_id, url, error, attempts, now, max_attempts):
+    if attempts < max_attempts:
+        cursor.execute(
+            "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, error = ?, run_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (error, now + JOB_RETRY_DELAY * 2 ** (attempts - 1), job_id, owner),
+        )
+        return "retry"
+    cursor.execute(
+        "UPDATE jobs SET status = 'failed', lease_owner = NULL, error = ?, finished_at = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+        (error, now, job_id, owner),
+    )
+    if task_id is not None and cursor.rowcount == 1:
+        record_task_result(cursor, task_id, url, None, error, now)
+    cursor.execute(
+        "UPDATE schedules SET last_run_at = ?, last_error = ? WHERE id = (SELECT schedule_id FROM jobs WHERE id = ?)",
+        (now, error, job_id),
+    )
+    return "failed"
+
+
+def _prune(cursor, cutoff):
+    cursor.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+
+class JobQueue:
+    """Recurring schedules and the durable job queue they feed, in the results database.
+
+    Any number of processes may dispatch and claim: schedules only move to
+    their next slot once, and a claimed job is leased to one owner until
+    it finishes or its lease runs out, when another worker picks it up.
+    """
+
+    def __init__(self, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        conn = database.connect()
+        for statement in JOB_TABLES:
+            conn.execute(statement)
+        # Queues created before one-off task jobs existed
+        if "task_id" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN task_id TEXT")
+        conn.commit()
+        conn.close()
+
+    def add_schedules(self, urls: List[str], interval: int, options: Dict) -> List[int]:
+        return database.writer.submit(_add_schedules, urls, interval, json.dumps(options), time.time()).result()
+
+    def delete_schedule(self, schedule_id: int) -> bool:
+        return database.writer.submit(_delete_schedule, schedule_id).result() > 0
+
+    def schedules(self, limit: int = 1000) -> List[Dict]:
+        rows = database.get_connection().execute(
+            "SELECT id, url, interval_seconds, options, enabled, next_run_at, last_run_at, last_run_id, last_error "
+            "FROM schedules ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [dict(row, options=json.loads(row["options"]), enabled=bool(row["enabled"])) for row in rows]
+
+    def enqueue(self, urls: List[str], options: Dict, task_id: Optional[str] = None):
+        """Queue one-off jobs, run as soon as a worker is free; results of a task's jobs go to the task"""
+        database.writer.submit(_enqueue, urls, json.dumps(options), task_id, time.time()).result()
+
+    def poll(self, owner: str, limit: int, dispatch_limit: int = DISPATCH_BATCH):
+        """Queue jobs for due schedules, then lease up to limit runnable jobs to owner.
+
+        Returns (jobs queued, runs coalesced into one still pending, leased jobs).
+        """
+        return database.writer.submit(
+            _poll, owner, limit, time.time(), self.max_attempts, dispatch_limit
+        ).result()
+
+    def complete(self, job: Dict, owner: str, result: Dict):
+        return database.writer.submit(
+            _complete, job["id"], owner, job.get("task_id"), job["url"], run_values(result), time.time()
+        )
+
+    def fail(self, job: Dict, owner: str, error: str):
+        return database.writer.submit(
+            _fail, job["id"], owner, job.get("task_id"), job["url"], error, job["attempts"], time.time(),
+            self.max_attempts,
+        )
+
+    def prune(self, retention: float = JOB_RETENTION_SECONDS):
+        database.writer.submit(_prune, time.time() - retention)
+
+    def counts(self) -> Dict[str, int]:
+        rows = database.get_connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update({row[0]: row[1] for row in rows})
+        counts["schedules"] = database.get_connection().execute("SELECT COUNT(*) FROM schedules").fetchone()[0]
+        return counts
+
+
+def make_owner() -> str:
+    """Lease owner id, unique per process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def run_job(job: Dict) -> Dict:
+    """Analyze a job's URL with its options"""
+    options = job["options"]
+    return analyze_site(
+        job["url"],
+        options.get("fetch_resources", True),
+        options.get("resource_limit", 10),
+        options.get("check_advanced", True),
+        deadline=Deadline(options.get("url_budget") or URL_BUDGET_SECONDS),
+    )
+
+
+class JobRunner:
+    """Background loop that dispatches schedules and runs claimed jobs on threads.
+
+    Each tick queues due schedules, then leases as many jobs as there are
+    idle workers; results are saved like any other run.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = make_owner()
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._ticks = 0
+        self.dispatched = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Job runner tick failed")
+            self._stop.wait(self.poll_interval)
+
+    def tick(self):
+        with self._lock:
+            idle = self.workers - self._active
+        queued, skipped, jobs = self.queue.poll(self.owner, idle)
+        with self._lock:
+            self.dispatched += queued
+            self.coalesced += skipped
+        for job in jobs:
+            with self._lock:
+                self._active += 1
+            self._executor.submit(self._execute, job)
+        self._ticks += 1
+        if self._ticks % PRUNE_EVERY == 0:
+            self.queue.prune()
+
+    def _execute(self, job: Dict):
+        # The outcome is committed by the database writer; the worker moves on at once
+        try:
+            result = run_job(job)
+        except Exception as e:
+            self.queue.fail(job, self.owner, str(e))
+            with self._lock:
+                if job["attempts"] < self.queue.max_attempts:
+                    self.retried += 1
+                else:
+                    self.failed += 1
+        else:
+            self.queue.complete(job, self.owner, result)
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "owner": self.owner,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "workers": self.workers,
+                "active": self._active,
+                "dispatched": self.dispatched,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "retried": self.retried,
+                "failed": self.failed,
+            }
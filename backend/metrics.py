@@ -0,0 +1,95 @@
+import time
+from typing import Dict, Optional
+
+# Try to import optional libraries
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+
+    has_prometheus = True
+except ImportError:
+    has_prometheus = False
+
+# Stage durations span sub-millisecond header checks to 30s fetches
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+if has_prometheus:
+    STAGE_SECONDS = Histogram(
+        "analyzer_stage_seconds", "Wall time of each analyze_site stage", ["engine", "stage"], buckets=STAGE_BUCKETS
+    )
+    STAGE_ERRORS = Counter("analyzer_stage_errors_total", "Stages that failed or gave no result", ["engine", "stage"])
+    STAGE_SKIPPED = Counter(
+        "analyzer_stage_skipped_total", "Stages skipped because the URL's deadline ran out or it was cancelled",
+        ["engine", "stage"],
+    )
+    ANALYSIS_SECONDS = Histogram(
+        "analyzer_analysis_seconds", "Wall time of a whole analyze_site run", ["engine"], buckets=STAGE_BUCKETS
+    )
+    ACTIVE_ANALYSES = Gauge("analyzer_active_analyses", "URLs being analyzed right now", ["engine"])
+    TASKS = Gauge("analyzer_tasks", "Analysis tasks known to the task store", ["state"])
+    PENDING_URLS = Gauge("analyzer_pending_urls", "URLs of running tasks not analyzed yet")
+    CURL_TRANSFERS = Gauge("analyzer_curl_transfers", "Timed transfers on the CurlMulti engine", ["state"])
+    HOST_SLOTS_ACTIVE = Gauge("analyzer_host_slots_active", "Outbound requests holding a politeness slot")
+
+
+class StageTimer:
+    """Per-run stage clock: each mark() closes the stage that just finished.
+
+    A stage's time is the wall time since the previous mark (or the start),
+    so stages that overlap in the async engine are charged to whichever
+    finished last. Timings and failed stages end up on the result dict.
+    """
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.timings = {}
+        self.errors = []
+        self.skipped = []
+        if has_prometheus:
+            ACTIVE_ANALYSES.labels(engine).inc()
+
+    def mark(self, stage: str, error: bool = False):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.timings[stage] = round(self.timings.get(stage, 0) + elapsed * 1000, 2)
+        if error:
+            self.errors.append(stage)
+        if has_prometheus:
+            STAGE_SECONDS.labels(self.engine, stage).observe(elapsed)
+            if error:
+                STAGE_ERRORS.labels(self.engine, stage).inc()
+
+    def skip(self, stage: str):
+        """Record a stage that never ran; the time until now stays with the next mark"""
+        self.skipped.append(stage)
+        if has_prometheus:
+            STAGE_SKIPPED.labels(self.engine, stage).inc()
+
+    def finish(self, out: Optional[Dict]):
+        """Attach timings to the result and close the run"""
+        total = time.perf_counter() - self.started
+        if out is not None:
+            out["stage_timings"] = self.timings
+            out["stage_errors"] = self.errors
+            out["stage_skipped"] = self.skipped
+        if has_prometheus:
+            ANALYSIS_SECONDS.labels(self.engine).observe(total)
+            ACTIVE_ANALYSES.labels(self.engine).dec()
+
+
+def render(task_counts: Optional[Dict[str, int]] = None, curl_stats: Optional[Dict] = None,
+           host_stats: Optional[Dict] = None):
+    """Refresh the point-in-time gauges and return (body, content_type)"""
+    if task_counts is not None:
+        TASKS.labels("running").set(task_counts.get("running", 0))
+        TASKS.labels("finished").set(task_counts.get("finished", 0))
+        PENDING_URLS.set(task_counts.get("pending_urls", 0))
+    if curl_stats is not None:
+        CURL_TRANSFERS.labels("active").set(curl_stats["active"])
+        CURL_TRANSFERS.labels("waiting").set(curl_stats["waiting"])
+    if host_stats is not None:
+        HOST_SLOTS_ACTIVE.set(host_stats["active"])
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,214 @@
+import asyncio
+import email.utils
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+# Requests in flight to one host, and its sustained/burst request rate
+HOST_CONCURRENCY = int(os.environ.get("ANALYZER_HOST_CONCURRENCY", "4"))
+HOST_RATE = float(os.environ.get("ANALYZER_HOST_RATE", "10"))
+HOST_BURST = float(os.environ.get("ANALYZER_HOST_BURST", "10"))
+# Per-host rate overrides as "host=requests_per_second,..."; ip-api.com's
+# free tier allows 45 requests per minute
+HOST_RATE_OVERRIDES = os.environ.get("ANALYZER_HOST_RATE_OVERRIDES", "ip-api.com=0.75")
+# Back-off after 429/503 without Retry-After doubles from BACKOFF_BASE up to BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = float(os.environ.get("ANALYZER_BACKOFF_MAX", "300"))
+# Idle host states are dropped once more than this many are tracked
+MAX_TRACKED_HOSTS = 10000
+# How often async waiters re-check a host that is at its concurrency limit
+ASYNC_POLL_INTERVAL = 0.01
+
+
+class HostBusy(Exception):
+    """No request slot for the host became available within the timeout"""
+
+
+def parse_rate_overrides(spec: str) -> Dict[str, float]:
+    """Parse "host=rate,..." into {host: rate}, skipping malformed entries and rates <= 0"""
+    rates = {}
+    for entry in (spec or "").split(","):
+        host, _, rate = entry.strip().partition("=")
+        try:
+            rate = float(rate)
+        except ValueError:
+            continue
+        if rate > 0:
+            rates[host.strip().lower()] = rate
+    return rates
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostState:
+    __slots__ = ("rate", "tokens", "updated", "active", "blocked_until", "failures")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = now
+        self.active = 0
+        self.blocked_until = 0.0
+        self.failures = 0
+
+
+class PolitenessScheduler:
+    """Process-wide per-host request budget for every outbound probe.
+
+    A request to a host waits until fewer than per_host requests to it are
+    in flight, a token is available in its bucket (rate per second, up to
+    burst) and any back-off from a 429/503 has passed. Timed measurements
+    wait before their clock starts, so queuing never shows up in timings.
+    """
+
+    def __init__(
+        self,
+        per_host: int = HOST_CONCURRENCY,
+        rate: float = HOST_RATE,
+        burst: float = HOST_BURST,
+        overrides: Optional[Dict[str, float]] = None,
+    ):
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.overrides = parse_rate_overrides(HOST_RATE_OVERRIDES) if overrides is None else overrides
+        self._hosts = {}  # host -> _HostState
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.timeouts = 0
+
+    def _state(self, host: str, now: float) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            if len(self._hosts) >= MAX_TRACKED_HOSTS:
+                self._drop_idle(now)
+            rate = self.overrides.get(host, self.rate)
+            state = self._hosts[host] = _HostState(rate, min(self.burst, max(1.0, rate)), now)
+        return state
+
+    def _drop_idle(self, now: float):
+        for host, state in list(self._hosts.items()):
+            if not state.active and state.blocked_until <= now and not state.failures:
+                del self._hosts[host]
+
+    def _try_acquire(self, host: str) -> Optional[float]:
+        """Take a slot and a token: 0 on success, else seconds to wait (None: until a release)"""
+        now = time.monotonic()
+        state = self._state(host, now)
+        if state.blocked_until > now:
+            return state.blocked_until - now
+        if state.active >= self.per_host:
+            return None
+        burst = min(self.burst, max(1.0, state.rate))
+        state.tokens = min(burst, state.tokens + (now - state.updated) * state.rate)
+        state.updated = now
+        if state.tokens < 1:
+            return (1 - state.tokens) / state.rate
+        state.tokens -= 1
+        state.active += 1
+        return 0
+
+    def acquire(self, host: str, timeout: Optional[float] = None):
+        """Block until a request to host may start; raises HostBusy on timeout"""
+        host = (host or "").lower()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                wait = self._try_acquire(host)
+                if wait == 0:
+                    return
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise HostBusy(host)
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    async def acquire_async(self, host: str, timeout: Optional[float] = None):
+        """acquire() for the event loop: never blocks it while waiting"""
+        host = (host or "").lower()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                wait = self._try_acquire(host)
+                if wait == 0:
+                    return
+                if wait is None:
+                    wait = ASYNC_POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise HostBusy(host)
+                    wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+    def release(self, host: str):
+        host = (host or "").lower()
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is not None and state.active:
+                state.active -= 1
+            self._cond.notify_all()
+
+    def report(self, host: str, status: Optional[int], headers=None):
+        """Feed back a response status; 429/503 pause the host (Retry-After or exponential)"""
+        host = (host or "").lower()
+        with self._cond:
+            state = self._state(host, time.monotonic())
+            if status in (429, 503):
+                delay = parse_retry_after(headers.get("Retry-After") if headers is not None else None)
+                if delay is None:
+                    delay = BACKOFF_BASE * 2 ** state.failures
+                state.failures += 1
+                state.blocked_until = max(state.blocked_until, time.monotonic() + min(delay, BACKOFF_MAX))
+                self.throttled += 1
+            elif status is not None and status < 500:
+                state.failures = 0
+
+    @contextmanager
+    def slot(self, host: str, timeout: Optional[float] = None):
+        self.acquire(host, timeout)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    @asynccontextmanager
+    async def async_slot(self, host: str, timeout: Optional[float] = None):
+        await self.acquire_async(host, timeout)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "hosts": len(self._hosts),
+                "active": sum(state.active for state in self._hosts.values()),
+                "backing_off": sorted(h for h, s in self._hosts.items() if s.blocked_until > now),
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+                "per_host": self.per_host,
+                "rate": self.rate,
+            }
+
+
+scheduler = PolitenessScheduler()
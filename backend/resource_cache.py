@@ -0,0 +1,235 @@
+import email.utils
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import database
+
+RESOURCE_CACHE_SIZE = int(os.environ.get("ANALYZER_RESOURCE_CACHE_SIZE", "50000"))
+# Cap on how long any response is trusted without revalidation
+RESOURCE_CACHE_MAX_TTL = int(os.environ.get("ANALYZER_RESOURCE_CACHE_MAX_TTL", str(7 * 86400)))
+# Fraction of a Last-Modified age used as freshness when no explicit lifetime is given
+HEURISTIC_FRACTION = 0.1
+# Stored rows are trimmed back to the size limit after this many writes
+PRUNE_EVERY = 1000
+
+RESOURCE_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS resource_cache
+    (
+        url TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        expires_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+"""
+RESOURCE_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS idx_resource_cache_updated ON resource_cache (updated_at)"
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def expires_at(headers, now: float) -> Optional[float]:
+    """When a response stops being fresh, or None if it must not be stored"""
+    cc = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return now
+
+    lifetime = None
+    for directive in ("s-maxage", "max-age"):
+        try:
+            lifetime = int(cc[directive])
+            break
+        except (KeyError, TypeError, ValueError):
+            pass
+    if lifetime is None:
+        expires = _http_date(headers.get("Expires"))
+        date = _http_date(headers.get("Date")) or now
+        if expires is not None:
+            lifetime = expires - date
+        else:
+            last_modified = _http_date(headers.get("Last-Modified"))
+            lifetime = (date - last_modified) * HEURISTIC_FRACTION if last_modified else 0
+    try:
+        lifetime -= int(headers.get("Age") or 0)
+    except ValueError:
+        pass
+    return now + max(0, min(lifetime, RESOURCE_CACHE_MAX_TTL))
+
+
+def _upsert(cursor, url, size, etag, last_modified, expires, now):
+    cursor.execute(
+        """
+        INSERT INTO resource_cache (url, size, etag, last_modified, expires_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (url) DO UPDATE SET
+            size = excluded.size, etag = excluded.etag, last_modified = excluded.last_modified,
+            expires_at = excluded.expires_at, updated_at = excluded.updated_at
+        """,
+        (url, size, etag, last_modified, expires, now),
+    )
+
+
+def _prune(cursor, keep):
+    cursor.execute(
+        "DELETE FROM resource_cache WHERE url NOT IN "
+        "(SELECT url FROM resource_cache ORDER BY updated_at DESC LIMIT ?)",
+        (keep,),
+    )
+
+
+def _clear(cursor):
+    cursor.execute("DELETE FROM resource_cache")
+
+
+class ResourceCache:
+    """Absolute URL -> size/validators/expiry for page resources, kept across runs.
+
+    Entries live in an in-memory LRU loaded from the resource_cache table
+    by warm() (or else the first lookup); stores are written back through
+    the database writer. Once warm, lookups never touch SQLite and are safe
+    on the event loop.
+    """
+
+    def __init__(self, max_size: int = RESOURCE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # url -> (size, etag, last_modified, expires_at)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._writes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            conn = database.connect()
+            conn.execute(RESOURCE_CACHE_TABLE)
+            conn.execute(RESOURCE_CACHE_INDEX)
+            conn.commit()
+            rows = conn.execute(
+                "SELECT url, size, etag, last_modified, expires_at FROM resource_cache "
+                "ORDER BY updated_at LIMIT ? OFFSET max(0, (SELECT COUNT(*) FROM resource_cache) - ?)",
+                (self.max_size, self.max_size),
+            ).fetchall()
+            conn.close()
+            for url, *entry in rows:
+                self._entries[url] = tuple(entry)
+            self._loaded = True
+
+    def _get(self, url):
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def fresh_size(self, url: str) -> Optional[int]:
+        """Cached size in bytes if the entry is still fresh, counting a hit"""
+        entry = self._get(url)
+        if entry is not None and entry[3] > time.time():
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+        return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match/If-Modified-Since for a stale entry, empty if none"""
+        entry = self._get(url)
+        headers = {}
+        if entry is not None:
+            if entry[1]:
+                headers["If-None-Match"] = entry[1]
+            if entry[2]:
+                headers["If-Modified-Since"] = entry[2]
+        return headers
+
+    def not_modified(self, url: str, headers) -> Optional[int]:
+        """Handle a 304: extend the entry's freshness and return its size"""
+        entry = self._get(url)
+        if entry is None:
+            return None
+        size, etag, last_modified, _ = entry
+        with self._lock:
+            self.revalidated += 1
+        self._put(url, size, headers.get("ETag") or etag, headers.get("Last-Modified") or last_modified, headers)
+        return size
+
+    def store(self, url: str, size: int, headers):
+        """Record a freshly fetched resource"""
+        with self._lock:
+            self.misses += 1
+        self._put(url, size, headers.get("ETag"), headers.get("Last-Modified"), headers)
+
+    def _put(self, url, size, etag, last_modified, headers):
+        now = time.time()
+        expires = expires_at(headers, now)
+        if expires is None or (expires <= now and not etag and not last_modified):
+            # Nothing to reuse: neither fresh nor revalidatable
+            return
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            self._entries[url] = (size, etag, last_modified, expires)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        database.writer.submit(_upsert, url, size, etag, last_modified, expires, now)
+        if prune:
+            database.writer.submit(_prune, self.max_size)
+
+    def warm(self):
+        """Load the table now instead of on the first lookup"""
+        if not self._loaded:
+            self._load()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.revalidated + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.revalidated = 0
+            self.misses = 0
+        database.writer.submit(_clear).result()
+
+
+resource_cache = ResourceCache()
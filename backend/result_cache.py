@@ -0,0 +1,189 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from deadline import Deadline
+from ingest import dedupe_key, normalize_url
+
+# How long a finished analysis answers repeat requests for the same URL and
+# options; 0 disables caching and coalescing
+RESULT_CACHE_TTL = float(os.environ.get("ANALYZER_RESULT_CACHE_TTL", "30"))
+RESULT_CACHE_SIZE = int(os.environ.get("ANALYZER_RESULT_CACHE_SIZE", "1000"))
+# How often a thread waiting on a shared analysis checks its task's cancel flag
+WAIT_SLICE = 0.1
+
+
+def result_key(url: str, fetch_resources: bool, resource_limit: int, check_advanced: bool) -> Tuple:
+    """Cache key: normalized URL plus the options that change what is measured.
+
+    As in bulk deduplication a trailing slash makes no difference, but the
+    scheme does: http and https are measured separately.
+    """
+    normalized = normalize_url(url)
+    return (
+        f"{normalized.split('://', 1)[0]}://{dedupe_key(normalized)}" if normalized else url,
+        bool(fetch_resources),
+        resource_limit if fetch_resources else 0,
+        bool(check_advanced),
+    )
+
+
+def _wait_timeout(deadline: Optional[Deadline]) -> Optional[float]:
+    remaining = deadline.remaining() if deadline is not None else math.inf
+    return None if remaining == math.inf else remaining
+
+
+def _wait_shared(future: Future, deadline: Optional[Deadline]):
+    """The leader's (result, started_at); None if the deadline runs out or is cancelled first"""
+    while True:
+        remaining = deadline.remaining() if deadline is not None else math.inf
+        if remaining <= 0:
+            return None
+        try:
+            return future.result(timeout=min(WAIT_SLICE, remaining))
+        except FutureTimeout:
+            pass
+
+
+def _complete(result: Optional[Dict]) -> bool:
+    # Results cut short by a deadline or cancellation, or with resources left
+    # unmeasured, are never shared
+    return result is not None and not result.get("stage_skipped") and not result.get("resources_unsized")
+
+
+class ResultCache:
+    """Short-lived cache of analyze_site results with single-flight coalescing.
+
+    A request whose key was analyzed within max_age seconds (at most the
+    cache TTL) gets a copy of that result. Otherwise, if an analysis of the
+    key started within that window is still running, the request waits for
+    it instead of probing the site again. Only results with every stage
+    run are shared; when the shared analysis fails or is cut short, waiters
+    run their own. Copies carry cached=True and cache_age (seconds since the
+    measurement started), and are not saved to history again.
+
+    Threads (run) and event loops (run_async) share entries and in-flight
+    analyses.
+    """
+
+    def __init__(self, ttl: float = RESULT_CACHE_TTL, max_size: int = RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (result, measured_at)
+        self._inflight = {}  # key -> (Future, started_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    @staticmethod
+    def _copy(result: Dict, measured_at: float) -> Dict:
+        return {**result, "cached": True, "cache_age": round(max(0.0, time.time() - measured_at), 3)}
+
+    def _begin(self, key: Tuple, max_age: Optional[float]):
+        """("hit", result), ("wait", (future, started_at)), ("lead", future) or ("run", None)"""
+        now = time.time()
+        fresh = self.ttl if max_age is None else min(self.ttl, max_age)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= fresh:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return "hit", self._copy(*entry)
+            flight = self._inflight.get(key)
+            if flight is not None and flight[1] >= now - fresh:
+                self.coalesced += 1
+                return "wait", flight
+            self.misses += 1
+            if flight is not None:
+                # Too old for this caller; it measures on its own
+                return "run", None
+            future = Future()
+            self._inflight[key] = (future, now)
+            return "lead", future
+
+    def _finish(self, key: Tuple, future: Future, result: Optional[Dict]):
+        shared = dict(result) if _complete(result) else None
+        with self._lock:
+            started_at = self._inflight.pop(key)[1]
+            if shared is not None:
+                self._entries[key] = (shared, started_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        future.set_result((shared, started_at))
+
+    def run(self, key: Tuple, analyze: Callable[[], Dict], max_age: Optional[float] = None,
+            deadline: Optional[Deadline] = None) -> Dict:
+        """analyze() through the cache, from a worker thread"""
+        if self.ttl <= 0:
+            return analyze()
+        kind, value = self._begin(key, max_age)
+        if kind == "hit":
+            return value
+        if kind == "wait":
+            shared, started_at = _wait_shared(value[0], deadline) or (None, None)
+            return self._copy(shared, started_at) if shared is not None else analyze()
+        if kind == "run":
+            return analyze()
+        result = None
+        try:
+            result = analyze()
+            return result
+        finally:
+            self._finish(key, value, result)
+
+    async def run_async(self, key: Tuple, analyze: Callable[[], Awaitable[Dict]], max_age: Optional[float] = None,
+                        deadline: Optional[Deadline] = None) -> Dict:
+        """Event-loop counterpart of run; cancelling a waiter leaves the shared analysis running"""
+        if self.ttl <= 0:
+            return await analyze()
+        kind, value = self._begin(key, max_age)
+        if kind == "hit":
+            return value
+        if kind == "wait":
+            try:
+                shared, started_at = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(value[0])), _wait_timeout(deadline)
+                )
+            except asyncio.TimeoutError:
+                shared = None
+            return self._copy(shared, started_at) if shared is not None else await analyze()
+        if kind == "run":
+            return await analyze()
+        result = None
+        try:
+            result = await analyze()
+            return result
+        finally:
+            self._finish(key, value, result)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "in_flight": len(self._inflight),
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        """Drop cached results; analyses in flight still finish for their waiters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.coalesced = 0
+            self.misses = 0
+
+
+result_cache = ResultCache()
@@ -0,0 +1,107 @@
+import math
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Linear-interpolated percentile (0-100) of values, None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Optional[Dict]:
+    """min/median/p95/max of a sample, rounded for reporting"""
+    if not values:
+        return None
+    return {
+        "min": round(min(values), 2),
+        "median": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "max": round(max(values), 2),
+    }
+
+
+# Two-sided 95% Student t critical values by degrees of freedom; between
+# entries the next lower df is used, which errs on the wide side
+T_CRITICAL_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+    10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def t_critical(df: float) -> float:
+    if df >= 1000:
+        return 1.960
+    return T_CRITICAL_95[max([k for k in T_CRITICAL_95 if k <= df] or [1])]
+
+
+def mean_ci(values: List[float]) -> Optional[Dict]:
+    """Mean with a 95% confidence interval (None with fewer than two values)"""
+    if not values:
+        return None
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return {"mean": round(mean, 2), "ci95": None}
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    half = t_critical(n - 1) * math.sqrt(variance / n)
+    return {"mean": round(mean, 2), "ci95": [round(mean - half, 2), round(mean + half, 2)]}
+
+
+def difference_ci(a: List[float], b: List[float]) -> Optional[List[float]]:
+    """95% confidence interval of mean(a) - mean(b) (Welch's t)"""
+    if len(a) < 2 or len(b) < 2:
+        return None
+    mean_a, mean_b = sum(a) / len(a), sum(b) / len(b)
+    var_a = sum((v - mean_a) ** 2 for v in a) / (len(a) - 1) / len(a)
+    var_b = sum((v - mean_b) ** 2 for v in b) / (len(b) - 1) / len(b)
+    se = math.sqrt(var_a + var_b)
+    if se == 0:
+        return [round(mean_a - mean_b, 2)] * 2
+    df = (var_a + var_b) ** 2 / (var_a ** 2 / (len(a) - 1) + var_b ** 2 / (len(b) - 1))
+    half = t_critical(df) * se
+    return [round(mean_a - mean_b - half, 2), round(mean_a - mean_b + half, 2)]
+
+
+# Log-scale histogram used by the rollup tables. Each bin spans a factor of
+# HISTOGRAM_GROWTH, so percentiles read from merged bins are within ~5% of exact.
+HISTOGRAM_GROWTH = 1.1
+ZERO_BIN = -100000  # values <= 0
+
+
+def histogram_bin(value: float) -> int:
+    if value <= 0:
+        return ZERO_BIN
+    return math.floor(math.log(value, HISTOGRAM_GROWTH))
+
+
+def histogram_value(bin_index: int) -> float:
+    """Representative (geometric midpoint) value of a bin"""
+    if bin_index == ZERO_BIN:
+        return 0.0
+    return HISTOGRAM_GROWTH ** (bin_index + 0.5)
+
+
+def histogram_percentile(counts: Dict[int, int], pct: float, low: float = None, high: float = None) -> Optional[float]:
+    """Approximate percentile from {bin: count}, clamped to the known min/max"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    target = max(1, math.ceil(total * pct / 100))
+    seen = 0
+    for bin_index in sorted(counts):
+        seen += counts[bin_index]
+        if seen >= target:
+            value = histogram_value(bin_index)
+            break
+    if low is not None:
+        value = max(value, low)
+    if high is not None:
+        value = min(value, high)
+    return value
@@ -0,0 +1,306 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import database
+from database import get_results_by_ids, insert_run, run_values, save_result
+
+# Finished tasks are dropped after TASK_TTL_SECONDS, or sooner once more than
+# TASK_MAX_FINISHED of them exist (least recently finished first).
+TASK_TTL_SECONDS = float(os.environ.get("ANALYZER_TASK_TTL", "3600"))
+TASK_MAX_FINISHED = int(os.environ.get("ANALYZER_TASK_MAX_FINISHED", "1000"))
+# "memory" keeps tasks in this process; "sqlite" shares them across workers
+TASK_STORE = os.environ.get("ANALYZER_TASK_STORE", "memory")
+
+MISSING_RESULT = "Result no longer available"
+
+
+def _materialize(entries: List) -> List[Dict]:
+    """Turn stored entries (runs ids or inline dicts) into result dicts"""
+    ids = [e for e in entries if isinstance(e, int)]
+    rows = get_results_by_ids(ids) if ids else {}
+    out = []
+    for entry in entries:
+        if isinstance(entry, int):
+            out.append(rows.get(entry) or {"id": entry, "error": MISSING_RESULT})
+        else:
+            out.append(entry)
+    return out
+
+
+class MemoryTaskStore:
+    """In-process task registry with TTL/LRU eviction of finished tasks.
+
+    Results are held as runs row ids once the writer has committed them;
+    until then (and for failed URLs and cached copies) the dict itself is kept.
+    """
+
+    # Streams are woken by the in-process event hub, no polling needed
+    poll_interval = None
+
+    def __init__(self, ttl: float = TASK_TTL_SECONDS, max_finished: int = TASK_MAX_FINISHED):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._tasks = {}
+        self._finished = OrderedDict()  # task_id -> finished_at, oldest first
+        self._lock = threading.Lock()
+
+    def create(self, task_id: str, total: int) -> None:
+        with self._lock:
+            self._evict()
+            self._tasks[task_id] = {
+                "status": "running",
+                "progress": 0,
+                "total": total,
+                "entries": [],
+            }
+
+    def record(self, task_id: str, url: str, result: Optional[Dict], error: Optional[BaseException]) -> Optional[Future]:
+        """Store one finished URL; returns the pending database write, if any"""
+        task = self._tasks[task_id]
+        entries = task["entries"]
+        future = None
+        if error is None and result.get("cached"):
+            # A copy of a result saved by the run that measured it
+            entries.append(result)
+        elif error is None:
+            index = len(entries)
+            entries.append(result)
+            try:
+                future = save_result(result)
+            except Exception:
+                future = None
+            if future is not None:
+                future.add_done_callback(lambda f: self._swap(entries, index, f))
+        else:
+            entries.append({"url": url, "error": str(error)})
+        task["progress"] += 1
+        return future
+
+    def add_total(self, task_id: str, count: int, settle: bool = False):
+        """Grow a task whose URLs are still arriving; settle finishes it if every URL is in"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+            task["total"] += count
+            if settle and task["progress"] >= task["total"] and task_id not in self._finished:
+                task["status"] = "completed"
+                self._finished[task_id] = time.monotonic()
+
+    @staticmethod
+    def _swap(entries: List, index: int, future: Future):
+        # Once the row is committed, drop the dict and keep only its id
+        if future.exception() is None:
+            entries[index] = future.result()
+
+    def finish(self, task_id: str, status: str = "completed") -> None:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                task["status"] = status
+                self._finished[task_id] = time.monotonic()
+
+    def status(self, task_id: str) -> Optional[Dict]:
+        """Task status without results, or None if unknown/evicted"""
+        with self._lock:
+            self._evict()
+            task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        return {"status": task["status"], "progress": task["progress"], "total": task["total"]}
+
+    def results(self, task_id: str, offset: int = 0) -> List[Dict]:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return []
+        return _materialize(task["entries"][offset:])
+
+    def counts(self) -> Dict[str, int]:
+        """Running/finished tasks and URLs of running tasks still to analyze"""
+        with self._lock:
+            finished = len(self._finished)
+            pending = sum(
+                task["total"] - task["progress"]
+                for task_id, task in self._tasks.items()
+                if task_id not in self._finished
+            )
+            return {"running": len(self._tasks) - finished, "finished": finished, "pending_urls": pending}
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._finished:
+            task_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff and len(self._finished) <= self.max_finished:
+                break
+            del self._finished[task_id]
+            self._tasks.pop(task_id, None)
+
+
+TASK_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS tasks
+    (
+        task_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        progress INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished_at)",
+    """
+    CREATE TABLE IF NOT EXISTS task_results
+    (
+        task_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        run_id INTEGER,
+        error TEXT,
+        PRIMARY KEY (task_id, seq)
+    ) WITHOUT ROWID
+    """,
+)
+
+
+def _create_task(cursor, task_id, total, now, cutoff, max_finished):
+    # Expire old finished tasks while we're writing anyway
+    expired = """
+        SELECT task_id FROM tasks WHERE finished_at IS NOT NULL AND (finished_at < ? OR task_id NOT IN (
+            SELECT task_id FROM tasks WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?))
+    """
+    cursor.execute(f"DELETE FROM task_results WHERE task_id IN ({expired})", (cutoff, max_finished))
+    cursor.execute(f"DELETE FROM tasks WHERE task_id IN ({expired})", (cutoff, max_finished))
+    cursor.execute(
+        "INSERT INTO tasks (task_id, status, progress, total, created_at) VALUES (?, 'running', 0, ?, ?)",
+        (task_id, total, now),
+    )
+
+
+def _record_result(cursor, task_id, seq, values, error):
+    run_id = insert_run(cursor, values) if values is not None else None
+    cursor.execute(
+        "INSERT INTO task_results (task_id, seq, run_id, error) VALUES (?, ?, ?, ?)",
+        (task_id, seq, run_id, error),
+    )
+    cursor.execute("UPDATE tasks SET progress = progress + 1 WHERE task_id = ?", (task_id,))
+    return run_id
+
+
+def _settle_task(cursor, task_id, now):
+    cursor.execute(
+        "UPDATE tasks SET status = 'completed', finished_at = ? "
+        "WHERE task_id = ? AND finished_at IS NULL AND progress >= total",
+        (now, task_id),
+    )
+
+
+def _add_total(cursor, task_id, count, settle, now):
+    cursor.execute("UPDATE tasks SET total = total + ? WHERE task_id = ?", (count, task_id))
+    if settle:
+        _settle_task(cursor, task_id, now)
+
+
+def record_task_result(cursor, task_id, url, values, error, now):
+    """Writer op for a result produced outside the task's process (a queue worker).
+
+    The result is numbered after those already stored, and the task is
+    finished along with its last URL.
+    """
+    seq = cursor.execute(
+        "SELECT COALESCE(MAX(seq) + 1, 0) FROM task_results WHERE task_id = ?", (task_id,)
+    ).fetchone()[0]
+    run_id = _record_result(
+        cursor, task_id, seq, values, json.dumps({"url": url, "error": error}) if error is not None else None
+    )
+    _settle_task(cursor, task_id, now)
+    return run_id
+
+
+def _finish_task(cursor, task_id, status, now):
+    cursor.execute("UPDATE tasks SET status = ?, finished_at = ? WHERE task_id = ?", (status, now, task_id))
+
+
+class SQLiteTaskStore:
+    """Task registry kept in the results database so every worker sees it.
+
+    Writes go through the shared database writer, so a task's run rows,
+    result references and progress are committed together.
+    """
+
+    # Results may be produced by another process; streams re-check this often
+    poll_interval = 1.0
+
+    def __init__(self, ttl: float = TASK_TTL_SECONDS, max_finished: int = TASK_MAX_FINISHED):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._seq = {}
+        self._lock = threading.Lock()
+        conn = database.connect()
+        for statement in TASK_TABLES:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+
+    def create(self, task_id: str, total: int) -> Future:
+        """Queue the task's row; wait for the future before telling clients the task exists"""
+        now = time.time()
+        with self._lock:
+            self._seq[task_id] = 0
+        return database.writer.submit(_create_task, task_id, total, now, now - self.ttl, self.max_finished)
+
+    def record(self, task_id: str, url: str, result: Optional[Dict], error: Optional[BaseException]) -> Future:
+        with self._lock:
+            seq = self._seq[task_id]
+            self._seq[task_id] = seq + 1
+        if error is None and result.get("cached"):
+            # Kept inline like errors, so history holds each measurement once
+            return database.writer.submit(_record_result, task_id, seq, None, json.dumps(result, default=str))
+        if error is None:
+            return database.writer.submit(_record_result, task_id, seq, run_values(result), None)
+        return database.writer.submit(
+            _record_result, task_id, seq, None, json.dumps({"url": url, "error": str(error)})
+        )
+
+    def add_total(self, task_id: str, count: int, settle: bool = False) -> Future:
+        """Grow a task whose URLs are still arriving; settle finishes it if every URL is in"""
+        return database.writer.submit(_add_total, task_id, count, settle, time.time())
+
+    def finish(self, task_id: str, status: str = "completed") -> Future:
+        with self._lock:
+            self._seq.pop(task_id, None)
+        return database.writer.submit(_finish_task, task_id, status, time.time())
+
+    def status(self, task_id: str) -> Optional[Dict]:
+        row = database.get_connection().execute(
+            "SELECT status, progress, total, finished_at FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if row is None or (row["finished_at"] is not None and row["finished_at"] < time.time() - self.ttl):
+            return None
+        return {"status": row["status"], "progress": row["progress"], "total": row["total"]}
+
+    def results(self, task_id: str, offset: int = 0) -> List[Dict]:
+        rows = database.get_connection().execute(
+            "SELECT run_id, error FROM task_results WHERE task_id = ? AND seq >= ? ORDER BY seq",
+            (task_id, offset),
+        ).fetchall()
+        return _materialize([row["run_id"] if row["run_id"] is not None else json.loads(row["error"]) for row in rows])
+
+    def counts(self) -> Dict[str, int]:
+        row = database.get_connection().execute(
+            "SELECT SUM(finished_at IS NULL), SUM(finished_at IS NOT NULL),"
+            " SUM(CASE WHEN finished_at IS NULL THEN total - progress END) FROM tasks"
+        ).fetchone()
+        return {"running": row[0] or 0, "finished": row[1] or 0, "pending_urls": row[2] or 0}
+
+
+def make_task_store(kind: str = TASK_STORE):
+    if kind == "sqlite":
+        return SQLiteTaskStore()
+    if kind == "memory":
+        return MemoryTaskStore()
+    raise ValueError(f"Unknown task store: {kind}")
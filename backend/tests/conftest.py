@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Backend modules read their settings at import: keep the default database
+# out of the working tree and make them importable from here
+os.environ.setdefault("ANALYZER_DB_PATH", os.path.join(tempfile.mkdtemp(), "results.db"))
+os.environ.setdefault("ANALYZER_JOB_RUNNER", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh results database with its own writer thread"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "results.db"))
+    # A short flush interval keeps one-off writes from waiting for company
+    writer = database.BufferedWriter(flush_interval=0.01)
+    monkeypatch.setattr(database, "writer", writer)
+    database.init_db()
+    yield database
+    writer.close()
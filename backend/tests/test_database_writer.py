@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+
+def record(url, total=100.0):
+    return {"url": url, "status_code": 200, "total": total, "ttfb": total / 2, "size_kb": 10.0}
+
+
+def count_runs(database):
+    return database.get_connection().execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+
+def test_operations_run_in_submission_order(db):
+    seen = []
+    futures = [db.writer.submit(lambda cursor, i: seen.append(i) or i, i) for i in range(1200)]
+    assert [future.result(timeout=10) for future in futures] == list(range(1200))
+    assert seen == list(range(1200))
+
+
+def test_flush_waits_for_queued_results(db):
+    futures = db.save_results([record(f"https://example.com/{i}") for i in range(50)])
+    db.flush(timeout=10)
+    assert all(future.done() for future in futures)
+    assert count_runs(db) == 50
+    # Row ids follow the order the results were queued in
+    assert [future.result() for future in futures] == sorted(future.result() for future in futures)
+
+
+def test_writes_from_many_threads_are_batched(db, monkeypatch):
+    transactions = []
+    commit = db.BufferedWriter._commit
+
+    def counting_commit(self, conn, batch):
+        transactions.append(len(batch))
+        commit(self, conn, batch)
+
+    monkeypatch.setattr(db.BufferedWriter, "_commit", counting_commit)
+    writer = db.BufferedWriter(batch_size=100, flush_interval=0.2)
+    monkeypatch.setattr(db, "writer", writer)
+
+    def save(start):
+        for i in range(start, start + 100):
+            db.save_result(record(f"https://example.com/{i}"))
+
+    threads = [threading.Thread(target=save, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush(timeout=10)
+    writer.close()
+
+    assert count_runs(db) == 400
+    # 400 inserts plus the flush and close markers, in full batches
+    assert max(transactions) <= 100
+    assert len(transactions) <= 10
+
+
+def test_clear_after_inserts_removes_them(db):
+    db.save_results([record(f"https://example.com/{i}") for i in range(20)])
+    # Queued behind the inserts, so it deletes them even though none was flushed yet
+    db.clear_history()
+    db.save_result(record("https://example.com/after")).result(timeout=10)
+    assert count_runs(db) == 1
+
+
+def test_failing_operation_is_rolled_back_alone(db):
+    def insert_then_fail(cursor):
+        db.insert_run(cursor, db.run_values(record("https://example.com/bad")))
+        raise RuntimeError("boom")
+
+    before = db.save_result(record("https://example.com/before"))
+    failing = db.writer.submit(insert_then_fail)
+    after = db.save_result(record("https://example.com/after"))
+    with pytest.raises(RuntimeError):
+        failing.result(timeout=10)
+    before.result(timeout=10)
+    after.result(timeout=10)
+    urls = {row[0] for row in db.get_connection().execute("SELECT url FROM runs")}
+    assert urls == {"https://example.com/before", "https://example.com/after"}
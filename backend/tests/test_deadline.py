@@ -0,0 +1,24 @@
+import math
+import threading
+
+from deadline import Deadline
+
+
+def test_zero_budget_is_already_expired():
+    deadline = Deadline(0)
+    assert deadline.expired
+    assert deadline.timeout(5) == 0
+
+
+def test_no_budget_never_expires():
+    deadline = Deadline(None)
+    assert not deadline.expired
+    assert deadline.remaining() == math.inf
+    assert deadline.timeout(5) == 5
+
+
+def test_cancel_expires_every_deadline_of_the_task():
+    cancel = threading.Event()
+    deadlines = [Deadline(30, cancel), Deadline(None, cancel)]
+    cancel.set()
+    assert all(deadline.expired and deadline.remaining() == 0 for deadline in deadlines)
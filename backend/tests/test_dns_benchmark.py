@@ -0,0 +1,91 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import analyzer
+
+dns_message = pytest.importorskip("dns.message")
+dns_rrset = pytest.importorskip("dns.rrset")
+
+
+class StubDNS:
+    """UDP DNS server on localhost answering every A query with 10.0.0.1"""
+
+    def __init__(self, delay=0.0, answer=True):
+        self.delay = delay
+        self.answer = answer
+        self.queries = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, addr = self._socket.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            if not self.answer:
+                continue
+            query = dns_message.from_wire(data)
+            response = dns_message.make_response(query)
+            response.answer.append(dns_rrset.from_text(query.question[0].name, 300, "IN", "A", "10.0.0.1"))
+            time.sleep(self.delay)
+            self._socket.sendto(response.to_wire(), addr)
+
+    def close(self):
+        self._socket.close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server = StubDNS(**kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_parse_resolvers():
+    assert analyzer.parse_resolvers("8.8.8.8=Google DNS, 127.0.0.1:5353=Stub,[::1]:5300,") == [
+        ("Google DNS", "8.8.8.8", 53),
+        ("Stub", "127.0.0.1", 5353),
+        ("::1", "::1", 5300),
+    ]
+
+
+def test_stub_resolver_samples(stub):
+    server = stub()
+    results = analyzer.advanced_dns_lookup(
+        "example.test", resolvers=[("Stub", "127.0.0.1", server.port)], samples=3, deadline=5
+    )
+    summary = results["Stub"]
+    assert summary["samples"] == 3
+    assert summary["errors"] == 0
+    assert summary["min"] <= summary["median"] <= summary["p95"] <= summary["max"]
+    assert server.queries == 3
+
+
+def test_silent_resolver_bounded_by_deadline(stub):
+    fast = stub()
+    silent = stub(answer=False)
+    start = time.monotonic()
+    results = analyzer.advanced_dns_lookup(
+        "example.test",
+        resolvers=[("Fast", "127.0.0.1", fast.port), ("Silent", "127.0.0.1", silent.port)],
+        samples=2,
+        deadline=0.5,
+    )
+    # Probes run concurrently: the silent one neither delays nor hides the fast one
+    assert time.monotonic() - start < 1.5
+    assert results["Fast"]["samples"] == 2
+    assert results["Silent"] is None
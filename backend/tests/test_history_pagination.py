@@ -0,0 +1,74 @@
+import pytest
+
+
+def add_runs(database, count, timestamp=None, url="https://example.com/", status_code=200):
+    """Insert runs and return their ids; timestamp overrides the insert time"""
+
+    def insert(cursor):
+        ids = []
+        for i in range(count):
+            record = {"url": url, "status_code": status_code, "total": float(i)}
+            row_id = database.insert_run(cursor, database.run_values(record))
+            if timestamp is not None:
+                cursor.execute("UPDATE runs SET timestamp = ? WHERE id = ?", (timestamp, row_id))
+            ids.append(row_id)
+        return ids
+
+    return database.writer.submit(insert).result(timeout=10)
+
+
+def walk(database, limit, cursor=None, **filters):
+    """Ids of every page from cursor on"""
+    ids = []
+    while True:
+        rows, cursor = database.query_runs(limit, cursor, **filters)
+        ids += [row["id"] for row in rows]
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_every_run_once_newest_first(db):
+    older = add_runs(db, 20, timestamp="2024-01-01 00:00:00")
+    # Runs sharing a timestamp are ordered by id, so page boundaries inside them skip nothing
+    newer = add_runs(db, 23, timestamp="2024-01-02 00:00:00")
+    assert walk(db, 7) == sorted(newer, reverse=True) + sorted(older, reverse=True)
+
+
+def test_last_page_has_no_cursor(db):
+    add_runs(db, 5)
+    rows, cursor = db.query_runs(5)
+    assert len(rows) == 5
+    assert cursor is None
+    rows, cursor = db.query_runs(4)
+    assert len(rows) == 4
+    assert cursor is not None
+
+
+def test_new_runs_do_not_shift_later_pages(db):
+    first = add_runs(db, 10, timestamp="2024-01-01 00:00:00")
+    rows, cursor = db.query_runs(4)
+    add_runs(db, 3, timestamp="2024-01-03 00:00:00")
+    rest = walk(db, 4, cursor)
+    assert [row["id"] for row in rows] + rest == sorted(first, reverse=True)
+
+
+def test_filters_apply_across_pages(db):
+    ok = add_runs(db, 9, url="https://a.example.com/x")
+    add_runs(db, 4, url="https://a.example.com/x", status_code=500)
+    other = add_runs(db, 6, url="https://b.example.com/")
+    assert walk(db, 2, host="A.example.com", status_code=200) == sorted(ok, reverse=True)
+    assert walk(db, 4, url="https://b.example.com/", since="2000-01-01T00:00:00Z") == sorted(other, reverse=True)
+    assert walk(db, 3, until="2000-01-01T00:00:00Z") == []
+
+
+def test_field_projection(db):
+    add_runs(db, 3)
+    rows, _ = db.query_runs(10, fields=["status_code"])
+    assert set(rows[0]) == {"id", "timestamp", "status_code"}
+    with pytest.raises(ValueError):
+        db.query_runs(10, fields=["password"])
+
+
+def test_invalid_cursor(db):
+    with pytest.raises(ValueError):
+        db.query_runs(10, cursor="not a cursor")
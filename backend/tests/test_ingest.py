@@ -0,0 +1,29 @@
+from ingest import BulkIngest
+
+
+def ingest_lines(ingest, lines):
+    return ingest.feed("".join(line + "\n" for line in lines).encode()) + ingest.finish()
+
+
+def test_repeats_are_counted_once():
+    ingest = BulkIngest()
+    urls = ingest_lines(ingest, ["example.com", "HTTP://Example.com:80/", '"https://example.com"', "not a url"])
+    assert urls == ["http://example.com/"]
+    assert ingest.summary() == {
+        "accepted": 1,
+        "duplicates": 2,
+        "false_positive_rate": ingest.error_rate,
+        "invalid": 1,
+        "dropped": 0,
+    }
+
+
+def test_duplicates_are_an_upper_bound():
+    # A filter this small mistakes distinct URLs for seen ones
+    ingest = BulkIngest(max_urls=1000, error_rate=0.5)
+    urls = ingest_lines(ingest, [f"https://example.com/{i}" for i in range(1000)])
+    summary = ingest.summary()
+    assert summary["duplicates"] > 0
+    assert summary["accepted"] + summary["duplicates"] == 1000
+    assert len(urls) == summary["accepted"]
+    assert summary["false_positive_rate"] == 0.5
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from jobs import JOB_RETRY_DELAY, JobQueue, JobRunner, job_options
+
+
+@pytest.fixture
+def queue(db):
+    return JobQueue(max_attempts=2)
+
+
+def job_row(database, job_id):
+    return dict(database.get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def set_job(database, job_id, **columns):
+    """Move a job's lease or retry time, as if the clock had advanced"""
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    database.writer.submit(
+        lambda cursor: cursor.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+    ).result(timeout=10)
+
+
+def result(url):
+    return {"url": url, "status_code": 200, "total": 50.0}
+
+
+def test_lease_is_exclusive_until_it_expires(db, queue):
+    queue.enqueue(["https://example.com/"], job_options(url_budget=5))
+    (job,) = queue.poll("a", 10)[2]
+    assert job["attempts"] == 1
+    assert queue.poll("b", 10)[2] == []
+
+    # Owner a went away without finishing: b takes the job over
+    set_job(db, job["id"], lease_expires=time.time() - 1)
+    (retried,) = queue.poll("b", 10)[2]
+    assert retried["id"] == job["id"]
+    assert retried["attempts"] == 2
+
+    # a's late result loses; b's is the one recorded
+    assert queue.complete(job, "a", result(job["url"])).result(timeout=10) is None
+    run_id = queue.complete(retried, "b", result(job["url"])).result(timeout=10)
+    row = job_row(db, job["id"])
+    assert row["status"] == "done"
+    assert row["run_id"] == run_id
+    assert db.get_connection().execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 1
+
+
+def test_failed_job_is_retried_with_backoff(db, queue):
+    queue.enqueue(["https://example.com/"], job_options())
+    (job,) = queue.poll("a", 10)[2]
+    before = time.time()
+    assert queue.fail(job, "a", "timed out").result(timeout=10) == "retry"
+    row = job_row(db, job["id"])
+    assert row["status"] == "queued"
+    assert row["error"] == "timed out"
+    assert row["run_at"] >= before + JOB_RETRY_DELAY
+    # Not runnable again until the backoff has passed
+    assert queue.poll("a", 10)[2] == []
+
+    set_job(db, job["id"], run_at=time.time() - 1)
+    (again,) = queue.poll("a", 10)[2]
+    assert again["attempts"] == 2
+    assert queue.fail(again, "a", "timed out").result(timeout=10) == "failed"
+    row = job_row(db, job["id"])
+    assert row["status"] == "failed"
+    assert row["finished_at"] is not None
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(db, queue):
+    queue.enqueue(["https://example.com/"], job_options())
+    (job,) = queue.poll("a", 10)[2]
+    set_job(db, job["id"], lease_expires=time.time() - 1)
+    (job,) = queue.poll("b", 10)[2]
+    assert job["attempts"] == 2
+
+    set_job(db, job["id"], lease_expires=time.time() - 1)
+    assert queue.poll("c", 10)[2] == []
+    row = job_row(db, job["id"])
+    assert row["status"] == "failed"
+    assert row["error"] == "lease expired"
+    assert queue.counts()["failed"] == 1
+
+
+def test_failed_tick_is_logged_and_runner_keeps_going(db, queue, monkeypatch, caplog):
+    runner = JobRunner(queue, workers=1, poll_interval=0.01)
+    ticks = []
+
+    def failing_poll(owner, idle):
+        ticks.append(owner)
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(queue, "poll", failing_poll)
+    with caplog.at_level("ERROR", logger="jobs"):
+        runner.start()
+        deadline = time.monotonic() + 5
+        while len(ticks) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        runner.stop(timeout=5)
+    assert len(ticks) >= 2
+    assert "Job runner tick failed" in caplog.text
+    assert "database is locked" in caplog.text
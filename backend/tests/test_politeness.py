@@ -0,0 +1,11 @@
+from politeness import PolitenessScheduler, parse_rate_overrides
+
+
+def test_rate_overrides_skip_malformed_and_non_positive():
+    assert parse_rate_overrides("A.com=0.5, b.com=0,c.com=-1,d.com=fast,e.com") == {"a.com": 0.5}
+
+
+def test_host_with_rejected_override_uses_default_rate():
+    scheduler = PolitenessScheduler(per_host=1, rate=100, burst=1, overrides=parse_rate_overrides("b.com=0"))
+    scheduler.acquire("b.com", timeout=1)
+    scheduler.release("b.com")
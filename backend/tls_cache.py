@@ -0,0 +1,109 @@
+import hashlib
+import os
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+TLS_CACHE_SIZE = int(os.environ.get("ANALYZER_TLS_CACHE_SIZE", "10000"))
+# A cached result is re-probed after this many seconds even if its certificate is unchanged
+TLS_CACHE_REFRESH = int(os.environ.get("ANALYZER_TLS_CACHE_REFRESH", str(6 * 3600)))
+# Timings in a check_ssl_security result; measured on every run, never cached
+TIMING_KEYS = frozenset(("tls_resumption",))
+
+
+def cert_fingerprint(der: Optional[bytes]) -> Optional[str]:
+    """SHA-256 of a DER certificate"""
+    return hashlib.sha256(der).hexdigest() if der else None
+
+
+def pem_fingerprint(pem: Optional[str]) -> Optional[str]:
+    """SHA-256 of a PEM certificate, as reported by libcurl's CERTINFO"""
+    try:
+        return cert_fingerprint(ssl.PEM_cert_to_DER_cert(pem.strip()))
+    except (AttributeError, ValueError):
+        return None
+
+
+def not_after(cert: Optional[Dict]) -> Optional[float]:
+    """Expiry of a getpeercert() certificate as a Unix time"""
+    try:
+        return ssl.cert_time_to_seconds(cert["notAfter"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TLSCache:
+    """(host, port, certificate fingerprint) -> scored check_ssl_security result.
+
+    An entry lives until its certificate expires or TLS_CACHE_REFRESH has
+    passed, whichever comes first. Callers that have already seen the
+    server's certificate (from the main fetch) look it up by fingerprint;
+    without one, the last certificate seen for the host and port is used.
+    Only certificate and protocol facts are kept: TIMING_KEYS are dropped
+    on store.
+    """
+
+    def __init__(self, max_size: int = TLS_CACHE_SIZE, refresh: int = TLS_CACHE_REFRESH):
+        self.max_size = max_size
+        self.refresh = refresh
+        self._entries = OrderedDict()  # (host, port, fingerprint) -> (result, expires_at)
+        self._latest = {}  # (host, port) -> fingerprint
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, port: int, fingerprint: Optional[str] = None) -> Optional[Dict]:
+        host = (host or "").lower()
+        with self._lock:
+            if fingerprint is None:
+                fingerprint = self._latest.get((host, port))
+            key = (host, port, fingerprint)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def store(self, host: str, port: int, fingerprint: Optional[str], result: Dict, expires: Optional[float] = None):
+        """Cache a result for the certificate; expires is the certificate's notAfter"""
+        if not fingerprint:
+            return
+        host = (host or "").lower()
+        expires = min(expires or float("inf"), time.time() + self.refresh)
+        with self._lock:
+            key = (host, port, fingerprint)
+            self._entries[key] = ({k: v for k, v in result.items() if k not in TIMING_KEYS}, expires)
+            self._entries.move_to_end(key)
+            self._latest[(host, port)] = fingerprint
+            while len(self._entries) > self.max_size:
+                (old_host, old_port, old_fingerprint), _ = self._entries.popitem(last=False)
+                if self._latest.get((old_host, old_port)) == old_fingerprint:
+                    del self._latest[(old_host, old_port)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "refresh_seconds": self.refresh,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+tls_cache = TLSCache()
@@ -0,0 +1,170 @@
+"""Standalone analysis worker serving the SQLite job queue.
+
+    python worker.py [--processes N] [--threads N]
+
+Run one per machine next to the API (started with ANALYZER_JOB_RUNNER=0 so
+it only enqueues). The worker dispatches schedules, leases jobs and hands
+them to a process pool, so parsing and scoring never compete with API
+requests for the GIL. Results are written to the shared database.
+"""
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Dict, List
+
+import database
+from database import init_db
+from geo_cache import geo_cache
+from jobs import JOB_POLL_INTERVAL, JobQueue, make_owner, run_job
+from resource_cache import resource_cache
+
+# Analysis processes (one per core) and jobs each of them runs at once; a job
+# mostly waits on the network, so a process keeps several in flight
+WORKER_PROCESSES = int(os.environ.get("ANALYZER_WORKER_PROCESSES", str(os.cpu_count() or 1)))
+WORKER_THREADS = int(os.environ.get("ANALYZER_WORKER_THREADS", "8"))
+
+logger = logging.getLogger(__name__)
+
+_threads = None  # per pool process
+
+
+def _init_process(threads: int, db_path: str):
+    global _threads
+    # The parent handles Ctrl-C and lets running chunks finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Pool processes are spawned and share no connections with the parent;
+    # this is where they open the database, for the caches jobs read
+    database.DB_PATH = db_path
+    resource_cache.warm()
+    geo_cache.warm()
+    _threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+
+
+def _attempt(job: Dict):
+    try:
+        return job["id"], run_job(job), None
+    except Exception as e:
+        return job["id"], None, str(e)
+
+
+def run_chunk(jobs: List[Dict]):
+    """Analyze a chunk of jobs concurrently inside a pool process: [(job id, result, error)]"""
+    return list(_threads.map(_attempt, jobs))
+
+
+class ProcessWorker:
+    """Leases jobs for a process pool and records what comes back.
+
+    Each idle pool process gets one chunk of up to `threads` jobs per poll;
+    outcomes are written by this (parent) process through the database
+    writer. A crashed pool process fails its chunk, whose jobs are retried.
+    """
+
+    def __init__(self, queue: JobQueue, processes: int = WORKER_PROCESSES, threads: int = WORKER_THREADS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.processes = max(1, processes)
+        self.threads = max(1, threads)
+        self.poll_interval = poll_interval
+        self.owner = make_owner()
+        self._pool = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _new_pool(self):
+        # Forking would copy the writer thread's locks and open SQLite handles
+        # mid-use; spawned processes start clean
+        return ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process,
+            initargs=(self.threads, database.DB_PATH),
+        )
+
+    def run(self):
+        """Serve the queue until stop() (or SIGINT/SIGTERM)"""
+        self._pool = self._new_pool()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.tick()
+                except BrokenProcessPool:
+                    logger.warning("Worker process died, starting a new pool")
+                    self._pool = self._new_pool()
+                except Exception:
+                    logger.exception("Worker tick failed")
+                self._stop.wait(self.poll_interval)
+        finally:
+            self._pool.shutdown(wait=True)
+            database.writer.flush()
+
+    def stop(self, *args):
+        self._stop.set()
+
+    def tick(self):
+        with self._lock:
+            idle = self.processes - self._busy
+        # Poll even when busy: dispatching schedules must not stall
+        queued, skipped, jobs = self.queue.poll(self.owner, max(0, idle) * self.threads)
+        if not jobs:
+            return
+        size = math.ceil(len(jobs) / idle)
+        for start in range(0, len(jobs), size):
+            chunk = jobs[start:start + size]
+            with self._lock:
+                self._busy += 1
+            try:
+                future = self._pool.submit(run_chunk, chunk)
+            except BrokenProcessPool as e:
+                self._record(chunk, [(job["id"], None, f"Worker process failed: {e}") for job in chunk])
+                raise
+            future.add_done_callback(partial(self._report, chunk))
+
+    def _report(self, chunk: List[Dict], future):
+        try:
+            outcomes = future.result()
+        except Exception as e:
+            outcomes = [(job["id"], None, f"Worker process failed: {e}") for job in chunk]
+        self._record(chunk, outcomes)
+
+    def _record(self, chunk: List[Dict], outcomes):
+        jobs = {job["id"]: job for job in chunk}
+        for job_id, result, error in outcomes:
+            if error is None:
+                self.queue.complete(jobs[job_id], self.owner, result)
+            else:
+                self.queue.fail(jobs[job_id], self.owner, error)
+        with self._lock:
+            self._busy -= 1
+            self.completed += sum(1 for _, _, error in outcomes if error is None)
+            self.failed += sum(1 for _, _, error in outcomes if error is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze queued and scheduled URLs in a process pool")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    init_db()
+    worker = ProcessWorker(JobQueue(), args.processes, args.threads, args.poll_interval)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    logger.info("Worker %s: %d processes x %d jobs", worker.owner, worker.processes, worker.threads)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import React, { useState } from "react";
-import { Container, Box, Typography, CircularProgress } from "@mui/material";
+import { Container, Box, Typography, CircularProgress, Alert } from "@mui/material";
 import URLInput from "./components/URLInput";
 import ResultsTabs from "./components/ResultsTabs";
-import { analyzeWebsites, getAnalysisStatus } from "./services/api";
+import { analyzeWebsites, getAnalysisStatus, streamAnalysis } from "./services/api";
 import "./App.css";
 
 const App = () => {
@@ -10,27 +10,41 @@ const App = () => {
   const [loading, setLoading] = useState(false);
   const [progress, setProgress] = useState(0);
   const [total, setTotal] = useState(0);
+  const [error, setError] = useState(null);
 
   const handleAnalyze = async (urls, options) => {
     setLoading(true);
     setResults([]);
     setProgress(0);
+    setError(null);
 
     try {
       const { task_id } = await analyzeWebsites(urls, options);
-      const poll = setInterval(async () => {
-        const status = await getAnalysisStatus(task_id);
-        setProgress(status.progress);
-        setTotal(status.total);
-
-        if (status.status === "completed") {
-          clearInterval(poll);
-          setResults(status.results);
+      setTotal(urls.length);
+      const close = streamAnalysis(task_id, {
+        onResult: (result) => {
+          setProgress((count) => count + 1);
+          setResults((prev) => [...prev, result]);
+        },
+        onDone: () => setLoading(false),
+        onError: async (event, closed) => {
+          if (!closed) {
+            // EventSource is retrying; keep waiting while the task still exists
+            try {
+              await getAnalysisStatus(task_id);
+              return;
+            } catch (err) {
+              console.error("Error:", err);
+            }
+          }
+          close();
+          setError("Lost track of the analysis. Please run it again.");
           setLoading(false);
-        }
-      }, 1000);
+        },
+      });
     } catch (err) {
       console.error("Error:", err);
+      setError("Could not start the analysis.");
       setLoading(false);
     }
   };
@@ -78,6 +92,12 @@ const App = () => {
 
           <URLInput onAnalyze={handleAnalyze} loading={loading} />
 
+          {error && (
+            <Alert severity="error" sx={{ my: 3 }}>
+              {error}
+            </Alert>
+          )}
+
           {loading && (
             <Box
               className="loading-pulse"
@@ -22,4 +22,19 @@ export const getAnalysisStatus = async (taskId) => {
   return res.data;
 };
 
+// Subscribe to a task's Server-Sent Events stream. EventSource reconnects on
+// its own and resumes via Last-Event-ID; onError(event, closed) is told
+// whether it gave up (closed is true, e.g. the task no longer exists).
+// Returns a function that closes the stream.
+export const streamAnalysis = (taskId, { onResult, onDone, onError } = {}) => {
+  const source = new EventSource(`${API_URL}/api/analysis/${taskId}/events`);
+  source.addEventListener("result", (e) => onResult?.(JSON.parse(e.data)));
+  source.addEventListener("done", (e) => {
+    source.close();
+    onDone?.(JSON.parse(e.data));
+  });
+  source.onerror = (e) => onError?.(e, source.readyState === EventSource.CLOSED);
+  return () => source.close();
+};
+
 export default api;